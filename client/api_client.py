@@ -0,0 +1,420 @@
+# client/api_client.py
+import json
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from client.config import Config
+
+FINAL_STATES = ("SUCCESS", "FAILURE", "REVOKED", "PARTIAL_FAILURE", "TIMEOUT")
+RETRY_STATUSES = (502, 503, 504)
+# Only requests that are safe to repeat are retried; submitting a job twice would run it twice
+RETRY_METHODS = frozenset({"GET"})
+
+
+def _prompt_payload(prompt, models=None, model_name=None, model_index=0, stream=False, cache=True,
+                    route=None, priority=None) -> dict:
+    payload = {"prompt": prompt, "model_index": model_index, "stream": stream, "cache": cache}
+    if priority:
+        payload["priority"] = priority
+    if route:
+        payload["route"] = route
+    elif models:
+        payload["models"] = list(models)
+    elif model_name:
+        payload["model_name"] = model_name
+    return payload
+
+
+def _history_params(limit=50, model_name=None, before_id=None, since=None, until=None) -> dict:
+    params = {"limit": limit, "model_name": model_name, "before_id": before_id, "since": since, "until": until}
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def _usage_params(since=None, until=None, model_name=None, granularity="hour") -> dict:
+    params = {"since": since, "until": until, "model_name": model_name, "granularity": granularity}
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def _batch_fields(model=None, chunk_size=None, concurrency=None, offset=0, cache=True) -> dict:
+    fields = {"offset": offset, "cache": cache}
+    if model:
+        fields["model"] = model
+    if chunk_size:
+        fields["chunk_size"] = chunk_size
+    if concurrency:
+        fields["concurrency"] = concurrency
+    return fields
+
+
+def _parse_sse(lines):
+    """Turn Server-Sent Event lines into (event_id, event, data) tuples."""
+    event_id, event, data = None, "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event_id, event, json.loads("\n".join(data))
+            event, data = "message", []
+            continue
+        if line.startswith(":"):
+            continue  # keep-alive comment
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "id":
+            event_id = value
+        elif field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+
+
+class ApiClient:
+    """Blocking client for the LLM server API.
+
+    All calls share one keep-alive requests.Session with a bounded connection
+    pool, (connect, read) timeouts and automatic retries of idempotent GETs on
+    connection errors and 502/503/504. Safe to share between threads.
+    """
+
+    def __init__(self, base_url: str = None, token: str = None, timeout=None,
+                 retries: int = None, pool_size: int = None):
+        self.base_url = (base_url or f"{Config.SERVER_URL}{Config.API_PREFIX}").rstrip("/")
+        timeout = timeout or (Config.CONNECT_TIMEOUT, Config.READ_TIMEOUT)
+        self.timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        retries = Config.HTTP_RETRIES if retries is None else retries
+        pool_size = pool_size or Config.HTTP_POOL_SIZE
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def request(self, method: str, path: str, timeout=None, **kwargs):
+        resp = self.session.request(method, self.url(path), timeout=timeout or self.timeout, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------------------
+    # Jobs
+    # ---------------------------
+    def submit(self, prompt: str, models=None, model_name: str = None, model_index: int = 0,
+               stream: bool = False, cache: bool = True, route: str = None, priority: str = None) -> dict:
+        """Queue a prompt; returns {"job_id", "task_ids", "status"}.
+
+        With `route` (a provider group or tag) the server picks the best model of that group.
+        `priority` selects the lane: "interactive", "default" or "bulk".
+        """
+        payload = _prompt_payload(prompt, models, model_name, model_index, stream, cache, route, priority)
+        return self.request("POST", "/job/prompt", json=payload)
+
+    def submit_conversation(self, prompt: str, model_index: int = 0, priority: str = None) -> dict:
+        payload = {"prompt": prompt, "model_index": model_index}
+        if priority:
+            payload["priority"] = priority
+        return self.request("POST", "/job/conversation", json=payload)
+
+    def job(self, task_id: str) -> dict:
+        """Current status of a task or fan-out job."""
+        return self.request("GET", f"/job/{task_id}")
+
+    def wait(self, task_ids, known: dict = None, timeout: float = 20.0) -> dict:
+        """One long-poll: the tasks whose status differs from `known` (empty on timeout)."""
+        data = self.request(
+            "POST", "/job/wait",
+            json={"task_ids": list(task_ids), "known": known or {}, "timeout": timeout},
+            timeout=(self.timeout[0], timeout + self.timeout[1])
+        )
+        return data.get("tasks", {})
+
+    def wait_many(self, task_ids, timeout: float = 300, poll_timeout: float = 20.0) -> dict:
+        """Block until every task is final or `timeout` passes; returns {task_id: job} for finished ones."""
+        deadline = time.monotonic() + timeout
+        known, finished = {}, {}
+        pending = list(task_ids)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for task_id, job in self.wait(pending, known, min(poll_timeout, remaining)).items():
+                if job.get("status") in FINAL_STATES:
+                    finished[task_id] = job
+                else:
+                    known[task_id] = job.get("status")
+            pending = [t for t in pending if t not in finished]
+        return finished
+
+    def result(self, job_id: str, timeout: float = 300) -> dict:
+        """Wait for a task or fan-out job and return its final job dict (status "TIMEOUT" if unfinished)."""
+        job = self.job(job_id)
+        if job.get("status") in FINAL_STATES:
+            return job
+        if "tasks" in job:
+            # Fan-out jobs have no result key of their own: wait on the children, then re-read
+            self.wait_many([t["id"] for t in job["tasks"]], timeout)
+            return self.job(job_id)
+        job = self.wait_many([job_id], timeout).get(job_id)
+        return job or {"status": "TIMEOUT", "result": None}
+
+    def stream(self, task_id: str, last_event_id: str = None):
+        """Yield (event_id, event, data) from a streaming job until its "end" event."""
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        with self.session.get(self.url(f"/job/{task_id}/stream"), headers=headers,
+                              stream=True, timeout=self.timeout) as resp:
+            resp.raise_for_status()
+            for item in _parse_sse(resp.iter_lines(decode_unicode=True)):
+                yield item
+                if item[1] == "end":
+                    return
+
+    # ---------------------------
+    # Batches
+    # ---------------------------
+    def submit_batch(self, file: str = None, path: str = None, model: str = None, chunk_size: int = None,
+                     concurrency: int = None, offset: int = 0, cache: bool = True) -> dict:
+        """Start a batch over a JSONL of {"prompt", "model"} rows: a local `file` to upload,
+        or a `path` on the server (under its BATCH_INPUT_DIR). Returns the batch's progress dict.
+        """
+        fields = _batch_fields(model, chunk_size, concurrency, offset, cache)
+        if file:
+            with open(file, "rb") as f:
+                return self.request("POST", "/job/batch", data=fields, files={"file": f})
+        return self.request("POST", "/job/batch", json={"path": path, **fields})
+
+    def resume_batch(self, batch_id: str, retry_failed: bool = False) -> dict:
+        """Re-queue the rows of a batch that are not done yet (and the failed ones with `retry_failed`)."""
+        return self.request("POST", "/job/batch", json={"resume": batch_id, "retry_failed": retry_failed})
+
+    def batch(self, batch_id: str) -> dict:
+        """Progress of a batch: "total", "done", "failed", "pending" and "status"."""
+        return self.request("GET", f"/job/batch/{batch_id}")
+
+    def batch_output(self, batch_id: str):
+        """Yield the batch's finished rows ({"row", "model", "result"} or {"row", "error"})."""
+        with self.session.get(self.url(f"/job/batch/{batch_id}/output"), stream=True, timeout=self.timeout) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines(decode_unicode=True):
+                if line:
+                    yield json.loads(line)
+
+    # ---------------------------
+    # Models
+    # ---------------------------
+    def list_models(self) -> list:
+        return self.request("GET", "/model/list").get("models", [])
+
+    def grouped_models(self) -> dict:
+        return self.request("GET", "/model/grouped")
+
+    def load_models(self, path: str) -> dict:
+        return self.request("POST", "/model/load", json={"path": path})
+
+    def upload_models(self, data: dict) -> dict:
+        return self.request("POST", "/model/upload", json=data)
+
+    def sync_models(self, data: dict) -> dict:
+        return self.request("POST", "/model/sync", json=data)
+
+    def clear_models(self) -> dict:
+        return self.request("POST", "/model/clear")
+
+    # ---------------------------
+    # Misc
+    # ---------------------------
+    def history(self, limit: int = 50, model_name: str = None, before_id: int = None,
+                since: str = None, until: str = None) -> dict:
+        """One page of history previews: {"history": [...], "next_before_id"}.
+
+        Pass next_before_id back as `before_id` for the next page (None on the last one).
+        `since` / `until` are ISO 8601 times.
+        """
+        return self.request("GET", "/history", params=_history_params(limit, model_name, before_id, since, until))
+
+    def history_record(self, record_id: int) -> dict:
+        """Full prompt and response of one history entry."""
+        return self.request("GET", f"/history/{record_id}")
+
+    def search_history(self, q: str, limit: int = 20, offset: int = 0, model_name: str = None,
+                       since: str = None, until: str = None) -> dict:
+        """Full-text search: {"results": [... with "score"], "next_offset"}, most relevant first."""
+        params = _history_params(limit, model_name, None, since, until)
+        return self.request("GET", "/history/search", params={"q": q, "offset": offset, **params})
+
+    def usage(self, since: str = None, until: str = None, model_name: str = None,
+              granularity: str = "hour") -> dict:
+        """Requests, tokens, errors and latency per bucket ("buckets") and per model ("totals").
+
+        `since` / `until` are ISO 8601 times (default: the last 7 days); granularity is "hour" or "day".
+        """
+        return self.request("GET", "/usage", params=_usage_params(since, until, model_name, granularity))
+
+    def queue_depth(self) -> dict:
+        """Messages waiting per priority lane."""
+        return self.request("GET", "/queue/depth").get("lanes", {})
+
+    def version(self) -> str:
+        return self.request("GET", "/version").get("version")
+
+
+class AsyncApiClient:
+    """asyncio counterpart of ApiClient built on one pooled httpx.AsyncClient.
+
+    Connection failures are retried by the transport; requests that reached
+    the server are not, since job submission is not idempotent.
+    """
+
+    def __init__(self, base_url: str = None, token: str = None, timeout=None,
+                 retries: int = None, pool_size: int = None):
+        self.base_url = (base_url or f"{Config.SERVER_URL}{Config.API_PREFIX}").rstrip("/")
+        timeout = timeout or (Config.CONNECT_TIMEOUT, Config.READ_TIMEOUT)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.read_timeout = read
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=Config.HTTP_RETRIES if retries is None else retries),
+            headers={"Authorization": f"Bearer {token}"} if token else None
+        )
+
+    async def request(self, method: str, path: str, **kwargs):
+        resp = await self.client.request(method, path, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def submit(self, prompt: str, models=None, model_name: str = None, model_index: int = 0,
+                     stream: bool = False, cache: bool = True, route: str = None, priority: str = None) -> dict:
+        payload = _prompt_payload(prompt, models, model_name, model_index, stream, cache, route, priority)
+        return await self.request("POST", "/job/prompt", json=payload)
+
+    async def submit_conversation(self, prompt: str, model_index: int = 0, priority: str = None) -> dict:
+        payload = {"prompt": prompt, "model_index": model_index}
+        if priority:
+            payload["priority"] = priority
+        return await self.request("POST", "/job/conversation", json=payload)
+
+    async def job(self, task_id: str) -> dict:
+        return await self.request("GET", f"/job/{task_id}")
+
+    async def wait(self, task_ids, known: dict = None, timeout: float = 20.0) -> dict:
+        data = await self.request(
+            "POST", "/job/wait",
+            json={"task_ids": list(task_ids), "known": known or {}, "timeout": timeout},
+            timeout=timeout + self.read_timeout
+        )
+        return data.get("tasks", {})
+
+    async def wait_many(self, task_ids, timeout: float = 300, poll_timeout: float = 20.0) -> dict:
+        deadline = time.monotonic() + timeout
+        known, finished = {}, {}
+        pending = list(task_ids)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for task_id, job in (await self.wait(pending, known, min(poll_timeout, remaining))).items():
+                if job.get("status") in FINAL_STATES:
+                    finished[task_id] = job
+                else:
+                    known[task_id] = job.get("status")
+            pending = [t for t in pending if t not in finished]
+        return finished
+
+    async def result(self, job_id: str, timeout: float = 300) -> dict:
+        job = await self.job(job_id)
+        if job.get("status") in FINAL_STATES:
+            return job
+        if "tasks" in job:
+            await self.wait_many([t["id"] for t in job["tasks"]], timeout)
+            return await self.job(job_id)
+        job = (await self.wait_many([job_id], timeout)).get(job_id)
+        return job or {"status": "TIMEOUT", "result": None}
+
+    async def stream(self, task_id: str, last_event_id: str = None):
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        async with self.client.stream("GET", f"/job/{task_id}/stream", headers=headers) as resp:
+            resp.raise_for_status()
+            lines = []
+            async for line in resp.aiter_lines():
+                lines.append(line)
+                if line:
+                    continue
+                for item in _parse_sse(lines):
+                    yield item
+                    if item[1] == "end":
+                        return
+                lines = []
+
+    async def submit_batch(self, file: str = None, path: str = None, model: str = None, chunk_size: int = None,
+                           concurrency: int = None, offset: int = 0, cache: bool = True) -> dict:
+        fields = _batch_fields(model, chunk_size, concurrency, offset, cache)
+        if file:
+            with open(file, "rb") as f:
+                return await self.request("POST", "/job/batch", data=fields, files={"file": f})
+        return await self.request("POST", "/job/batch", json={"path": path, **fields})
+
+    async def resume_batch(self, batch_id: str, retry_failed: bool = False) -> dict:
+        return await self.request("POST", "/job/batch", json={"resume": batch_id, "retry_failed": retry_failed})
+
+    async def batch(self, batch_id: str) -> dict:
+        return await self.request("GET", f"/job/batch/{batch_id}")
+
+    async def list_models(self) -> list:
+        return (await self.request("GET", "/model/list")).get("models", [])
+
+    async def grouped_models(self) -> dict:
+        return await self.request("GET", "/model/grouped")
+
+    async def history(self, limit: int = 50, model_name: str = None, before_id: int = None,
+                      since: str = None, until: str = None) -> dict:
+        return await self.request("GET", "/history",
+                                  params=_history_params(limit, model_name, before_id, since, until))
+
+    async def history_record(self, record_id: int) -> dict:
+        return await self.request("GET", f"/history/{record_id}")
+
+    async def search_history(self, q: str, limit: int = 20, offset: int = 0, model_name: str = None,
+                             since: str = None, until: str = None) -> dict:
+        params = _history_params(limit, model_name, None, since, until)
+        return await self.request("GET", "/history/search", params={"q": q, "offset": offset, **params})
+
+    async def usage(self, since: str = None, until: str = None, model_name: str = None,
+                    granularity: str = "hour") -> dict:
+        return await self.request("GET", "/usage", params=_usage_params(since, until, model_name, granularity))
+
+    async def version(self) -> str:
+        return (await self.request("GET", "/version")).get("version")
+
+
+api_client = ApiClient()
@@ -1,10 +1,6 @@
 import requests
 import click
-from client.config import SERVER_URL, API_PREFIX
-
-def api_url(path: str) -> str:
-    """Build the full API URL."""
-    return f"{SERVER_URL}{API_PREFIX}{path}"
+from client.api_client import api_client
 
 
 @click.group()
@@ -25,13 +21,28 @@ def job():
 @click.option("--prompt", required=True, help="The input text prompt to send to the LLM.")
 @click.option("--model-index", default=0, help="Index of the model to use.")
 @click.option("--stream", is_flag=True, default=False, help="Enable streaming output.")
-def submit(prompt, model_index, stream):
-    payload = {"prompt": prompt, "model_index": model_index, "stream": stream}
+@click.option("--route", default=None, help="Provider group or tag; the server picks its best model.")
+@click.option("--priority", type=click.Choice(["interactive", "default", "bulk"]), default=None,
+              help="Queue lane for the job.")
+@click.option("--wait", is_flag=True, default=False, help="Wait for the job and print its result.")
+def submit(prompt, model_index, stream, route, priority, wait):
     try:
-        resp = requests.post(api_url("/prompt"), json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        click.echo(f"[INFO]: Job submitted. ID: {data.get('task_id')}")
+        data = api_client.submit(prompt, model_index=model_index, stream=stream, route=route, priority=priority)
+        job_id = data.get("job_id")
+        click.echo(f"[INFO]: Job submitted. ID: {job_id}")
+        if data.get("trace_id"):
+            click.echo(f"[INFO]: Trace ID: {data['trace_id']}")
+        if stream:
+            for _, event, text in api_client.stream(job_id):
+                if event == "chunk":
+                    click.echo(text, nl=False)
+                elif event == "error":
+                    click.echo(f"\n[ERROR]: {text}")
+            click.echo()
+        elif wait:
+            job = api_client.result(job_id)
+            click.echo(f"[RESULT]: {job.get('result')}" if job.get("status") == "SUCCESS"
+                       else f"[INFO]: Job {job_id} → Status: {job.get('status')}")
     except requests.RequestException as e:
         click.echo(f"[ERROR]: Failed to submit job → {e}")
 
@@ -40,9 +51,7 @@ def submit(prompt, model_index, stream):
 @click.argument("task_id")
 def status(task_id):
     try:
-        resp = requests.get(api_url(f"/job/{task_id}"))
-        resp.raise_for_status()
-        data = resp.json()
+        data = api_client.job(task_id)
         click.echo(f"[INFO]: Job {task_id} → Status: {data.get('status')}")
     except requests.RequestException as e:
         click.echo(f"[ERROR]: Failed to fetch job status → {e}")
@@ -52,9 +61,7 @@ def status(task_id):
 @click.argument("task_id")
 def result(task_id):
     try:
-        resp = requests.get(api_url(f"/job/{task_id}"))
-        resp.raise_for_status()
-        data = resp.json()
+        data = api_client.job(task_id)
         result = data.get("result")
         if result:
             click.echo(f"[RESULT]: {result}")
@@ -64,6 +71,54 @@ def result(task_id):
         click.echo(f"[ERROR]: Failed to fetch job result → {e}")
 
 
+@job.command("queues", help="Show how many jobs wait in each priority lane.")
+def queues():
+    try:
+        for lane, info in api_client.queue_depth().items():
+            click.echo(f"[INFO]: {lane}: {info.get('depth')} waiting")
+    except requests.RequestException as e:
+        click.echo(f"[ERROR]: Failed to fetch queue depth → {e}")
+
+
+@job.command("batch", help="Run every row of a JSONL file of {\"prompt\", \"model\"} objects as one batch.")
+@click.argument("file")
+@click.option("--server-path", is_flag=True, default=False, help="FILE is a path on the server instead of an upload.")
+@click.option("--model", default=None, help="Model for rows that do not name one.")
+@click.option("--chunk-size", default=None, type=int, help="Rows a worker claims at a time.")
+@click.option("--concurrency", default=None, type=int, help="Chunks processed in parallel.")
+@click.option("--offset", default=0, help="Skip the first OFFSET rows.")
+def batch(file, server_path, model, chunk_size, concurrency, offset):
+    try:
+        kwargs = {"path": file} if server_path else {"file": file}
+        data = api_client.submit_batch(model=model, chunk_size=chunk_size, concurrency=concurrency,
+                                       offset=offset, **kwargs)
+        click.echo(f"[INFO]: Batch {data.get('id')} queued: {data.get('pending')} rows → {data.get('output')}")
+    except (OSError, requests.RequestException) as e:
+        click.echo(f"[ERROR]: Failed to submit batch → {e}")
+
+
+@job.command("batch-status", help="Show the progress of a batch.")
+@click.argument("batch_id")
+def batch_status(batch_id):
+    try:
+        data = api_client.batch(batch_id)
+        click.echo(f"[INFO]: Batch {batch_id} → {data.get('status')}: {data.get('done')} done, "
+                   f"{data.get('failed')} failed, {data.get('pending')} pending of {data.get('total')}")
+    except requests.RequestException as e:
+        click.echo(f"[ERROR]: Failed to fetch batch status → {e}")
+
+
+@job.command("batch-resume", help="Resume a batch, skipping rows that are already done.")
+@click.argument("batch_id")
+@click.option("--retry-failed", is_flag=True, default=False, help="Also re-run rows that failed.")
+def batch_resume(batch_id, retry_failed):
+    try:
+        data = api_client.resume_batch(batch_id, retry_failed)
+        click.echo(f"[INFO]: Batch {batch_id} resumed: {data.get('pending')} rows pending")
+    except requests.RequestException as e:
+        click.echo(f"[ERROR]: Failed to resume batch → {e}")
+
+
 # ---------------------------
 # Model commands
 # ---------------------------
@@ -75,11 +130,8 @@ def model():
 @model.command("load", help="Load models from a JSON file.")
 @click.option("--path", required=True, help="Path to the JSON file with models.")
 def load(path):
-    payload = {"path": path}
     try:
-        resp = requests.post(api_url("/model/load"), json=payload)
-        resp.raise_for_status()
-        data = resp.json()
+        data = api_client.load_models(path)
         click.echo(f"[INFO]: {data.get('message')}")
     except requests.RequestException as e:
         click.echo(f"[ERROR]: Failed to load models → {e}")
@@ -88,11 +140,9 @@ def load(path):
 @model.command("list", help="List all available models.")
 def list_models():
     try:
-        resp = requests.get(api_url("/model/list"))
-        resp.raise_for_status()
-        data = resp.json()
+        models = api_client.list_models()
         click.echo("[INFO]: Available models:")
-        for m in data.get("models", []):
+        for m in models:
             click.echo(f" - {m}")
     except requests.RequestException as e:
         click.echo(f"[ERROR]: Failed to list models → {e}")
@@ -101,9 +151,7 @@ def list_models():
 @model.command("grouped", help="List models grouped by category.")
 def grouped_models():
     try:
-        resp = requests.get(api_url("/model/grouped"))
-        resp.raise_for_status()
-        data = resp.json()
+        data = api_client.grouped_models()
         click.echo("[INFO]: Models grouped by category:")
         for group, models in data.items():
             click.echo(f"{group}:")
@@ -119,31 +167,81 @@ def grouped_models():
 @cli.command("history", help="Fetch past prompts and results.")
 @click.option("--limit", default=50, help="Number of history records to fetch.")
 @click.option("--model-name", default=None, help="Filter history by model name.")
-def history(limit, model_name):
-    params = {"limit": limit}
-    if model_name:
-        params["model_name"] = model_name
+@click.option("--before-id", default=None, type=int, help="Only records older than this id (next page).")
+@click.option("--since", default=None, help="Only records from this time on (ISO 8601, UTC).")
+@click.option("--until", default=None, help="Only records before this time (ISO 8601, UTC).")
+def history(limit, model_name, before_id, since, until):
     try:
-        resp = requests.get(api_url("/history"), params=params)
-        resp.raise_for_status()
-        data = resp.json()
+        data = api_client.history(limit, model_name, before_id, since, until)
         click.echo("[INFO]: History:")
-        for r in data:
-            click.echo(f"ID: {r['id']} | Model: {r['model']} | Prompt: {r['prompt']} | Response: {r['response']}")
+        for r in data.get("history", []):
+            click.echo(f"ID: {r['id']} | Model: {r['model']} | Prompt: {r['prompt_preview']} | "
+                       f"Response: {r['response_preview']}")
+        if data.get("next_before_id"):
+            click.echo(f"[INFO]: More with --before-id {data['next_before_id']}")
     except requests.RequestException as e:
         click.echo(f"[ERROR]: Failed to fetch history → {e}")
 
 
+@cli.command("search", help="Search past prompts and results by words, most relevant first.")
+@click.argument("query")
+@click.option("--limit", default=20, help="Number of results to fetch.")
+@click.option("--offset", default=0, help="Skip this many results (next page).")
+@click.option("--model-name", default=None, help="Filter results by model name.")
+def search(query, limit, offset, model_name):
+    try:
+        data = api_client.search_history(query, limit, offset, model_name)
+        click.echo(f"[INFO]: Results for '{query}':")
+        for r in data.get("results", []):
+            click.echo(f"ID: {r['id']} | Model: {r['model']} | Prompt: {r['prompt_preview']} | "
+                       f"Response: {r['response_preview']}")
+        if data.get("next_offset"):
+            click.echo(f"[INFO]: More with --offset {data['next_offset']}")
+    except requests.RequestException as e:
+        click.echo(f"[ERROR]: Failed to search history → {e}")
+
+
+@cli.command("show", help="Show the full prompt and response of a history record.")
+@click.argument("record_id", type=int)
+def show(record_id):
+    try:
+        r = api_client.history_record(record_id)
+        click.echo(f"ID: {r['id']} | Model: {r['model']} | {r['timestamp']}")
+        click.echo(f"[PROMPT]: {r['prompt']}")
+        click.echo(f"[RESPONSE]: {r['response']}")
+    except requests.RequestException as e:
+        click.echo(f"[ERROR]: Failed to fetch history record → {e}")
+
+
+# ---------------------------
+# Usage command
+# ---------------------------
+@cli.command("usage", help="Requests, tokens, errors and latency per model over a time range.")
+@click.option("--since", default=None, help="Range start (ISO 8601, UTC); default 7 days before --until.")
+@click.option("--until", default=None, help="Range end (ISO 8601, UTC); default now.")
+@click.option("--model-name", default=None, help="Only this model.")
+@click.option("--granularity", type=click.Choice(["hour", "day"]), default="day", help="Bucket size.")
+def usage(since, until, model_name, granularity):
+    try:
+        data = api_client.usage(since, until, model_name, granularity)
+        click.echo(f"[INFO]: Usage from {data['since']} to {data['until']}:")
+        for b in data.get("buckets", []):
+            click.echo(f"{b['bucket']} | Model: {b['model']} | Requests: {b['requests']} | Errors: {b['errors']} | "
+                       f"Tokens: {b['prompt_tokens']}/{b['completion_tokens']} | Avg latency: {b['latency_avg']}s")
+        for model, t in data.get("totals", {}).items():
+            click.echo(f"[TOTAL]: {model} | Requests: {t['requests']} | Errors: {t['errors']} | "
+                       f"Tokens: {t['prompt_tokens']}/{t['completion_tokens']} | Max latency: {t['latency_max']}s")
+    except requests.RequestException as e:
+        click.echo(f"[ERROR]: Failed to fetch usage → {e}")
+
+
 # ---------------------------
 # Version command
 # ---------------------------
 @cli.command("version", help="Check the server version.")
 def version():
     try:
-        resp = requests.get(api_url("/version"))
-        resp.raise_for_status()
-        data = resp.json()
-        click.echo(f"[INFO]: Server version: {data.get('version')}")
+        click.echo(f"[INFO]: Server version: {api_client.version()}")
     except requests.RequestException as e:
         click.echo(f"[ERROR]: Failed to fetch version → {e}")
 
@@ -3,7 +3,7 @@ import gradio as gr
 import requests
 import re
 import json
-from client.config import SERVER_URL, API_PREFIX
+from client.api_client import ApiClient, api_client
 
 # ---------------------------
 # Configuration
@@ -14,9 +14,6 @@ token = None  # For admin authentication (JWT or Bearer token)
 # ---------------------------
 # Utility functions
 # ---------------------------
-def api_url(path: str) -> str:
-    return f"{SERVER_URL}{API_PREFIX}{path}"
-
 def clean_llm_output(text: str) -> str:
     """Remove markdown artifacts like *, **, etc."""
     text = re.sub(r"\*+", "", text)
@@ -26,9 +23,7 @@ def clean_llm_output(text: str) -> str:
 def get_model_list():
     """Fetch available models from server."""
     try:
-        resp = requests.get(api_url("/model/list"))
-        resp.raise_for_status()
-        return resp.json().get("models", [])
+        return api_client.list_models()
     except requests.RequestException:
         return []
 
@@ -44,13 +39,8 @@ def upload_model(file_obj):
     try:
         with open(file_obj.name, "r", encoding="utf-8") as f:
             data = json.load(f)
-        resp = requests.post(
-            api_url("/model/upload"),
-            json=data,
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        resp.raise_for_status()
-        message = resp.json().get("message", "Upload successful!")
+        with ApiClient(token=token) as admin:
+            message = admin.upload_models(data).get("message", "Upload successful!")
         models = get_model_list()
         return message, models, gr.update(interactive=bool(models))
     except Exception as e:
@@ -62,12 +52,8 @@ def clear_models():
     if not token:
         return "Login required", get_model_list(), gr.update(interactive=False)
     try:
-        resp = requests.post(
-            api_url("/model/clear"),
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        resp.raise_for_status()
-        message = resp.json().get("message", "Models cleared!")
+        with ApiClient(token=token) as admin:
+            message = admin.clear_models().get("message", "Models cleared!")
         models = get_model_list()
         return message, models, gr.update(interactive=bool(models))
     except Exception as e:
@@ -84,33 +70,22 @@ def submit_prompt_ui(prompt, model_full_name):
     if not model_full_name:
         return "No model selected!", ""
 
-    payload = {
-        "prompt": prompt,
-        "model_index": 0,
-        "model_name": model_full_name,
-        "stream": False
-    }
     try:
         status = "Working on it..."
         result = ""
 
-        resp = requests.post(api_url("/job/prompt"), json=payload)
-        resp.raise_for_status()
-        task_id = resp.json().get("task_id")
-
-        # Poll for the result
-        while True:
-            job_resp = requests.get(api_url(f"/job/{task_id}"))
-            job_resp.raise_for_status()
-            job_data = job_resp.json()
-            if job_data.get("status") == "SUCCESS":
-                result = clean_llm_output(job_data.get("result", ""))
-                status = "Done"
-                break
-            elif job_data.get("status") == "FAILURE":
-                status = "Failed"
-                result = "(Error in processing)"
-                break
+        task_id = api_client.submit(prompt, model_name=model_full_name).get("job_id")
+
+        # Long-poll instead of hammering GET /job/<id>
+        job_data = api_client.result(task_id)
+        if job_data.get("status") == "SUCCESS":
+            result = clean_llm_output(job_data.get("result") or "")
+            status = "Done"
+        elif job_data.get("status") == "TIMEOUT":
+            status = "Timed out"
+        else:
+            status = "Failed"
+            result = "(Error in processing)"
     except requests.RequestException as e:
         return f"Error contacting server: {e}", ""
 
@@ -6,9 +6,11 @@ from dotenv import load_dotenv
 
 CLIENT_ROLE = os.environ.get("CLIENT_ROLE", "user").lower()  # default to 'user'
 
-def get_env_var(name: str, cast=str):
+def get_env_var(name: str, cast=str, default=None):
     value = os.environ.get(name)
     if value is None:
+        if default is not None:
+            return default
         raise RuntimeError(f"Environment variable '{name}' is required but not set.")
     if cast == bool:
         val = value.lower()
@@ -25,6 +27,12 @@ class Config:
     API_PREFIX = get_env_var("API_PREFIX")
     APP_VERSION = get_env_var("APP_VERSION")
 
+    # HTTP client (client/api_client.py)
+    CONNECT_TIMEOUT = get_env_var("CONNECT_TIMEOUT", float, 3.05)
+    READ_TIMEOUT = get_env_var("READ_TIMEOUT", float, 30.0)
+    HTTP_RETRIES = get_env_var("HTTP_RETRIES", int, 3)
+    HTTP_POOL_SIZE = get_env_var("HTTP_POOL_SIZE", int, 20)
+
     if CLIENT_ROLE == "admin":
         CLIENT_CONT = get_env_var("ADMIN_CLIENT_CONT")
         CLIENT_PORT = get_env_var("ADMIN_CLIENT_PORT", int)
@@ -0,0 +1,98 @@
+# client/job_poller.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from client.api_client import FINAL_STATES, api_client
+
+logger = logging.getLogger(__name__)
+
+
+class JobPoller:
+    """Process-wide background poller shared by every UI session.
+
+    Sessions register task ids with watch() and receive (task_id, job) on the
+    returned queue once each task reaches a final state. Outstanding ids are
+    checked with batched POST /job/wait long-polls through the shared
+    ApiClient, instead of one thread and one socket per task. watch() wakes
+    the poller, which long-polls the new ids at once in a request of their
+    own (on a small pool of `max_polls` threads) rather than waiting for the
+    polls already in flight to return.
+    """
+
+    def __init__(self, client, wait_timeout: float = 5.0, batch_size: int = 200, max_polls: int = 4):
+        self.client = client
+        self.wait_timeout = wait_timeout
+        self.batch_size = batch_size
+        self.max_polls = max_polls
+        self._lock = threading.Lock()
+        self._watchers = {}    # task_id -> [queue.Queue]
+        self._known = {}       # task_id -> last status seen
+        self._polling = set()  # task ids in a long-poll now in flight
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def watch(self, task_ids) -> queue.Queue:
+        """Start tracking `task_ids`; finished jobs are delivered on the returned queue."""
+        updates = queue.Queue()
+        with self._lock:
+            for task_id in task_ids:
+                self._watchers.setdefault(task_id, []).append(updates)
+            if self._thread is None or not self._thread.is_alive():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_polls, thread_name_prefix="job-poll")
+                self._thread = threading.Thread(target=self._run, name="job-poller", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return updates
+
+    def unwatch(self, task_ids, updates: queue.Queue):
+        """Stop delivering `task_ids` to `updates` (e.g. when a session times out)."""
+        with self._lock:
+            for task_id in task_ids:
+                watchers = self._watchers.get(task_id, [])
+                if updates in watchers:
+                    watchers.remove(updates)
+                if not watchers:
+                    self._watchers.pop(task_id, None)
+                    self._known.pop(task_id, None)
+
+    def _run(self):
+        # Woken by watch() and by every finished poll: long-poll whatever is watched but not in flight
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                task_ids = [t for t in self._watchers if t not in self._polling]
+                known = {t: self._known[t] for t in task_ids if t in self._known}
+                self._polling.update(task_ids)
+            for start in range(0, len(task_ids), self.batch_size):
+                batch = task_ids[start:start + self.batch_size]
+                self._pool.submit(self._poll, batch, {t: known[t] for t in batch if t in known})
+
+    def _poll(self, task_ids: list, known: dict):
+        try:
+            self._dispatch(self.client.wait(task_ids, known=known, timeout=self.wait_timeout))
+        except requests.RequestException as e:
+            logger.warning(f"Job poll failed: {e}")
+            time.sleep(1)
+        finally:
+            with self._lock:
+                self._polling.difference_update(task_ids)
+            self._wakeup.set()
+
+    def _dispatch(self, jobs: dict):
+        with self._lock:
+            for task_id, job in jobs.items():
+                if job.get("status") not in FINAL_STATES:
+                    if task_id in self._watchers:
+                        self._known[task_id] = job.get("status")
+                    continue
+                for updates in self._watchers.pop(task_id, []):
+                    updates.put((task_id, job))
+                self._known.pop(task_id, None)
+
+
+job_poller = JobPoller(api_client)
@@ -3,15 +3,15 @@ import gradio as gr
 import requests
 import re
 import json
+from client.api_client import api_client
 from client.config import Config
+from client.job_poller import job_poller
 import logging
+import queue
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
-logging.basicConfig(level=logging.DEBUG, format="%(asctime)s [%(levelname)s] %(message)s")
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-SERVER_URL = Config.SERVER_URL
-API_PREFIX = Config.API_PREFIX
 TRUSTED_MODE = Config.TRUSTED_MODE
 UI_PORT = Config.CLIENT_PORT
 
@@ -22,10 +22,7 @@ UI_PORT = Config.CLIENT_PORT
 previous_models = []
 previous_selected_models = []
 SPINNER_FRAMES = ["⏳", "🔄", "⌛"]
-
-
-def api_url(path: str) -> str:
-    return f"{SERVER_URL}{API_PREFIX}{path}"
+JOB_TIMEOUT = 300  # seconds to wait for a prompt's jobs before giving up
 
 
 def clean_llm_output(text: str) -> str:
@@ -39,9 +36,7 @@ def clean_llm_output(text: str) -> str:
 # ---------------------------
 def get_model_list():
     try:
-        resp = requests.get(api_url("/model/list"))
-        resp.raise_for_status()
-        return resp.json().get("models", [])
+        return api_client.list_models()
     except requests.RequestException:
         return []
 
@@ -53,18 +48,14 @@ def upload_model(file_obj):
         file_path = file_obj.name if hasattr(file_obj, "name") else file_obj
         with open(file_path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        resp = requests.post(api_url("/model/upload"), json=data)
-        resp.raise_for_status()
-        return resp.json().get("message", "Upload successful!")
+        return api_client.upload_models(data).get("message", "Upload successful!")
     except Exception as e:
         return f"Failed to upload model: {e}"
 
 
 def clear_models():
     try:
-        resp = requests.post(api_url("/model/clear"))
-        resp.raise_for_status()
-        return resp.json().get("message", "Models cleared successfully!")
+        return api_client.clear_models().get("message", "Models cleared successfully!")
     except Exception as e:
         return f"Failed to clear models: {e}"
 
@@ -72,38 +63,17 @@ def clear_models():
 # ---------------------------
 # Chat functions
 # ---------------------------
-def poll_job(task_id, model, idx, timeout=300):
-    """Polls a single job until finished or timeout."""
-    start = time.time()
-
-    while True:
-        if time.time() - start > timeout:
-            return idx, f"{idx}. **{model}** ⏳ Timed out"
-
-        try:
-            job_resp = requests.get(api_url(f"/job/{task_id}"))
-            job_resp.raise_for_status()
-            job_data = job_resp.json()
-            logging.debug(f"[{model}] Job data: {job_data}")
-
-            status = job_data.get("status")
-            result_text = job_data.get("result", "")
+def format_job_result(job, model, idx):
+    """Render one finished job as a numbered markdown entry."""
+    status = job.get("status")
 
-            if status == "FAILURE":
-                return idx, f"{idx}. **{model}** ❌ Failure"
+    if status == "SUCCESS":
+        cleaned_text = clean_llm_output(job.get("result") or "")
+        if not cleaned_text or "error" in cleaned_text.lower():
+            return f"{idx}. **{model}** ❌ Invalid output"
+        return f"{idx}. **{model}** ✅\n\n{cleaned_text}"
 
-            elif status == "SUCCESS":
-                cleaned_text = clean_llm_output(result_text)
-                if not cleaned_text or "error" in cleaned_text.lower():
-                    return idx, f"{idx}. **{model}** ❌ Invalid output"
-                return idx, f"{idx}. **{model}** ✅\n\n{cleaned_text}"
-
-            else:  # PENDING
-                time.sleep(0.5)  # Let spinner update outside
-
-        except Exception as e:
-            logging.exception(f"Error polling job {task_id} for {model}")
-            return idx, f"{idx}. **{model}** ❌ Error: {e}"
+    return f"{idx}. **{model}** ❌ Failure"
 
 
 def submit_prompt_ui(prompt, selected_models):
@@ -122,46 +92,43 @@ def submit_prompt_ui(prompt, selected_models):
         selected_models = [selected_models]
 
 
-    payload = {"prompt": prompt, "models": selected_models, "stream": False}
-
     try:
-        resp = requests.post(api_url("/job/prompt"), json=payload)
-        resp.raise_for_status()
-        data = resp.json()
+        data = api_client.submit(prompt, models=selected_models)
         task_ids = data.get("task_ids", [])
 
         results = [f"{idx}. **{model}** ⏳" for idx, model in enumerate(selected_models, start=1)]
+        pending = {
+            task_id: (idx, model)
+            for idx, (task_id, model) in enumerate(zip(task_ids, selected_models), start=1)
+        }
 
         # Spinner state
         frame = 0
         yield f"Working {SPINNER_FRAMES[frame]}", "\n\n".join(results)
 
-        with ThreadPoolExecutor(max_workers=len(task_ids)) as executor:
-            futures = {
-                executor.submit(poll_job, task_id, model, idx): (task_id, model, idx)
-                for idx, (task_id, model) in enumerate(zip(task_ids, selected_models), start=1)
-            }
+        # The shared poller wakes us when any of our tasks finishes
+        updates = job_poller.watch(task_ids)
+        deadline = time.time() + JOB_TIMEOUT
+        try:
+            while pending:
+                try:
+                    task_id, job = updates.get(timeout=0.5)
+                    idx, model = pending.pop(task_id)
+                    results[idx - 1] = format_job_result(job, model, idx)
+                except queue.Empty:
+                    if time.time() > deadline:
+                        for idx, model in pending.values():
+                            results[idx - 1] = f"{idx}. **{model}** ⏳ Timed out"
+                        break
 
-            while futures:
-                done, _ = wait(futures, timeout=0.5, return_when="FIRST_COMPLETED")
                 frame = (frame + 1) % len(SPINNER_FRAMES)
-
-                # Update spinner in status
-                finished = sum(1 for r in results if not any(s in r for s in SPINNER_FRAMES))
-                status_msg = f"{finished}/{len(task_ids)} models finished {SPINNER_FRAMES[frame]}"
+                status_msg = f"{len(task_ids) - len(pending)}/{len(task_ids)} models finished {SPINNER_FRAMES[frame]}"
                 yield status_msg, "\n\n".join(results)
+        finally:
+            job_poller.unwatch(task_ids, updates)
 
-                for future in list(done):
-                    try:
-                        idx, result = future.result()
-                        results[idx - 1] = result
-                    except Exception as e:
-                        task_id, model, idx = futures[future]
-                        results[idx - 1] = f"{idx}. **{model}** ❌ Error: {e}"
-                    del futures[future]
-
-            # Final update
-            yield "Done ✅", "\n\n".join(results)
+        # Final update
+        yield "Done ✅", "\n\n".join(results)
 
     except requests.RequestException as e:
         logging.exception("Error contacting server")
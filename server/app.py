@@ -1,5 +1,12 @@
 from flask import Flask
 from server.database import db
+from server.database.record_writer import record_writer
+from server.database.retention import history_cli
+from server.database.schema import upgrade_schema
+from server.database.search import ensure_search_index
+from server.database.usage_rollup import usage_rollups
+from server.infrastructure.async_runner import async_runner
+from server.infrastructure.metrics import metrics_view
 from server.jobs.producer import api_v1 as producer_api
 from server.managers.client_manager import ClientManager
 from server.config import Config
@@ -14,15 +21,27 @@ def create_app():
     with app.app_context():
         try:
             db.create_all()
+            upgrade_schema(db.engine)
+            ensure_search_index(db.engine)
         except Exception as e:
             app.logger.error(f"Database initialization failed: {e}")
+    record_writer.init_app(app)
+    usage_rollups.init_app(app)
+    async_runner.init_app(app)
 
     # Attach ClientManager
     app.client_manager = ClientManager()
 
+    # flask --app server.app history partition|archive|rehydrate
+    app.cli.add_command(history_cli)
+
     # Register blueprint
     app.register_blueprint(producer_api, url_prefix=Config.API_PREFIX)
 
+    # Prometheus scrape endpoint, summing every Gunicorn worker
+    if Config.METRICS_ENABLED:
+        app.add_url_rule("/metrics", "metrics", metrics_view)
+
     # Root endpoint
     @app.route("/")
     def index():
@@ -1,13 +1,16 @@
+import json
 import os
 from dotenv import load_dotenv
 
 # Load .env (override ensures any existing env vars are replaced)
 # load_dotenv(override=True)
 
-def get_env_var(name: str, cast=str) -> any:
-    """Get an environment variable, enforce existence, and cast type."""
+def get_env_var(name: str, cast=str, default=None) -> any:
+    """Get an environment variable, enforce existence (unless a default is given), and cast type."""
     value = os.environ.get(name)
     if value is None:
+        if default is not None:
+            return default
         raise RuntimeError(f"Environment variable '{name}' is required but not set.")
     
     try:
@@ -48,6 +51,7 @@ class Config:
     REDIS_HOST = get_env_var("REDIS_HOST")
     REDIS_PORT = get_env_var("REDIS_PORT", int)
     REDIS_PASSWORD = get_env_var("REDIS_PASSWORD")
+    REDIS_APP_DB = get_env_var("REDIS_APP_DB", int, 2)  # db 0 = Celery broker, db 1 = Celery results
     QUEUE_NAME = get_env_var("QUEUE_NAME")
 
     # Flask server
@@ -74,5 +78,131 @@ class Config:
     APP_VERSION = get_env_var("APP_VERSION")
 
     PATH_USAGE = get_env_var("PATH_USAGE")
-    PATH_LOG = get_env_var("PATH_LOG")
-   
+
+    # Usage counters
+    USAGE_FLUSH_INTERVAL = get_env_var("USAGE_FLUSH_INTERVAL", float, 2.0)  # seconds
+    USAGE_DAILY_TTL_DAYS = get_env_var("USAGE_DAILY_TTL_DAYS", int, 90)
+
+    # Prometheus metrics: GET /metrics on the API, an exporter on METRICS_WORKER_PORT in Celery workers
+    METRICS_ENABLED = get_env_var("METRICS_ENABLED", bool, True)
+    PROMETHEUS_MULTIPROC_DIR = get_env_var("PROMETHEUS_MULTIPROC_DIR", str, "/tmp/openfreeai-metrics")
+    METRICS_WORKER_PORT = get_env_var("METRICS_WORKER_PORT", int, 9808)
+
+    # Tracing (server/infrastructure/tracing.py): trace ids are always recorded, spans exported per TRACE_EXPORTER
+    TRACE_EXPORTER = get_env_var("TRACE_EXPORTER", str, "none")  # none, file or otlp
+    TRACE_FILE = get_env_var("TRACE_FILE", str, "./data/traces.jsonl")
+    TRACE_OTLP_ENDPOINT = get_env_var("TRACE_OTLP_ENDPOINT", str, "http://localhost:4318/v1/traces")
+    TRACE_SERVICE_NAME = get_env_var("TRACE_SERVICE_NAME", str, "openfreeai")
+    TRACE_SAMPLE_RATE = get_env_var("TRACE_SAMPLE_RATE", float, 1.0)  # share of new traces exported
+    TRACE_BATCH_SIZE = get_env_var("TRACE_BATCH_SIZE", int, 256)
+    TRACE_FLUSH_MS = get_env_var("TRACE_FLUSH_MS", int, 1000)
+    TRACE_QUEUE_SIZE = get_env_var("TRACE_QUEUE_SIZE", int, 10000)  # spans beyond this are dropped
+
+    # Usage rollups (server/database/usage_rollup.py): hourly rows, folded into days after this many days
+    USAGE_ROLLUP_HOURLY_DAYS = get_env_var("USAGE_ROLLUP_HOURLY_DAYS", int, 14)
+    USAGE_ROLLUP_COMPACT_INTERVAL = get_env_var("USAGE_ROLLUP_COMPACT_INTERVAL", float, 6.0)  # hours between runs
+    USAGE_MAX_RANGE_DAYS = get_env_var("USAGE_MAX_RANGE_DAYS", int, 366)  # widest /usage query
+
+    # PromptRecord write-behind buffer
+    RECORD_BATCH_SIZE = get_env_var("RECORD_BATCH_SIZE", int, 50)
+    RECORD_FLUSH_MS = get_env_var("RECORD_FLUSH_MS", int, 500)
+    RECORD_QUEUE_SIZE = get_env_var("RECORD_QUEUE_SIZE", int, 10000)
+    RECORD_ENQUEUE_TIMEOUT = get_env_var("RECORD_ENQUEUE_TIMEOUT", float, 1.0)  # seconds
+    RECORD_WRITE_RETRIES = get_env_var("RECORD_WRITE_RETRIES", int, 3)  # batch retries before row-by-row inserts
+    RECORD_RETRY_BACKOFF = get_env_var("RECORD_RETRY_BACKOFF", float, 0.5)  # seconds, doubled per retry
+
+    # Batched job long-polling (/job/wait)
+    JOB_WAIT_MAX_TIMEOUT = get_env_var("JOB_WAIT_MAX_TIMEOUT", float, 25.0)  # keep below the Gunicorn timeout
+    JOB_WAIT_MAX_IDS = get_env_var("JOB_WAIT_MAX_IDS", int, 200)
+
+    # Multi-model fan-out
+    FANOUT_MAX_MODELS = get_env_var("FANOUT_MAX_MODELS", int, 10)
+    FANOUT_TIMEOUT = get_env_var("FANOUT_TIMEOUT", int, 300)  # seconds before unstarted children expire
+    FANOUT_META_TTL = get_env_var("FANOUT_META_TTL", int, 86400)  # matches Celery's default result_expires
+
+    # Token streaming (Redis streams relayed over SSE)
+    STREAM_TTL = get_env_var("STREAM_TTL", int, 3600)  # seconds a finished stream stays replayable
+    STREAM_BLOCK_MS = get_env_var("STREAM_BLOCK_MS", int, 15000)  # XREAD block / keep-alive interval
+    STREAM_TIMEOUT = get_env_var("STREAM_TIMEOUT", int, 300)  # give up after this many idle seconds
+
+    # Response cache (exact prompt + model match)
+    RESPONSE_CACHE_ENABLED = get_env_var("RESPONSE_CACHE_ENABLED", bool, False)
+    RESPONSE_CACHE_TTL = get_env_var("RESPONSE_CACHE_TTL", int, 3600)  # seconds
+    RESPONSE_CACHE_MAX_ENTRIES = get_env_var("RESPONSE_CACHE_MAX_ENTRIES", int, 10000)
+
+    # Single-flight coalescing of identical in-flight requests
+    SINGLE_FLIGHT_ENABLED = get_env_var("SINGLE_FLIGHT_ENABLED", bool, True)
+    SINGLE_FLIGHT_LOCK_TTL = get_env_var("SINGLE_FLIGHT_LOCK_TTL", int, 120)  # followers wait while it is held
+    SINGLE_FLIGHT_RESULT_TTL = get_env_var("SINGLE_FLIGHT_RESULT_TTL", int, 30)
+
+    # LLM call execution: "sync" (one blocking call per worker slot) or "async"
+    # (calls multiplexed on one event loop per process; run Celery with --pool=threads)
+    LLM_EXECUTION_MODE = get_env_var("LLM_EXECUTION_MODE", str, "sync")
+    ASYNC_LLM_CONCURRENCY = get_env_var("ASYNC_LLM_CONCURRENCY", int, 200)
+
+    # Provider call resilience (server/utils/retry_decorator.py, circuit_breaker.py)
+    RETRY_MAX_DELAY = get_env_var("RETRY_MAX_DELAY", float, 30.0)  # longer Retry-After hints give up instead
+    CIRCUIT_ENABLED = get_env_var("CIRCUIT_ENABLED", bool, True)
+    CIRCUIT_FAILURE_THRESHOLD = get_env_var("CIRCUIT_FAILURE_THRESHOLD", int, 5)
+    CIRCUIT_FAILURE_WINDOW = get_env_var("CIRCUIT_FAILURE_WINDOW", int, 60)
+    CIRCUIT_RESET_TIMEOUT = get_env_var("CIRCUIT_RESET_TIMEOUT", int, 30)
+    CIRCUIT_HALF_OPEN_CALLS = get_env_var("CIRCUIT_HALF_OPEN_CALLS", int, 1)
+    CIRCUIT_STATE_TTL = get_env_var("CIRCUIT_STATE_TTL", int, 86400)
+
+    # Celery task retries (rescheduled through the broker instead of sleeping in the worker)
+    TASK_MAX_RETRIES = get_env_var("TASK_MAX_RETRIES", int, 5)
+    TASK_RETRY_BACKOFF = get_env_var("TASK_RETRY_BACKOFF", float, 2.0)
+    TASK_RETRY_MAX_DELAY = get_env_var("TASK_RETRY_MAX_DELAY", float, 120.0)
+    JOB_ATTEMPTS_TTL = get_env_var("JOB_ATTEMPTS_TTL", int, 86400)
+
+    # Model router (server/managers/model_router.py)
+    ROUTER_EWMA_ALPHA = get_env_var("ROUTER_EWMA_ALPHA", float, 0.2)
+    ROUTER_DEFAULT_LATENCY = get_env_var("ROUTER_DEFAULT_LATENCY", float, 5.0)  # prior for unseen models
+    ROUTER_MAX_CANDIDATES = get_env_var("ROUTER_MAX_CANDIDATES", int, 3)
+    ROUTER_STATS_TTL = get_env_var("ROUTER_STATS_TTL", int, 604800)
+
+    # Upstream rate limiting (server/utils/rate_limiter.py); 0 = unlimited
+    RATE_LIMIT_ENABLED = get_env_var("RATE_LIMIT_ENABLED", bool, True)
+    DEFAULT_MODEL_RPM = get_env_var("DEFAULT_MODEL_RPM", int, 0)  # for models without an rpm in the catalog
+    DEFAULT_MODEL_CONCURRENCY = get_env_var("DEFAULT_MODEL_CONCURRENCY", int, 0)
+    PROVIDER_LIMITS = json.loads(get_env_var("PROVIDER_LIMITS", str, "{}"))  # {"google": {"rpm": 60, "max_concurrency": 10}}
+    RATE_LIMIT_HEADROOM = get_env_var("RATE_LIMIT_HEADROOM", float, 0.9)  # run at this fraction of the declared rpm
+    RATE_LIMIT_BURST_SECONDS = get_env_var("RATE_LIMIT_BURST_SECONDS", float, 10.0)
+    RATE_LIMIT_MAX_WAIT = get_env_var("RATE_LIMIT_MAX_WAIT", float, 2.0)  # longer waits re-queue the task
+    RATE_LIMIT_LEASE_TTL = get_env_var("RATE_LIMIT_LEASE_TTL", int, 300)
+
+    # Celery priority lanes (server/infrastructure/celery_app.py)
+    WORKER_LANES = get_env_var("WORKER_LANES", str, "interactive,default,bulk").split(",")  # lanes this worker consumes
+    CELERY_PREFETCH_MULTIPLIER = get_env_var("CELERY_PREFETCH_MULTIPLIER", int, 1)
+
+    # Batch jobs (server/jobs/batch.py)
+    BATCH_DIR = get_env_var("BATCH_DIR", str, "./data/batches")  # uploaded inputs and output JSONL per batch
+    BATCH_INPUT_DIR = get_env_var("BATCH_INPUT_DIR", str, "./data")  # server-side inputs must live under here
+    BATCH_CHUNK_SIZE = get_env_var("BATCH_CHUNK_SIZE", int, 20)  # rows a runner claims at a time
+    BATCH_CONCURRENCY = get_env_var("BATCH_CONCURRENCY", int, 4)  # runner tasks per batch
+    BATCH_MAX_CONCURRENCY = get_env_var("BATCH_MAX_CONCURRENCY", int, 32)
+    BATCH_META_TTL = get_env_var("BATCH_META_TTL", int, 604800)
+    BATCH_CLAIM_TIMEOUT = get_env_var("BATCH_CLAIM_TIMEOUT", int, 900)  # seconds a runner may spend on one row
+
+    # Prompt history listing
+    HISTORY_MAX_LIMIT = get_env_var("HISTORY_MAX_LIMIT", int, 200)
+    HISTORY_PREVIEW_CHARS = get_env_var("HISTORY_PREVIEW_CHARS", int, 200)  # prompt/response preview length in lists, at most 255
+    HISTORY_SEARCH_INDEX = get_env_var("HISTORY_SEARCH_INDEX", bool, True)  # full-text index for /history/search
+    HISTORY_SEARCH_MAX_CHARS = get_env_var("HISTORY_SEARCH_MAX_CHARS", int, 20000)  # indexed characters per text
+
+    # Prompt history retention (server/database/retention.py)
+    HISTORY_RETENTION_DAYS = get_env_var("HISTORY_RETENTION_DAYS", int, 0)  # archive older months; 0 = keep all
+    HISTORY_ARCHIVE_DIR = get_env_var("HISTORY_ARCHIVE_DIR", str, "./data/archive")
+    HISTORY_ARCHIVE_BATCH = get_env_var("HISTORY_ARCHIVE_BATCH", int, 5000)  # rows per read / delete
+    HISTORY_ARCHIVE_INTERVAL = get_env_var("HISTORY_ARCHIVE_INTERVAL", float, 24.0)  # hours between runs
+    HISTORY_PARTITION_MONTHS_AHEAD = get_env_var("HISTORY_PARTITION_MONTHS_AHEAD", int, 3)
+
+    # Prompt/response content store: each distinct text stored once, keyed by SHA-256
+    CONTENT_COMPRESSION = get_env_var("CONTENT_COMPRESSION", str, "zlib")  # zlib, zstd (needs zstandard) or none
+    CONTENT_COMPRESSION_LEVEL = get_env_var("CONTENT_COMPRESSION_LEVEL", int, 6)
+    CONTENT_COMPRESS_MIN_BYTES = get_env_var("CONTENT_COMPRESS_MIN_BYTES", int, 512)  # smaller texts stored as is
+    CONTENT_GC_GRACE = get_env_var("CONTENT_GC_GRACE", int, 3600)  # seconds an unreferenced text is kept
+
+    # Model catalog cache
+    MODEL_CATALOG_VERSION_KEY = get_env_var("MODEL_CATALOG_VERSION_KEY", str, "llm:models:version")
+
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import zlib
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from sqlalchemy import exists, or_
+from sqlalchemy.dialects import mysql, sqlite
+from server.config import Config
+from server.database import db
+from server.database.models import PromptContent, PromptRecord
+
+try:
+    import zstandard
+except ImportError:  # optional: CONTENT_COMPRESSION=zstd falls back to zlib without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_MAX_CHARS = 255  # PromptContent.preview column size
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _codec() -> str:
+    codec = Config.CONTENT_COMPRESSION
+    if codec == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, compressing with zlib")
+        return "zlib"
+    return codec
+
+
+def encode(text: str):
+    """(compression, data): utf-8 bytes, compressed once they reach CONTENT_COMPRESS_MIN_BYTES."""
+    raw = text.encode("utf-8")
+    codec = _codec() if len(raw) >= Config.CONTENT_COMPRESS_MIN_BYTES else "none"
+    if codec == "zlib":
+        return codec, zlib.compress(raw, Config.CONTENT_COMPRESSION_LEVEL)
+    if codec == "zstd":
+        return codec, zstandard.ZstdCompressor(level=Config.CONTENT_COMPRESSION_LEVEL).compress(raw)
+    return "none", raw
+
+
+def decode(compression: str, data: bytes) -> str:
+    if compression == "zlib":
+        data = zlib.decompress(data)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed content")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode("utf-8")
+
+
+def _upsert(rows: list):
+    """Insert new contents; one inserted meanwhile by another writer only gets its last_seen refreshed."""
+    table = PromptContent.__table__
+    if db.engine.dialect.name == "mysql":
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(last_seen=statement.inserted.last_seen)
+    elif db.engine.dialect.name == "sqlite":
+        statement = sqlite.insert(table)
+        statement = statement.on_conflict_do_update(index_elements=["hash"],
+                                                    set_={"last_seen": statement.excluded.last_seen})
+    else:
+        known = set(db.session.scalars(sa.select(table.c.hash).where(table.c.hash.in_([r["hash"] for r in rows]))))
+        rows = [r for r in rows if r["hash"] not in known]
+        statement = sa.insert(table)
+    if rows:
+        db.session.execute(statement, rows)
+
+
+def store_texts(texts) -> list:
+    """Store each distinct text once; returns the hashes in order (None for None).
+
+    Only texts not stored yet are compressed and added to the search index.
+    Runs in the caller's transaction.
+    """
+    from server.database.search import index_contents  # local import: search -> history -> this module
+
+    hashes = [content_hash(text) if text is not None else None for text in texts]
+    distinct = {h: text for h, text in zip(hashes, texts) if h is not None}
+    if not distinct:
+        return hashes
+
+    known = set(db.session.scalars(sa.select(PromptContent.hash).where(PromptContent.hash.in_(list(distinct)))))
+    now = datetime.utcnow()
+    if known:
+        PromptContent.query.filter(PromptContent.hash.in_(list(known))).update(
+            {"last_seen": now}, synchronize_session=False)
+    rows = []
+    for h, text in distinct.items():
+        if h not in known:
+            compression, data = encode(text)
+            rows.append({"hash": h, "size": len(text), "compression": compression,
+                         "preview": text[:PREVIEW_MAX_CHARS], "data": data, "last_seen": now})
+    if rows:
+        _upsert(rows)
+    index_contents({h: text for h, text in distinct.items() if h not in known})
+    return hashes
+
+
+def to_records(rows: list) -> list:
+    """Turn rows with prompt_text / completion_text into PromptRecord rows holding hashes and lengths."""
+    prompts = store_texts([row.get("prompt_text") for row in rows])
+    completions = store_texts([row.get("completion_text") for row in rows])
+    records = []
+    for row, prompt_hash, completion_hash in zip(rows, prompts, completions):
+        record = {k: v for k, v in row.items() if k not in ("prompt_text", "completion_text")}
+        prompt, completion = row.get("prompt_text"), row.get("completion_text")
+        record.update({
+            "prompt_hash": prompt_hash,
+            "prompt_length": len(prompt) if prompt is not None else None,
+            "completion_hash": completion_hash,
+            "completion_length": len(completion) if completion is not None else None
+        })
+        records.append(record)
+    return records
+
+
+def load_texts(hashes) -> dict:
+    """{hash: full text}, decompressing only the contents asked for."""
+    wanted = [h for h in set(hashes) if h]
+    if not wanted:
+        return {}
+    rows = db.session.query(PromptContent.hash, PromptContent.compression, PromptContent.data) \
+        .filter(PromptContent.hash.in_(wanted)).all()
+    return {h: decode(compression, data) for h, compression, data in rows}
+
+
+def record_texts(record) -> tuple:
+    """(prompt, completion) of a PromptRecord, whether stored as contents or in the legacy text columns."""
+    texts = load_texts([record.prompt_hash, record.completion_hash])
+    prompt = texts.get(record.prompt_hash, record.prompt_text)
+    completion = texts.get(record.completion_hash, record.completion_text)
+    return prompt, completion
+
+
+def gc_contents(hashes, grace_seconds: int = None) -> int:
+    """Delete contents among `hashes` that no PromptRecord references any more; returns how many.
+
+    Contents seen by a writer within `grace_seconds` are kept, so a record being
+    written right now never ends up pointing at a deleted content.
+    """
+    from server.database.search import unindex_contents
+
+    grace_seconds = Config.CONTENT_GC_GRACE if grace_seconds is None else grace_seconds
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    candidates = list(set(h for h in hashes if h))
+    deleted = 0
+    for i in range(0, len(candidates), Config.HISTORY_ARCHIVE_BATCH):
+        chunk = candidates[i:i + Config.HISTORY_ARCHIVE_BATCH]
+        # Two EXISTS rather than one OR so each can use its hash index
+        referenced = or_(exists().where(PromptRecord.prompt_hash == PromptContent.hash),
+                         exists().where(PromptRecord.completion_hash == PromptContent.hash))
+        orphans = list(db.session.scalars(sa.select(PromptContent.hash).where(
+            PromptContent.hash.in_(chunk), PromptContent.last_seen < cutoff, ~referenced)))
+        if orphans:
+            # Re-check in the DELETE itself: a writer may have reused one since the SELECT
+            deleted += PromptContent.query.filter(
+                PromptContent.hash.in_(orphans), PromptContent.last_seen < cutoff, ~referenced
+            ).delete(synchronize_session=False)
+            kept = set(db.session.scalars(sa.select(PromptContent.hash).where(PromptContent.hash.in_(orphans))))
+            unindex_contents([h for h in orphans if h not in kept])
+        db.session.commit()
+    return deleted
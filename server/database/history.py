@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+from server.config import Config
+from server.database import db
+from server.database.content_store import record_texts
+from server.database.models import PromptContent, PromptRecord
+
+PromptPreview = aliased(PromptContent, name="prompt_content")
+ResponsePreview = aliased(PromptContent, name="completion_content")
+
+
+def parse_time(value: str):
+    """ISO 8601 string -> naive UTC datetime (how PromptRecord.timestamp is stored); None passes through."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def summary_columns() -> list:
+    """PromptRecord columns for list views, with the texts cut to HISTORY_PREVIEW_CHARS in SQL.
+
+    Previews come from the contents' stored previews (never the compressed
+    bodies), or from the legacy text columns for records not migrated yet.
+    """
+    preview = Config.HISTORY_PREVIEW_CHARS
+    return [
+        PromptRecord.id,
+        PromptRecord.model_name,
+        func.substr(func.coalesce(PromptPreview.preview, PromptRecord.prompt_text), 1, preview)
+            .label("prompt_preview"),
+        func.substr(func.coalesce(ResponsePreview.preview, PromptRecord.completion_text), 1, preview)
+            .label("response_preview"),
+        PromptRecord.prompt_length,
+        PromptRecord.completion_length,
+        PromptRecord.streamed,
+        PromptRecord.timestamp
+    ]
+
+
+def summary_query(*extra):
+    """Query of summary_columns() (plus `extra`), joined to the contents holding the previews."""
+    return (db.session.query(*summary_columns(), *extra)
+            .outerjoin(PromptPreview, PromptPreview.hash == PromptRecord.prompt_hash)
+            .outerjoin(ResponsePreview, ResponsePreview.hash == PromptRecord.completion_hash))
+
+
+def summary(row) -> dict:
+    return {
+        "id": row.id,
+        "model": row.model_name,
+        "prompt_preview": row.prompt_preview,
+        "response_preview": row.response_preview,
+        "prompt_length": row.prompt_length,
+        "response_length": row.completion_length,
+        "streamed": row.streamed,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None
+    }
+
+
+def filtered(query, model_name: str = None, since: datetime = None, until: datetime = None):
+    if model_name:
+        query = query.filter(PromptRecord.model_name == model_name)
+    if since:
+        query = query.filter(PromptRecord.timestamp >= since)
+    if until:
+        query = query.filter(PromptRecord.timestamp < until)
+    return query
+
+
+def list_history(limit: int = 50, model_name: str = None, before_id: int = None,
+                 since: datetime = None, until: datetime = None) -> dict:
+    """One page of history, newest first, as previews.
+
+    Keyset pagination: pass the returned `next_before_id` as `before_id` for
+    the next page. Each page is an index range scan on id (or on
+    (model_name, id) when filtering by model) however deep the caller pages,
+    unlike OFFSET. Only the first HISTORY_PREVIEW_CHARS characters of the
+    prompt and response leave the database; /history/<id> has the full text.
+    """
+    limit = max(1, min(limit, Config.HISTORY_MAX_LIMIT))
+    query = filtered(summary_query(), model_name, since, until)
+    if before_id:
+        query = query.filter(PromptRecord.id < before_id)
+
+    rows = query.order_by(PromptRecord.id.desc()).limit(limit).all()
+    return {
+        "history": [summary(r) for r in rows],
+        "next_before_id": rows[-1].id if len(rows) == limit else None
+    }
+
+
+def get_record(record_id: int):
+    """Full prompt and response of one history entry, or None."""
+    r = db.session.get(PromptRecord, record_id)
+    if r is None:
+        return None
+    prompt, response = record_texts(r)
+    return {
+        "id": r.id,
+        "model": r.model_name,
+        "prompt": prompt,
+        "response": response,
+        "streamed": r.streamed,
+        "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+        "trace_id": r.trace_id
+    }
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy.dialects import mysql
 from server.database import db 
 
 class LLMModel(db.Model):
@@ -7,11 +8,51 @@ class LLMModel(db.Model):
     provider = db.Column(db.String(100), nullable=True)
     model_name = db.Column(db.String(100), nullable=True)
     tag = db.Column(db.String(50), nullable=True)
+    rpm = db.Column(db.Integer, nullable=True)              # requests per minute, None = provider/default limit
+    max_concurrency = db.Column(db.Integer, nullable=True)  # in-flight requests, None = default
+
+class PromptContent(db.Model):
+    """A prompt or completion text, stored once however many records use it (keyed by its SHA-256)."""
+    hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)                  # characters
+    compression = db.Column(db.String(8), nullable=False)         # "none", "zlib" or "zstd"
+    preview = db.Column(db.String(255), nullable=False)           # first characters, for list views
+    data = db.Column(db.LargeBinary().with_variant(mysql.LONGBLOB(), "mysql"), nullable=False)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)   # last write referencing it (gc grace)
 
 class PromptRecord(db.Model):
+    # Keyset pagination walks (model_name, id) backwards; time-range filters use timestamp;
+    # search and content gc look records up by content hash
+    __table_args__ = (
+        db.Index("ix_prompt_record_model_id", "model_name", "id"),
+        db.Index("ix_prompt_record_timestamp", "timestamp"),
+        db.Index("ix_prompt_record_prompt_hash", "prompt_hash"),
+        db.Index("ix_prompt_record_completion_hash", "completion_hash"),
+        db.Index("ix_prompt_record_trace_id", "trace_id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    prompt_text = db.Column(db.Text, nullable=False)
-    completion_text = db.Column(db.Text, nullable=True)
+    prompt_hash = db.Column(db.String(64), nullable=True)       # -> PromptContent.hash
+    prompt_length = db.Column(db.Integer, nullable=True)
+    completion_hash = db.Column(db.String(64), nullable=True)   # -> PromptContent.hash
+    completion_length = db.Column(db.Integer, nullable=True)
     model_name = db.Column(db.String(100), nullable=False)  # <-- add length
     streamed = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    trace_id = db.Column(db.String(32), nullable=True)          # request trace (server/infrastructure/tracing.py)
+    # Legacy inline text, NULL for records written since content-addressed storage
+    # (`flask --app server.app history reindex` moves old rows over and indexes them)
+    prompt_text = db.Column(db.Text, nullable=True)
+    completion_text = db.Column(db.Text, nullable=True)
+
+class UsageRollup(db.Model):
+    """Per-model call counters for one hour (or, once compacted, one day) starting at `bucket`."""
+    granularity = db.Column(db.String(8), primary_key=True)     # "hour" or "day"
+    bucket = db.Column(db.DateTime, primary_key=True)           # UTC start of the hour / day
+    model_name = db.Column(db.String(100), primary_key=True)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    completion_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    latency_sum = db.Column(db.Float, nullable=False, default=0.0)  # seconds
+    latency_max = db.Column(db.Float, nullable=False, default=0.0)
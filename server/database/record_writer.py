@@ -0,0 +1,177 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from server.config import Config
+from server.database import db
+from server.database.content_store import to_records
+from server.database.models import PromptRecord
+from server.infrastructure import tracing
+from server.infrastructure.metrics import DB_COMMIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class PromptRecordWriter:
+    """Write-behind buffer that persists PromptRecord rows with bulk inserts.
+
+    Rows are queued by submit() and written by a background thread every
+    `batch_size` rows or `flush_ms` milliseconds, whichever comes first.
+    The queue is bounded: when it stays full for `enqueue_timeout` seconds the
+    caller writes its row inline instead, so a slow database pushes back on
+    producers rather than growing memory or dropping rows. A failed batch is
+    retried `write_retries` times with exponential backoff, then inserted row
+    by row, so only rows the database rejects on their own are dropped.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = Config.RECORD_BATCH_SIZE
+        self.flush_interval = Config.RECORD_FLUSH_MS / 1000
+        self.max_queue = Config.RECORD_QUEUE_SIZE
+        self.enqueue_timeout = Config.RECORD_ENQUEUE_TIMEOUT
+        self.write_retries = Config.RECORD_WRITE_RETRIES
+        self.retry_backoff = Config.RECORD_RETRY_BACKOFF
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # The thread is started lazily so each forked Celery/Gunicorn child gets its own
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="prompt-record-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, row: dict):
+        """Queue one PromptRecord row (column name -> value) for insertion.
+
+        Within a trace, a "db.persist" span covers the row's wait in the buffer and its commit.
+        """
+        row.setdefault("timestamp", datetime.utcnow())
+        parent = tracing.current_span()
+        row["_span"] = tracing.Span("db.persist", parent) if parent else None
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning("PromptRecord buffer full, writing row synchronously")
+            self._write([row])
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _insert(self, rows: list):
+        with DB_COMMIT_SECONDS.time():
+            db.session.execute(insert(PromptRecord), to_records(rows))
+            db.session.commit()
+
+    def _write(self, rows: list):
+        """Insert a batch, retrying it with backoff, then row by row so one bad row cannot sink the rest."""
+        spans = [row.pop("_span", None) for row in rows]
+        errors = [None] * len(rows)
+        with self.app.app_context():
+            for attempt in range(self.write_retries + 1):
+                try:
+                    self._insert(rows)
+                    break
+                except Exception as e:
+                    db.session.rollback()
+                    if attempt == self.write_retries:
+                        logger.warning(f"Batch of {len(rows)} PromptRecord rows failed, inserting one by one: {e}")
+                        errors = [self._insert_one(row) for row in rows]
+                    else:
+                        time.sleep(self.retry_backoff * 2 ** attempt)
+        for span, error in zip(spans, errors):
+            if span is not None:
+                span.set_attribute("db.batch_size", len(rows))
+                span.end(error=error)
+
+    def _insert_one(self, row: dict):
+        """Insert one row; returns the error, if it could not be."""
+        try:
+            self._insert([row])
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Dropping PromptRecord row ({row.get('model_name')}, {row.get('timestamp')})")
+            return e
+        return None
+
+    def flush(self):
+        """Block until every queued row has been written."""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self, timeout: float = 30):
+        """Stop the writer thread after draining the queue; safe to call more than once."""
+        if self._pid != os.getpid():
+            return
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.warning(f"PromptRecord writer still busy after {timeout}s, "
+                               f"{self._queue.qsize()} queued rows not written")
+                return
+            self._thread.join(timeout)
+            return
+        # Thread already gone: write whatever is left inline
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._write(leftover)
+
+
+record_writer = PromptRecordWriter()
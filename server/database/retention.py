@@ -0,0 +1,320 @@
+import glob
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, or_, update
+from server.config import Config
+from server.database import db
+from server.database.content_store import gc_contents, load_texts, store_texts, to_records
+from server.database.models import PromptRecord
+
+logger = logging.getLogger(__name__)
+
+TABLE = PromptRecord.__tablename__
+ARCHIVE_NAME = "prompt_record-{month}"  # month = YYYY-MM; one file per archive run: <name>.<run>.jsonl.gz
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"p{month:%Y%m}"
+
+
+# ---------------------------
+# MySQL monthly partitions
+# ---------------------------
+def _partition_clause(month: datetime) -> str:
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{next_month(month):%Y-%m-%d}')"
+
+
+def partitions() -> dict:
+    """{partition name: upper bound} of prompt_record; empty when it is not partitioned (or not MySQL)."""
+    if db.engine.dialect.name != "mysql":
+        return {}
+    rows = db.session.execute(sa.text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+    ), {"table": TABLE}).all()
+    return {name: bound for name, bound in rows}
+
+
+def ensure_partitions(months_ahead: int = None) -> list:
+    """Partition prompt_record by month of `timestamp` (MySQL), or add the coming months' partitions.
+
+    The first call rebuilds the table: the primary key becomes (id, timestamp),
+    as MySQL requires the partitioning column in every unique key, and NULL
+    timestamps are set to now. Later calls split the empty catch-all partition
+    `pmax` so there are always `months_ahead` months ready. Returns the
+    partitions created.
+    """
+    if db.engine.dialect.name != "mysql":
+        raise click.ClickException("Partitioning needs MySQL")
+    months_ahead = Config.HISTORY_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    existing = partitions()
+    last = month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = next_month(last)
+
+    if not existing:
+        oldest = db.session.query(func.min(PromptRecord.timestamp)).scalar() or datetime.utcnow()
+        month, months = month_start(oldest), []
+        while month <= last:
+            months.append(month)
+            month = next_month(month)
+        db.session.execute(sa.text(f"UPDATE {TABLE} SET timestamp = UTC_TIMESTAMP() WHERE timestamp IS NULL"))
+        db.session.commit()
+        db.session.execute(sa.text(
+            f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp), "
+            f"MODIFY timestamp DATETIME NOT NULL PARTITION BY RANGE COLUMNS(timestamp) ("
+            + ", ".join(_partition_clause(m) for m in months)
+            + ", PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        ))
+        return [partition_name(m) for m in months]
+
+    newest = max(datetime.strptime(name[1:], "%Y%m") for name in existing if name != "pmax")
+    months = []
+    month = next_month(newest)
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    if months:
+        db.session.execute(sa.text(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION pmax INTO ("
+            + ", ".join(_partition_clause(m) for m in months)
+            + ", PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        ))
+    return [partition_name(m) for m in months]
+
+
+# ---------------------------
+# Archival
+# ---------------------------
+def _record(row, texts: dict) -> dict:
+    return {
+        "id": row.id,
+        "prompt": texts.get(row.prompt_hash, row.prompt_text),
+        "response": texts.get(row.completion_hash, row.completion_text),
+        "model": row.model_name,
+        "streamed": row.streamed,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None
+    }
+
+
+def _month_pages(month: datetime, batch_size: int):
+    """Yield the rows of one month in id order, one keyset page (list) at a time."""
+    last_id = 0
+    while True:
+        rows = (db.session.query(PromptRecord)
+                .filter(PromptRecord.timestamp >= month, PromptRecord.timestamp < next_month(month),
+                        PromptRecord.id > last_id)
+                .order_by(PromptRecord.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+        db.session.expunge_all()
+
+
+def _delete_records(ids: list, batch_size: int):
+    for i in range(0, len(ids), batch_size):
+        db.session.query(PromptRecord).filter(PromptRecord.id.in_(ids[i:i + batch_size])).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def archive_month(month: datetime, archive_dir: str = None, batch_size: int = None) -> int:
+    """Move one month of prompt_record to a gzipped JSONL file; returns the rows archived.
+
+    Rows are streamed to `<name>.<run>.jsonl.tmp.gz`, fsynced and renamed, and
+    only then removed from the table: by dropping the month's partition when
+    it holds exactly what was written, else with batched DELETEs. Contents no
+    other record uses are then garbage-collected.
+    """
+    archive_dir = archive_dir or Config.HISTORY_ARCHIVE_DIR
+    batch_size = batch_size or Config.HISTORY_ARCHIVE_BATCH
+    os.makedirs(archive_dir, exist_ok=True)
+    name = ARCHIVE_NAME.format(month=f"{month:%Y-%m}")
+    run = len(glob.glob(os.path.join(archive_dir, f"{name}.*.jsonl.gz")))
+    path = os.path.join(archive_dir, f"{name}.{run}.jsonl.gz")
+    tmp_path = path.replace(".jsonl.gz", ".jsonl.tmp.gz")
+
+    ids, hashes = [], set()
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for rows in _month_pages(month, batch_size):
+            page_hashes = [h for row in rows for h in (row.prompt_hash, row.completion_hash) if h]
+            texts = load_texts(page_hashes)
+            for row in rows:
+                f.write(json.dumps(_record(row, texts), ensure_ascii=False) + "\n")
+                ids.append(row.id)
+            hashes.update(page_hashes)
+    if ids:
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+
+    # Only the oldest partition can hold rows from before its month (e.g. rehydrated ones),
+    # so it is dropped only once it holds nothing but what was just written
+    partition = partition_name(month)
+    oldest = min((p for p in partitions() if p != "pmax"), default=None)
+    if partition == oldest and db.session.execute(
+            sa.text(f"SELECT COUNT(*) FROM {TABLE} PARTITION ({partition})")).scalar() == len(ids):
+        db.session.execute(sa.text(f"ALTER TABLE {TABLE} DROP PARTITION {partition}"))
+    elif ids:
+        _delete_records(ids, batch_size)
+    if hashes:
+        gc_contents(hashes)
+    if ids:
+        logger.info(f"Archived {len(ids)} prompt records of {month:%Y-%m} to {path}")
+    return len(ids)
+
+
+def archive_expired(retention_days: int = None, archive_dir: str = None) -> dict:
+    """Archive every whole month older than `retention_days`, oldest first; returns {month: rows}.
+
+    A retention of 0 (the default) keeps all history: nothing is archived.
+    """
+    retention_days = Config.HISTORY_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0:
+        return {}
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    starts = [datetime.strptime(p[1:], "%Y%m") for p in partitions() if p != "pmax"]
+    oldest = db.session.query(func.min(PromptRecord.timestamp)).scalar()
+    if oldest:
+        starts.append(month_start(oldest))
+    archived = {}
+    month = min(starts, default=None)
+    while month and next_month(month) <= cutoff:
+        archived[f"{month:%Y-%m}"] = archive_month(month, archive_dir)
+        month = next_month(month)
+    return archived
+
+
+def rehydrate(month: str, archive_dir: str = None, batch_size: int = None) -> int:
+    """Load an archived month (YYYY-MM) back into prompt_record; rows still present are skipped.
+
+    Rehydrated rows keep their ids and timestamps, so the next archive run
+    moves them out again unless HISTORY_RETENTION_DAYS now covers them.
+    """
+    archive_dir = archive_dir or Config.HISTORY_ARCHIVE_DIR
+    batch_size = batch_size or Config.HISTORY_ARCHIVE_BATCH
+    paths = sorted(glob.glob(os.path.join(archive_dir, f"{ARCHIVE_NAME.format(month=month)}.*.jsonl.gz")))
+    if not paths:
+        raise click.ClickException(f"No archive for {month} in {archive_dir}")
+
+    statement = insert(PromptRecord.__table__).prefix_with("IGNORE", dialect="mysql").prefix_with(
+        "OR IGNORE", dialect="sqlite")
+    loaded, rows = 0, []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                rows.append({
+                    "id": record["id"],
+                    "prompt_text": record["prompt"],
+                    "completion_text": record["response"],
+                    "model_name": record["model"],
+                    "streamed": record["streamed"],
+                    "timestamp": datetime.fromisoformat(record["timestamp"]) if record["timestamp"] else None
+                })
+                if len(rows) >= batch_size:
+                    loaded += db.session.execute(statement, to_records(rows)).rowcount
+                    db.session.commit()
+                    rows = []
+    if rows:
+        loaded += db.session.execute(statement, to_records(rows)).rowcount
+        db.session.commit()
+    return loaded
+
+
+def migrate_content(batch_size: int = None) -> int:
+    """Move texts still held in prompt_record's legacy columns into the content store; returns rows moved.
+
+    Safe to interrupt and rerun: each batch commits the contents, the hashes
+    and the cleared columns together.
+    """
+    batch_size = batch_size or Config.HISTORY_ARCHIVE_BATCH
+    moved = 0
+    while True:
+        rows = (db.session.query(PromptRecord.id, PromptRecord.prompt_text, PromptRecord.completion_text)
+                .filter(PromptRecord.prompt_hash.is_(None), PromptRecord.completion_hash.is_(None),
+                        or_(PromptRecord.prompt_text.isnot(None), PromptRecord.completion_text.isnot(None)))
+                .order_by(PromptRecord.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return moved
+        prompts = store_texts([r.prompt_text for r in rows])
+        completions = store_texts([r.completion_text for r in rows])
+        db.session.execute(update(PromptRecord), [{
+            "id": r.id,
+            "prompt_hash": prompt_hash,
+            "prompt_length": len(r.prompt_text) if r.prompt_text is not None else None,
+            "completion_hash": completion_hash,
+            "completion_length": len(r.completion_text) if r.completion_text is not None else None,
+            "prompt_text": None,
+            "completion_text": None
+        } for r, prompt_hash, completion_hash in zip(rows, prompts, completions)])
+        db.session.commit()
+        moved += len(rows)
+
+
+# ---------------------------
+# CLI: flask --app server.app history <command>
+# ---------------------------
+history_cli = AppGroup("history", help="Retention and archival of prompt history.")
+
+
+@history_cli.command("partition", help="Partition prompt_record by month (MySQL), or add upcoming months.")
+@click.option("--months-ahead", default=None, type=int, help="Future months to keep partitions for.")
+def partition_command(months_ahead):
+    created = ensure_partitions(months_ahead)
+    click.echo(f"[INFO]: Created partitions: {', '.join(created) or 'none'}")
+
+
+@history_cli.command("archive", help="Archive months older than the retention window.")
+@click.option("--retention-days", default=None, type=int, help="Override HISTORY_RETENTION_DAYS.")
+def archive_command(retention_days):
+    if (Config.HISTORY_RETENTION_DAYS if retention_days is None else retention_days) <= 0:
+        click.echo("[INFO]: Retention is 0 (keep all), nothing archived")
+        return
+    archived = archive_expired(retention_days)
+    for month, count in archived.items():
+        click.echo(f"[INFO]: {month}: {count} records archived")
+    if not archived:
+        click.echo("[INFO]: Nothing to archive")
+
+
+@history_cli.command("migrate-content", help="Move texts from the legacy prompt_record columns to the content store.")
+def migrate_content_command():
+    click.echo(f"[INFO]: Moved {migrate_content()} records to the content store")
+
+
+@history_cli.command("reindex", help="Move legacy texts to the content store and index every stored text for search.")
+def reindex_command():
+    from server.database.search import rebuild_search_index  # local import: search -> history -> content_store
+
+    click.echo(f"[INFO]: Moved {migrate_content()} records to the content store")
+    try:
+        click.echo(f"[INFO]: Indexed {rebuild_search_index()} contents for search")
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+@history_cli.command("rehydrate", help="Load an archived month (YYYY-MM) back into the database.")
+@click.argument("month")
+def rehydrate_command(month):
+    click.echo(f"[INFO]: Restored {rehydrate(month)} records of {month}")
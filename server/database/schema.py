@@ -0,0 +1,60 @@
+import logging
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from server.database import db
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema(engine):
+    """Bring tables created by an older version up to the models.
+
+    db.create_all() only creates missing tables, so this adds missing nullable
+    columns, drops NOT NULL where a model now allows NULL (MySQL; SQLite
+    cannot alter columns) and creates missing indexes. Cheap when the schema
+    is already current.
+    """
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"]: c for c in inspector.get_columns(table.name)}
+        primary_key = set(inspector.get_pk_constraint(table.name)["constrained_columns"])
+        for column in table.columns:
+            column_type = column.type.compile(dialect=engine.dialect)
+            if column.name not in existing:
+                if not column.nullable:
+                    logger.warning(f"Cannot add NOT NULL column {table.name}.{column.name}, add it by hand")
+                    continue
+                if _alter(engine, table.name, column.name,
+                          f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"):
+                    logger.info(f"Added column {table.name}.{column.name}")
+            elif column.nullable and not existing[column.name]["nullable"] and column.name not in primary_key:
+                if engine.dialect.name != "mysql":
+                    logger.warning(f"{table.name}.{column.name} is NOT NULL but should allow NULL; "
+                                   f"recreate the table")
+                    continue
+                if _alter(engine, table.name, column.name,
+                          f"ALTER TABLE {quote(table.name)} MODIFY {quote(column.name)} {column_type} NULL",
+                          nullable=True):
+                    logger.info(f"Made {table.name}.{column.name} nullable")
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def _alter(engine, table: str, column: str, statement: str, nullable: bool = False) -> bool:
+    """Run one ALTER in its own transaction; False if it failed because another process already applied it.
+
+    Applied means `column` exists (and allows NULL, for `nullable`).
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(sa.text(statement))
+        return True
+    except sa.exc.DBAPIError:
+        if any(c["name"] == column and (c["nullable"] or not nullable) for c in inspect(engine).get_columns(table)):
+            return False
+        raise
@@ -0,0 +1,207 @@
+import logging
+import re
+from datetime import datetime
+import sqlalchemy as sa
+from sqlalchemy import func, inspect, union_all
+from server.config import Config
+from server.database import db
+from server.database.content_store import decode, load_texts
+from server.database.history import filtered, summary, summary_query
+from server.database.models import PromptContent, PromptRecord
+
+logger = logging.getLogger(__name__)
+
+# Full-text index over the stored contents (see content_store), one row per
+# distinct text, filled by store_texts() and emptied by gc_contents(). It is its
+# own table so prompt_record can be partitioned, which InnoDB does not allow for
+# tables with a FULLTEXT index, and so a text repeated across requests is
+# indexed once.
+SEARCH_TABLE = "prompt_content_search"
+
+_MYSQL_DDL = f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+    hash CHAR(64) NOT NULL PRIMARY KEY,
+    body MEDIUMTEXT,
+    FULLTEXT KEY ix_{SEARCH_TABLE}_body (body)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+# FTS5 has no unique key: rows are keyed by a rowid derived from the hash (see _rowid)
+_SQLITE_DDL = f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(hash UNINDEXED, body)"
+
+_indexed = None  # whether SEARCH_TABLE exists, looked up once per process
+
+
+def _rowid(content_hash: str) -> int:
+    return int(content_hash[:15], 16)
+
+
+def ensure_search_index(engine):
+    """Create the (empty) search table if missing; texts stored from then on are indexed as they are written.
+
+    Called at startup by every process, so it only runs a CREATE ... IF NOT
+    EXISTS: indexing what is already stored is `flask history reindex`.
+    Without HISTORY_SEARCH_INDEX, on other databases, or if the database
+    refuses, search falls back to a scan.
+    """
+    global _indexed
+    if not Config.HISTORY_SEARCH_INDEX or engine.dialect.name not in ("mysql", "sqlite"):
+        return
+    inspector = inspect(engine)
+    if inspector.has_table(SEARCH_TABLE):
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(sa.text(_MYSQL_DDL if engine.dialect.name == "mysql" else _SQLITE_DDL))
+        _indexed = None
+        logger.info(f"Created full-text search table {SEARCH_TABLE}")
+    except sa.exc.DBAPIError as e:
+        logger.warning(f"Full-text search unavailable, falling back to scanning: {e}")
+        return
+    if db.session.query(PromptContent.hash).first() is not None:
+        logger.warning("Stored history is not in the search index yet: run `flask --app server.app history reindex`")
+
+
+def rebuild_search_index() -> int:
+    """Index every stored content; returns the contents indexed.
+
+    Run once texts have been moved to the content store (migrate_content), or
+    after turning HISTORY_SEARCH_INDEX on. Safe to interrupt and rerun.
+    """
+    global _indexed
+    ensure_search_index(db.engine)
+    _indexed = None
+    if not _has_index():
+        raise RuntimeError("Full-text search needs MySQL or SQLite, with HISTORY_SEARCH_INDEX on")
+    indexed, last_hash = 0, ""
+    while True:
+        rows = (db.session.query(PromptContent.hash, PromptContent.compression, PromptContent.data)
+                .filter(PromptContent.hash > last_hash)
+                .order_by(PromptContent.hash)
+                .limit(Config.HISTORY_ARCHIVE_BATCH)
+                .all())
+        if not rows:
+            break
+        index_contents({h: decode(compression, data) for h, compression, data in rows})
+        db.session.commit()
+        indexed += len(rows)
+        last_hash = rows[-1].hash
+    return indexed
+
+
+def _has_index() -> bool:
+    global _indexed
+    if _indexed is None:
+        _indexed = db.engine.dialect.name in ("mysql", "sqlite") and inspect(db.engine).has_table(SEARCH_TABLE)
+    return _indexed
+
+
+def search_backend() -> str:
+    """"mysql" (FULLTEXT), "sqlite" (FTS5) or "scan"."""
+    return db.engine.dialect.name if _has_index() else "scan"
+
+
+def index_contents(texts: dict):
+    """Add {hash: text} to the search index, each cut to HISTORY_SEARCH_MAX_CHARS; runs in the caller's transaction."""
+    if not texts or not _has_index():
+        return
+    rows = [{"hash": h, "rowid": _rowid(h), "body": text[:Config.HISTORY_SEARCH_MAX_CHARS]}
+            for h, text in texts.items()]
+    if db.engine.dialect.name == "mysql":
+        db.session.execute(sa.text(f"INSERT IGNORE INTO {SEARCH_TABLE} (hash, body) VALUES (:hash, :body)"), rows)
+    else:
+        # Two writers may both have seen a text as new: replace rather than duplicate
+        db.session.execute(sa.text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :rowid"), rows)
+        db.session.execute(sa.text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, hash, body) VALUES (:rowid, :hash, :body)"), rows)
+
+
+def unindex_contents(hashes: list):
+    """Remove deleted contents from the search index; runs in the caller's transaction."""
+    if not hashes or not _has_index():
+        return
+    if db.engine.dialect.name == "mysql":
+        db.session.execute(sa.text(f"DELETE FROM {SEARCH_TABLE} WHERE hash IN :hashes").bindparams(
+            sa.bindparam("hashes", expanding=True)), {"hashes": list(hashes)})
+    else:
+        db.session.execute(sa.text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN :rowids").bindparams(
+            sa.bindparam("rowids", expanding=True)), {"rowids": [_rowid(h) for h in hashes]})
+
+
+def fts5_query(q: str) -> str:
+    """Words of `q` as quoted FTS5 terms (all required), so user input is never parsed as FTS5 syntax."""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", q))
+
+
+def _matches(q: str):
+    """Subquery of (hash, score) of the contents matching `q`, higher score is better."""
+    if db.engine.dialect.name == "mysql":
+        statement = sa.text(f"SELECT hash, MATCH(body) AGAINST(:q) AS score FROM {SEARCH_TABLE} "
+                            f"WHERE MATCH(body) AGAINST(:q)").bindparams(q=q)
+    else:
+        statement = sa.text(f"SELECT hash, -bm25({SEARCH_TABLE}) AS score FROM {SEARCH_TABLE} "
+                            f"WHERE {SEARCH_TABLE} MATCH :q").bindparams(q=fts5_query(q))
+    return statement.columns(hash=sa.String, score=sa.Float).subquery("matches")
+
+
+def _record_scores(q: str, model_name: str, since: datetime, until: datetime):
+    """Subquery of (id, score) of the records matching `q`: the best score of their prompt or response."""
+    contents = _matches(q)
+    branches = [
+        filtered(sa.select(PromptRecord.id.label("id"), contents.c.score.label("score"))
+                 .join(contents, contents.c.hash == column), model_name, since, until)
+        for column in (PromptRecord.prompt_hash, PromptRecord.completion_hash)
+    ]
+    scores = union_all(*branches).subquery("scores")
+    return sa.select(scores.c.id, func.max(scores.c.score).label("score")).group_by(scores.c.id).subquery("best")
+
+
+def _scan(words: list, limit: int, offset: int, model_name: str, since: datetime, until: datetime) -> list:
+    """Ids of the newest records whose prompt or response holds every word (any case), reading full texts."""
+    words = [word.lower() for word in words]
+    ids, before_id = [], None
+    while len(ids) < offset + limit:
+        query = filtered(db.session.query(PromptRecord.id, PromptRecord.prompt_hash, PromptRecord.completion_hash,
+                                          PromptRecord.prompt_text, PromptRecord.completion_text),
+                         model_name, since, until)
+        if before_id:
+            query = query.filter(PromptRecord.id < before_id)
+        rows = query.order_by(PromptRecord.id.desc()).limit(Config.HISTORY_ARCHIVE_BATCH).all()
+        if not rows:
+            break
+        texts = load_texts([h for r in rows for h in (r.prompt_hash, r.completion_hash)])
+        for r in rows:
+            record = [(text or "").lower() for text in (texts.get(r.prompt_hash, r.prompt_text),
+                                                        texts.get(r.completion_hash, r.completion_text))]
+            if all(any(word in text for text in record) for word in words):
+                ids.append(r.id)
+        before_id = rows[-1].id
+    return ids[offset:offset + limit]
+
+
+def search_history(q: str, limit: int = 20, offset: int = 0, model_name: str = None,
+                   since: datetime = None, until: datetime = None) -> dict:
+    """History previews matching `q`, most relevant first, with a "score" (higher is better).
+
+    MySQL uses natural-language FULLTEXT relevance, SQLite FTS5's bm25; a
+    record scores as its best matching prompt or response, and the filters,
+    ranking and paging all run in the one query. The scan fallback (no index)
+    requires every word in the prompt or response, reads the full texts page
+    by page, has no relevance score and returns newest first.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        raise ValueError("Query has no searchable words")
+    limit = max(1, min(limit, Config.HISTORY_MAX_LIMIT))
+    backend = search_backend()
+
+    if backend == "scan":
+        ids = _scan(words, limit, offset, model_name, since, until)
+        rows = summary_query(sa.null().label("score")).filter(PromptRecord.id.in_(ids)) \
+            .order_by(PromptRecord.id.desc()).all() if ids else []
+    else:
+        best = _record_scores(q, model_name, since, until)
+        rows = summary_query(best.c.score).join(best, best.c.id == PromptRecord.id) \
+            .order_by(best.c.score.desc(), PromptRecord.id.desc()).offset(offset).limit(limit).all()
+    return {
+        "results": [{**summary(r), "score": r.score} for r in rows],
+        "next_offset": offset + limit if len(rows) == limit else None,
+        "backend": backend
+    }
@@ -0,0 +1,288 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects import mysql, sqlite
+from server.config import Config
+from server.database import db
+from server.database.models import UsageRollup
+from server.infrastructure import tracing
+from server.infrastructure.metrics import LLM_FIRST_TOKEN_SECONDS, LLM_REQUEST_SECONDS, UPSTREAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+HOUR, DAY = "hour", "day"
+SUMMED = ("requests", "prompt_tokens", "completion_tokens", "errors", "latency_sum")
+KEY = ("granularity", "bucket", "model_name")
+
+
+def hour_bucket(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _empty(granularity: str, bucket: datetime, model_name: str) -> dict:
+    return {"granularity": granularity, "bucket": bucket, "model_name": model_name,
+            **{field: 0 for field in SUMMED}, "latency_max": 0.0}
+
+
+def _values(row: UsageRollup) -> dict:
+    return {field: getattr(row, field) for field in SUMMED + ("latency_max",)}
+
+
+def _merge(into: dict, values: dict) -> dict:
+    for field in SUMMED:
+        into[field] += values[field]
+    into["latency_max"] = max(into["latency_max"], values["latency_max"])
+    return into
+
+
+def upsert_rollups(rows: list):
+    """Add `rows` (UsageRollup column dicts) onto the stored counters; runs in the caller's transaction."""
+    if not rows:
+        return
+    table = UsageRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            **{field: table.c[field] + statement.inserted[field] for field in SUMMED},
+            latency_max=func.greatest(table.c.latency_max, statement.inserted.latency_max))
+        db.session.execute(statement, rows)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(KEY),
+            set_={**{field: table.c[field] + statement.excluded[field] for field in SUMMED},
+                  "latency_max": func.max(table.c.latency_max, statement.excluded.latency_max)})
+        db.session.execute(statement, rows)
+    else:
+        for row in rows:
+            stored = db.session.get(UsageRollup, tuple(row[k] for k in KEY), with_for_update=True)
+            if stored is None:
+                db.session.add(UsageRollup(**row))
+            else:
+                for field in SUMMED:
+                    setattr(stored, field, getattr(stored, field) + row[field])
+                stored.latency_max = max(stored.latency_max, row["latency_max"])
+
+
+class ProviderCall:
+    """One provider call being tracked: set `usage`, call first_token() when the first chunk arrives."""
+
+    def __init__(self, model_name: str, span: tracing.Span):
+        self.model_name = model_name
+        self.span = span
+        self.usage = None
+        self.started = time.monotonic()
+        self._first_token = False
+
+    def first_token(self):
+        if self._first_token:
+            return
+        self._first_token = True
+        LLM_FIRST_TOKEN_SECONDS.labels(self.model_name).observe(time.monotonic() - self.started)
+        tracing.Span("llm.first_token", self.span, start_ns=self.span.start_ns, model=self.model_name).end()
+
+
+class UsageRollupWriter:
+    """Hourly per-model call counters (requests, tokens, errors, latency) kept in UsageRollup.
+
+    record() only adds to an in-memory bucket; a background thread upserts
+    pending buckets (one row per model and hour) every USAGE_FLUSH_INTERVAL
+    seconds, and they are flushed on process exit. A failed flush keeps its
+    counts for the next one.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_interval = Config.USAGE_FLUSH_INTERVAL
+        self._pending = {}  # {(hour, model): row}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        # Started lazily so each forked Celery/Gunicorn child gets its own thread
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="usage-rollup-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Usage rollup flush failed: {e}")
+
+    def record(self, model_name: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+               ok: bool = True):
+        """Count one call in memory (never touches the database)."""
+        hour = hour_bucket(datetime.utcnow())
+        with self._lock:
+            row = self._pending.get((hour, model_name))
+            if row is None:
+                row = self._pending[(hour, model_name)] = _empty(HOUR, hour, model_name)
+            _merge(row, {"requests": 1, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "errors": 0 if ok else 1, "latency_sum": latency, "latency_max": latency})
+        if self.app is not None:
+            self._ensure_started()
+
+    @contextmanager
+    def track(self, model_name: str, stream: bool = False):
+        """Time one provider call; set `.usage` on the yielded ProviderCall to the response's usage.
+
+        An exception counts the call as an error and propagates. The call is
+        also observed in the llm_request_duration_seconds / llm_upstream_errors_total
+        metrics and traced as an "llm.call" span. The span is never made current:
+        streaming calls are tracked inside generators, where it would stay
+        current in the consumer between chunks.
+        """
+        span = tracing.Span("llm.call", tracing.current_span(), model=model_name, stream=stream)
+        call = ProviderCall(model_name, span)
+        try:
+            yield call
+        except Exception as e:
+            latency = time.monotonic() - call.started
+            LLM_REQUEST_SECONDS.labels(model_name).observe(latency)
+            UPSTREAM_ERRORS.labels(model_name, type(e).__name__).inc()
+            self.record(model_name, latency, ok=False)
+            span.end(error=e)
+            raise
+        except BaseException:
+            span.end()  # stream closed early (GeneratorExit)
+            raise
+        prompt_tokens = getattr(call.usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(call.usage, "completion_tokens", None) or 0
+        latency = time.monotonic() - call.started
+        LLM_REQUEST_SECONDS.labels(model_name).observe(latency)
+        if stream:
+            span.add_event("last_token")
+        span.set_attribute("llm.prompt_tokens", prompt_tokens)
+        span.set_attribute("llm.completion_tokens", completion_tokens)
+        span.end()
+        self.record(model_name, latency, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def flush(self):
+        if self.app is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with self.app.app_context():
+            try:
+                upsert_rollups(list(pending.values()))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Usage rollup flush failed, keeping {len(pending)} pending buckets: {e}")
+                with self._lock:
+                    for key, row in pending.items():
+                        if key in self._pending:
+                            _merge(self._pending[key], row)
+                        else:
+                            self._pending[key] = row
+
+
+usage_rollups = UsageRollupWriter()
+
+
+def compact_rollups(hourly_days: int = None) -> int:
+    """Fold hourly rows older than `hourly_days` (whole UTC days) into daily rows; returns days compacted.
+
+    Each day is folded and its hourly rows deleted in one transaction, with
+    the hourly rows locked (MySQL) so a late flush cannot slip in between.
+    """
+    hourly_days = Config.USAGE_ROLLUP_HOURLY_DAYS if hourly_days is None else hourly_days
+    cutoff = day_bucket(datetime.utcnow() - timedelta(days=hourly_days))
+    compacted = 0
+    while True:
+        oldest = db.session.query(func.min(UsageRollup.bucket)).filter(
+            UsageRollup.granularity == HOUR, UsageRollup.bucket < cutoff).scalar()
+        if oldest is None:
+            return compacted
+        day = day_bucket(oldest)
+        in_day = (UsageRollup.granularity == HOUR, UsageRollup.bucket >= day,
+                  UsageRollup.bucket < day + timedelta(days=1))
+        daily = {}
+        for row in db.session.query(UsageRollup).filter(*in_day).with_for_update().all():
+            _merge(daily.setdefault(row.model_name, _empty(DAY, day, row.model_name)), _values(row))
+        upsert_rollups(list(daily.values()))
+        db.session.query(UsageRollup).filter(*in_day).delete(synchronize_session=False)
+        db.session.commit()
+        compacted += 1
+
+
+def _summary(row: dict) -> dict:
+    summary = {
+        "requests": row["requests"],
+        "prompt_tokens": row["prompt_tokens"],
+        "completion_tokens": row["completion_tokens"],
+        "errors": row["errors"],
+        "latency_avg": round(row["latency_sum"] / row["requests"], 4) if row["requests"] else None,
+        "latency_max": round(row["latency_max"], 4)
+    }
+    if row["bucket"] is None:
+        return summary
+    return {"bucket": row["bucket"].isoformat(), "granularity": row["granularity"], "model": row["model_name"],
+            **summary}
+
+
+def query_usage(since: datetime, until: datetime, model_name: str = None, granularity: str = HOUR) -> dict:
+    """Usage per bucket and per model over [since, until), read from the rollups only.
+
+    With granularity="day" hourly rows are summed into days. With "hour",
+    periods already compacted come back as daily buckets (their
+    "granularity" says which), counted whole if `since` falls within the day.
+    """
+    if granularity not in (HOUR, DAY):
+        raise ValueError(f"granularity must be '{HOUR}' or '{DAY}'")
+    # A compacted day is stamped at midnight: bound daily rows by the day `since` falls in
+    query = db.session.query(UsageRollup).filter(
+        or_(and_(UsageRollup.granularity == DAY, UsageRollup.bucket >= day_bucket(since)),
+            and_(UsageRollup.granularity == HOUR,
+                 UsageRollup.bucket >= (day_bucket(since) if granularity == DAY else hour_bucket(since)))),
+        UsageRollup.bucket < until)
+    if model_name:
+        query = query.filter(UsageRollup.model_name == model_name)
+
+    buckets, totals = {}, {}
+    for row in query.order_by(UsageRollup.bucket, UsageRollup.model_name):
+        values = _values(row)
+        if granularity == DAY:
+            key = (day_bucket(row.bucket), row.model_name)
+            _merge(buckets.setdefault(key, _empty(DAY, key[0], row.model_name)), values)
+        else:
+            buckets[(row.bucket, row.model_name, row.granularity)] = _merge(
+                _empty(row.granularity, row.bucket, row.model_name), values)
+        _merge(totals.setdefault(row.model_name, _empty(None, None, row.model_name)), values)
+
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "granularity": granularity,
+        "buckets": [_summary(row) for row in sorted(buckets.values(), key=lambda r: (r["bucket"], r["model_name"]))],
+        "totals": {model: _summary(row) for model, row in sorted(totals.items())}
+    }
+
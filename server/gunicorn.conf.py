@@ -0,0 +1,16 @@
+# Gunicorn hooks for the multi-process Prometheus metrics (server/infrastructure/metrics.py).
+# Loaded with `gunicorn -c server/gunicorn.conf.py` (see docker-compose.yml).
+
+
+def on_starting(server):
+    from server.config import Config
+    if Config.METRICS_ENABLED:
+        from server.infrastructure import metrics
+        metrics.reset_samples()
+
+
+def child_exit(server, worker):
+    from server.config import Config
+    if Config.METRICS_ENABLED:
+        from server.infrastructure import metrics
+        metrics.process_exited(worker.pid)
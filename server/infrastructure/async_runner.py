@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from server.config import Config
+
+
+class AsyncRunner:
+    """Runs coroutines on one background event loop per process.
+
+    Worker threads hand their coroutine to the loop and block on the result, so
+    hundreds of in-flight LLM calls share one process, one loop and one
+    AsyncOpenAI connection pool. At most `concurrency` coroutines run at once;
+    the rest wait on the semaphore. Blocking hops made with asyncio.to_thread
+    (DB, Redis, circuit and rate-limit round trips) run on a default executor
+    of as many threads, not the loop's stock min(32, cpus + 4). Each coroutine runs inside the Flask app
+    context given to init_app() and sees the calling thread's context variables.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._loop = None
+        self._pid = None
+        self._semaphore = None
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.concurrency = Config.ASYNC_LLM_CONCURRENCY
+
+    def _ensure_loop(self):
+        # Started lazily so each forked worker process gets its own loop thread
+        if self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="llm-blocking")
+                loop.set_default_executor(self._executor)
+                threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                self._loop = loop
+                self._pid = os.getpid()
+        return self._loop
+
+    async def _limited(self, coro, context):
+        # Each task runs in its own copy of the loop's context, so this stays local to it
+        for var, value in context.items():
+            var.set(value)
+        async with self._semaphore:
+            with self.app.app_context():
+                return await coro
+
+    def run(self, coro, timeout: float = None):
+        """Run `coro` on the loop and return its result (blocking the calling thread)."""
+        loop = self._ensure_loop()
+        context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(self._limited(coro, context), loop).result(timeout)
+
+    def iterate(self, agen, timeout: float = None):
+        """Drive an async generator on the loop, yielding its items to the calling thread."""
+        loop = self._ensure_loop()
+        items = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except Exception as e:
+                items.put((done, e))
+                return
+            items.put((done, None))
+
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(self._limited(pump(), context), loop)
+        try:
+            while True:
+                item, error = items.get(timeout=timeout)
+                if item is done:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+
+async_runner = AsyncRunner()
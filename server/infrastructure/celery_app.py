@@ -1,9 +1,24 @@
+import time
 from celery import Celery
+from celery.signals import before_task_publish
+from kombu import Queue
 from server.config import Config
+from server.infrastructure import tracing
+
+BROKER_DB = 0
+
+# Priority lanes, each its own queue so bulk work never sits in front of interactive prompts
+LANES = ("interactive", "default", "bulk")
+
+
+def lane_queue(lane: str) -> str:
+    """Broker queue name for a lane."""
+    return f"{Config.QUEUE_NAME}.{lane}"
+
 
 celery_app = Celery(
     "server",
-    broker=f"redis://:{Config.REDIS_PASSWORD}@{Config.REDIS_HOST}:{Config.REDIS_PORT}/0",
+    broker=f"redis://:{Config.REDIS_PASSWORD}@{Config.REDIS_HOST}:{Config.REDIS_PORT}/{BROKER_DB}",
     backend=f"redis://:{Config.REDIS_PASSWORD}@{Config.REDIS_HOST}:{Config.REDIS_PORT}/1"
 )
 
@@ -13,7 +28,41 @@ celery_app.conf.update(
     accept_content=["json"],
     timezone="UTC",
     enable_utc=True,
+    # A worker consumes only the lanes in WORKER_LANES, so each lane gets its own pool size
+    task_queues=[Queue(lane_queue(lane)) for lane in Config.WORKER_LANES if lane in LANES],
+    task_default_queue=lane_queue("default"),
+    # Default lane per task; requests may pick another one (queue=...)
+    task_routes={
+        "process_prompt": {"queue": lane_queue("interactive")},
+        "process_conversation": {"queue": lane_queue("default")},
+        "process_batch_chunk": {"queue": lane_queue("bulk")},
+        "archive_history": {"queue": lane_queue("bulk")},
+        "compact_usage": {"queue": lane_queue("bulk")},
+        "recover_batches": {"queue": lane_queue("bulk")},
+    },
+    # LLM tasks are long: don't let one busy process hoard queued messages
+    worker_prefetch_multiplier=Config.CELERY_PREFETCH_MULTIPLIER,
 )
 
+# Periodic jobs, run by `celery beat`
+celery_app.conf.beat_schedule = {
+    "compact-usage": {"task": "compact_usage", "schedule": Config.USAGE_ROLLUP_COMPACT_INTERVAL * 3600},
+    "recover-batches": {"task": "recover_batches", "schedule": Config.BATCH_CLAIM_TIMEOUT / 2},
+}
+if Config.HISTORY_RETENTION_DAYS:
+    celery_app.conf.beat_schedule["archive-history"] = {
+        "task": "archive_history", "schedule": Config.HISTORY_ARCHIVE_INTERVAL * 3600
+    }
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    """Record when a task was published and the current trace span; workers read them back as
+    request.enqueued_at (queue wait metric) and request.traceparent (tracing)."""
+    if headers is not None:
+        headers["enqueued_at"] = time.time()
+        tracing.inject(headers)
+
+
 # Auto-discover tasks in the jobs package
 celery_app.autodiscover_tasks(["server.jobs"])
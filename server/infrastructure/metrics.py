@@ -0,0 +1,98 @@
+import glob
+import logging
+import os
+from server.config import Config
+
+# Multiprocess mode has to be chosen before prometheus_client is imported: each
+# Gunicorn worker / Celery child then writes its samples to mmap files in this
+# directory (a memory write per observation, no network or syscalls), and
+# whoever serves a scrape sums the files. Every service needs its own directory.
+if Config.METRICS_ENABLED:
+    os.makedirs(Config.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", Config.PROMETHEUS_MULTIPROC_DIR)
+
+from flask import Response
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest,
+                               multiprocess, start_http_server)
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Upstream LLM call duration, whole stream for streamed calls.",
+    ["model"], buckets=LATENCY_BUCKETS)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds", "Time from sending a streamed LLM call to its first chunk.",
+    ["model"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32))
+UPSTREAM_ERRORS = Counter(
+    "llm_upstream_errors_total", "Failed upstream LLM calls, by exception type.", ["model", "error"])
+RETRIES = Counter(
+    "llm_retries_total", "Retries scheduled, by exception type; scope is in_process (sleep) or task (re-queued).",
+    ["error", "scope"])
+TASK_WAIT_SECONDS = Histogram(
+    "celery_task_wait_seconds", "Time from publishing a task (or its ETA) to a worker starting it.",
+    ["queue"], buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900))
+DB_COMMIT_SECONDS = Histogram(
+    "db_commit_duration_seconds", "Duration of one PromptRecord batch insert and commit.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Lookups by cache (response, single_flight) and result (hit, miss, and for "
+    "single_flight leader: the first task, calling the provider for the others).",
+    ["cache", "result"])
+
+
+class QueueDepthCollector:
+    """Messages waiting per lane queue, read from the broker when scraped."""
+
+    def collect(self):
+        from server.jobs.job_status import queue_depths  # local import: job_status -> celery_app -> config
+
+        gauge = GaugeMetricFamily("celery_queue_depth", "Messages waiting in each lane's broker queue.",
+                                  labels=["queue"])
+        try:
+            for lane in queue_depths().values():
+                gauge.add_metric([lane["queue"]], lane["depth"])
+        except Exception as e:
+            logger.warning(f"Queue depth unavailable for metrics: {e}")
+            return
+        yield gauge
+
+
+def registry(queue_depth: bool = False) -> CollectorRegistry:
+    """A registry summing every process's samples, plus broker queue depths if asked."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if queue_depth:
+        registry.register(QueueDepthCollector())
+    return registry
+
+
+def metrics_view():
+    """GET /metrics: Prometheus text format for every worker process of this service."""
+    return Response(generate_latest(registry(queue_depth=True)), content_type=CONTENT_TYPE_LATEST)
+
+
+def start_exporter(port: int = None):
+    """Serve /metrics from a background thread (Celery main process, before the pool forks)."""
+    port = Config.METRICS_WORKER_PORT if port is None else port
+    start_http_server(port, registry=registry())
+    logger.info(f"Metrics exporter listening on :{port}")
+
+
+def reset_samples():
+    """Delete the previous run's sample files; call from the parent process before any worker starts.
+
+    The caller's own files are kept: it may have recorded samples already
+    (e.g. a Celery main process that also runs tasks with the threads pool).
+    """
+    own = f"_{os.getpid()}.db"
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        if not path.endswith(own):
+            os.remove(path)
+
+
+def process_exited(pid: int):
+    """Drop a dead worker's live gauges (its counters and histograms keep counting)."""
+    multiprocess.mark_process_dead(pid)
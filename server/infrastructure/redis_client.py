@@ -0,0 +1,23 @@
+from redis import Redis
+from server.config import Config
+
+# One client (and connection pool) per logical database, per process.
+# redis-py pools detect forks, so clients created before Celery/Gunicorn fork stay safe.
+_clients = {}
+
+
+def get_redis(db: int = None) -> Redis:
+    """Return the shared Redis client for `db` (defaults to the application database)."""
+    if db is None:
+        db = Config.REDIS_APP_DB
+
+    client = _clients.get(db)
+    if client is None:
+        client = Redis(
+            host=Config.REDIS_HOST,
+            port=Config.REDIS_PORT,
+            password=Config.REDIS_PASSWORD,
+            db=db,
+        )
+        _clients[db] = client
+    return client
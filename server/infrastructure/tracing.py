@@ -0,0 +1,246 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import requests
+from server.config import Config
+
+logger = logging.getLogger(__name__)
+
+# W3C trace context header: version-trace_id-parent_span_id-flags
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+STATUS_OK, STATUS_ERROR = 1, 2  # OTLP status codes
+
+_current = ContextVar("trace_span", default=None)
+
+
+class SpanContext:
+    """Identity of a span, local or received in a traceparent header."""
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span(SpanContext):
+    """One timed operation, exported in the OTLP/JSON span layout when it ends (if sampled)."""
+    __slots__ = ("name", "parent_id", "start_ns", "end_ns", "attributes", "events", "status")
+
+    def __init__(self, name: str, parent: SpanContext = None, start_ns: int = None, **attributes):
+        if parent is None:
+            super().__init__(os.urandom(16).hex(), os.urandom(8).hex(), random.random() < Config.TRACE_SAMPLE_RATE)
+        else:
+            super().__init__(parent.trace_id, os.urandom(8).hex(), parent.sampled)
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.events = []
+        self.status = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append((name, time.time_ns(), attributes))
+
+    def end(self, error: BaseException = None, end_ns: int = None):
+        """Finish the span (once) and hand it to the exporter."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if error is not None:
+            self.status = (STATUS_ERROR, f"{type(error).__name__}: {error}")
+        if self.sampled:
+            span_exporter.export(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # internal
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "events": [{"name": name, "timeUnixNano": str(at), "attributes": _attributes(attributes)}
+                       for name, at, attributes in self.events],
+            "status": {"code": self.status[0], "message": self.status[1]} if self.status else {"code": STATUS_OK}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _attributes(values: dict) -> list:
+    def value(v):
+        if isinstance(v, bool):
+            return {"boolValue": v}
+        if isinstance(v, int):
+            return {"intValue": str(v)}
+        if isinstance(v, float):
+            return {"doubleValue": v}
+        return {"stringValue": str(v)}
+    return [{"key": k, "value": value(v)} for k, v in values.items()]
+
+
+def parse_traceparent(value: str) -> Optional[SpanContext]:
+    """SpanContext from a traceparent header, or None if missing or malformed."""
+    match = TRACEPARENT.match((value or "").strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None
+    return SpanContext(match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace_id if span else None
+
+
+def add_event(name: str, **attributes):
+    """Add an event to the current span, if any."""
+    span = _current.get()
+    if span is not None:
+        span.add_event(name, **attributes)
+
+
+def inject(headers: dict):
+    """Put the current span in `headers` as traceparent (Celery task headers, outgoing HTTP)."""
+    span = _current.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent
+
+
+def activate(span: Span):
+    """Make `span` the current one; returns a token for deactivate()."""
+    return _current.set(span)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str, parent: SpanContext = None, **attributes):
+    """Run the block in a new span, child of `parent` or else of the current span (a new trace if none).
+
+    The span stays current across any yield inside the block, so generators
+    should end a plain Span themselves instead (see UsageRollupWriter.track).
+    """
+    s = Span(name, parent or _current.get(), **attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.end(error=e)
+        raise
+    finally:
+        s.end()
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # closed from another context (a generator finalized elsewhere): nothing of ours to restore
+
+
+class SpanExporter:
+    """Write-behind exporter: ended spans are queued and a background thread ships them in batches.
+
+    TRACE_EXPORTER selects the target: "file" appends one JSON span per line
+    to TRACE_FILE, "otlp" POSTs OTLP/JSON to TRACE_OTLP_ENDPOINT (e.g. an
+    OpenTelemetry collector's /v1/traces), "none" drops them. The queue is
+    bounded and never blocks a request: when full, spans are dropped.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._dropped = 0
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        # Started lazily so each forked Celery/Gunicorn child gets its own thread
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=Config.TRACE_QUEUE_SIZE)
+            if Config.TRACE_EXPORTER == "file":
+                os.makedirs(os.path.dirname(os.path.abspath(Config.TRACE_FILE)), exist_ok=True)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def export(self, span: Span):
+        if Config.TRACE_EXPORTER == "none":
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self._dropped += 1
+            if self._dropped % 1000 == 1:
+                logger.warning(f"Span export queue full, {self._dropped} spans dropped so far")
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + Config.TRACE_FLUSH_MS / 1000
+            while len(batch) < Config.TRACE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning(f"Failed to export {len(batch)} spans: {e}")
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, spans: list):
+        if Config.TRACE_EXPORTER == "file":
+            lines = "".join(json.dumps({"service": Config.TRACE_SERVICE_NAME, **s.to_otlp()}) + "\n"
+                            for s in spans)
+            # One append per batch: O_APPEND keeps lines from several processes whole
+            with open(Config.TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(lines)
+        elif Config.TRACE_EXPORTER == "otlp":
+            payload = {"resourceSpans": [{
+                "resource": {"attributes": _attributes({"service.name": Config.TRACE_SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": "openfreeai"}, "spans": [s.to_otlp() for s in spans]}]
+            }]}
+            requests.post(Config.TRACE_OTLP_ENDPOINT, json=payload, timeout=5).raise_for_status()
+
+    def flush(self):
+        """Block until every queued span has been exported."""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.join()
+
+
+span_exporter = SpanExporter()
@@ -0,0 +1,324 @@
+# server/jobs/batch.py
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from array import array
+from server.config import Config
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+BATCH_KEY = "batch:{batch_id}"  # hash: settings and progress counters
+CHUNKS_KEY = "batch:{batch_id}:chunks"  # list of chunks not yet claimed by a runner
+CLAIMED_KEY = "batch:{batch_id}:claimed"  # sorted set: chunks being run, scored by when their claim expires
+DONE_KEY = "batch:{batch_id}:done"  # bitmap: bit N set once row N succeeded
+FAILED_KEY = "batch:{batch_id}:failed"  # bitmap: bit N set once row N failed for good
+
+INT_FIELDS = ("total", "done", "failed", "offset", "chunk_size", "concurrency", "run")
+FLOAT_FIELDS = ("created_at", "finished_at")
+
+# Chunks whose claim expired (their runner died or was lost) go back on the list
+_RECOVER = """
+local expired = redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])
+for _, chunk in ipairs(expired) do
+    redis.call('zrem', KEYS[2], chunk)
+    redis.call('rpush', KEYS[1], chunk)
+end
+"""
+_RECOVER_SCRIPT = _RECOVER + "return #expired"
+# ...then claim the next one until ARGV[2]
+_CLAIM_SCRIPT = _RECOVER + """
+local chunk = redis.call('lpop', KEYS[1])
+if chunk then
+    redis.call('zadd', KEYS[2], ARGV[2], chunk)
+    redis.call('expire', KEYS[2], ARGV[3])
+end
+return chunk
+"""
+OUTPUT_ROW = re.compile(rb'^\{"row": (\d+)')  # append_output writes "row" first
+
+
+def batch_dir(batch_id: str) -> str:
+    return os.path.join(Config.BATCH_DIR, batch_id)
+
+
+def resolve_input(path: str) -> str:
+    """Absolute path of a server-side input file; it must live under BATCH_INPUT_DIR."""
+    root = os.path.realpath(Config.BATCH_INPUT_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Batch input must be under {Config.BATCH_INPUT_DIR}")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"Batch input '{path}' not found")
+    return resolved
+
+
+def plan_chunks(path: str, chunk_size: int, offset: int = 0):
+    """Scan the input once; returns (rows, chunks) with chunks as {"first_row", "byte_offset", "count"}.
+
+    Rows are the non-blank lines, numbered from 0. Rows before `offset` are
+    not planned. Chunks remember where they start in the file so a runner
+    seeks straight to its rows instead of re-reading everything before them.
+    """
+    rows, chunks = 0, []
+    with open(path, "rb") as f:
+        position = 0
+        for line in f:
+            if line.strip():
+                if rows >= offset:
+                    if not chunks or chunks[-1]["count"] == chunk_size:
+                        chunks.append({"first_row": rows, "byte_offset": position, "count": 0})
+                    chunks[-1]["count"] += 1
+                rows += 1
+            position += len(line)
+    return rows, chunks
+
+
+def read_rows(path: str, chunk: dict):
+    """Yield (row_number, line) for the rows of `chunk`."""
+    row = chunk["first_row"]
+    end = row + chunk["count"]
+    with open(path, "rb") as f:
+        f.seek(chunk["byte_offset"])
+        for line in f:
+            if row >= end:
+                return
+            if line.strip():
+                yield row, line.decode("utf-8")
+                row += 1
+
+
+def create_batch(input_path: str, model: str = None, chunk_size: int = None, concurrency: int = None,
+                 offset: int = 0, use_cache: bool = True, batch_id: str = None) -> dict:
+    """Register a batch over `input_path`; the caller then start()s it."""
+    batch_id = batch_id or uuid.uuid4().hex
+    os.makedirs(batch_dir(batch_id), exist_ok=True)
+    chunk_size = chunk_size or Config.BATCH_CHUNK_SIZE
+    total, _ = plan_chunks(input_path, chunk_size)
+    meta = {
+        "id": batch_id,
+        "input": input_path,
+        "output": os.path.join(batch_dir(batch_id), "output.jsonl"),
+        "model": model or "",
+        "total": total,
+        "done": 0,
+        "failed": 0,
+        "offset": min(offset, total),
+        "chunk_size": chunk_size,
+        "concurrency": min(concurrency or Config.BATCH_CONCURRENCY, Config.BATCH_MAX_CONCURRENCY),
+        "cache": int(use_cache),
+        "run": 0,
+        "status": "queued",
+        "created_at": time.time(),
+        "finished_at": ""
+    }
+    redis = get_redis()
+    key = BATCH_KEY.format(batch_id=batch_id)
+    pipe = redis.pipeline()
+    pipe.delete(key, DONE_KEY.format(batch_id=batch_id), FAILED_KEY.format(batch_id=batch_id))
+    pipe.hset(key, mapping=meta)
+    pipe.expire(key, Config.BATCH_META_TTL)
+    pipe.execute()
+    return meta
+
+
+def start(batch_id: str, retry_failed: bool = False) -> dict:
+    """(Re)queue every unfinished row of a batch on `concurrency` runner tasks.
+
+    Each start bumps the batch's run number; runners of an earlier run stop at
+    their next row, so resuming a batch that is still running does not double
+    the concurrency. Rows already marked done (or failed, unless
+    `retry_failed`) are skipped by the runners.
+    """
+    from server.jobs.tasks import process_batch_chunk  # local import to avoid circular import
+
+    meta = get_batch(batch_id)
+    if meta is None:
+        raise KeyError(batch_id)
+    _, chunks = plan_chunks(meta["input"], meta["chunk_size"], meta["offset"])
+
+    redis = get_redis()
+    key = BATCH_KEY.format(batch_id=batch_id)
+    chunks_key = CHUNKS_KEY.format(batch_id=batch_id)
+    pipe = redis.pipeline()
+    if retry_failed:
+        pipe.delete(FAILED_KEY.format(batch_id=batch_id))
+        pipe.hset(key, "failed", 0)
+    pipe.delete(chunks_key, CLAIMED_KEY.format(batch_id=batch_id))
+    if chunks:
+        pipe.rpush(chunks_key, *[json.dumps(chunk) for chunk in chunks])
+        pipe.expire(chunks_key, Config.BATCH_META_TTL)
+    pipe.hincrby(key, "run", 1)
+    pipe.hset(key, mapping={"status": "running", "finished_at": ""})
+    pipe.expire(key, Config.BATCH_META_TTL)
+    run = pipe.execute()[-3]
+
+    for _ in range(min(meta["concurrency"], len(chunks))):
+        process_batch_chunk.apply_async(args=[batch_id, run])
+    if not chunks:
+        _finish_if_complete(batch_id)
+    return get_batch(batch_id)
+
+
+def get_batch(batch_id: str):
+    """Settings and progress of a batch, or None if unknown (or expired)."""
+    raw = get_redis().hgetall(BATCH_KEY.format(batch_id=batch_id))
+    if not raw:
+        return None
+    meta = {k.decode(): v.decode() for k, v in raw.items()}
+    for field in INT_FIELDS:
+        meta[field] = int(meta[field])
+    for field in FLOAT_FIELDS:
+        meta[field] = float(meta[field]) if meta[field] else None
+    meta["cache"] = meta["cache"] == "1"
+    meta["pending"] = max(meta["total"] - meta["offset"] - meta["done"] - meta["failed"], 0)
+    return meta
+
+
+def _chunk_keys(batch_id: str) -> list:
+    return [CHUNKS_KEY.format(batch_id=batch_id), CLAIMED_KEY.format(batch_id=batch_id)]
+
+
+def claim_chunk(batch_id: str, run: int):
+    """Next unclaimed chunk for a runner of `run`, or None when there is nothing left (or a newer run took over).
+
+    The claim lasts BATCH_CLAIM_TIMEOUT seconds, renewed by touch_chunk() per
+    row: if the runner dies, the chunk goes back on the list for another runner.
+    """
+    redis = get_redis()
+    current = redis.hget(BATCH_KEY.format(batch_id=batch_id), "run")
+    if current is None or int(current) != run:
+        return None
+    now = time.time()
+    raw = redis.register_script(_CLAIM_SCRIPT)(
+        keys=_chunk_keys(batch_id), args=[now, now + Config.BATCH_CLAIM_TIMEOUT, Config.BATCH_META_TTL])
+    return json.loads(raw) if raw else None
+
+
+def touch_chunk(batch_id: str, chunk: dict) -> bool:
+    """Renew a chunk's claim; False if it was given up meanwhile (another runner may have it now)."""
+    member = json.dumps(chunk)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.zscore(CLAIMED_KEY.format(batch_id=batch_id), member)
+    pipe.zadd(CLAIMED_KEY.format(batch_id=batch_id), {member: time.time() + Config.BATCH_CLAIM_TIMEOUT}, xx=True)
+    return pipe.execute()[0] is not None
+
+
+def release_chunk(batch_id: str, chunk: dict):
+    """Drop the claim on a chunk whose rows are all finished."""
+    get_redis().zrem(CLAIMED_KEY.format(batch_id=batch_id), json.dumps(chunk))
+
+
+def requeue_chunk(batch_id: str, claimed: dict, chunk: dict):
+    """Swap the claimed chunk for `chunk` (e.g. with a bumped attempt count) at the end of the queue.
+
+    Its finished rows will be skipped.
+    """
+    pipe = get_redis().pipeline()
+    pipe.zrem(CLAIMED_KEY.format(batch_id=batch_id), json.dumps(claimed))
+    pipe.rpush(CHUNKS_KEY.format(batch_id=batch_id), json.dumps(chunk))
+    pipe.execute()
+
+
+def recover_chunks(batch_id: str) -> int:
+    """Put the chunks whose claim expired back in the queue; returns how many."""
+    return get_redis().register_script(_RECOVER_SCRIPT)(keys=_chunk_keys(batch_id), args=[time.time()])
+
+
+def recover_stalled() -> dict:
+    """Re-queue expired chunks of every running batch, with a runner per chunk (up to its concurrency).
+
+    Without this a batch whose runners all died would stay "running" forever.
+    Returns {batch_id: chunks recovered}.
+    """
+    from server.jobs.tasks import process_batch_chunk  # local import to avoid circular import
+
+    recovered = {}
+    for key in get_redis().scan_iter(match=CLAIMED_KEY.format(batch_id="*")):
+        batch_id = key.decode().split(":")[1]
+        count = recover_chunks(batch_id)
+        meta = get_batch(batch_id) if count else None
+        if meta and meta["status"] == "running":
+            for _ in range(min(meta["concurrency"], count)):
+                process_batch_chunk.apply_async(args=[batch_id, meta["run"]])
+            recovered[batch_id] = count
+            logger.warning(f"Batch {batch_id}: re-queued {count} chunks whose runner stopped")
+    return recovered
+
+
+def is_current(batch_id: str, run: int) -> bool:
+    current = get_redis().hget(BATCH_KEY.format(batch_id=batch_id), "run")
+    return current is not None and int(current) == run
+
+
+def finished_rows(batch_id: str, rows: list) -> set:
+    """The rows in `rows` that already succeeded or failed for good."""
+    pipe = get_redis().pipeline(transaction=False)
+    for row in rows:
+        pipe.getbit(DONE_KEY.format(batch_id=batch_id), row)
+        pipe.getbit(FAILED_KEY.format(batch_id=batch_id), row)
+    bits = pipe.execute()
+    return {row for i, row in enumerate(rows) if bits[2 * i] or bits[2 * i + 1]}
+
+
+def append_output(path: str, record: dict):
+    """Append one JSON line; flock keeps lines from concurrent workers (and hosts sharing the volume) whole."""
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(path, "a", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_output(path: str, total: int):
+    """Yield the output lines, one per row: the last one written for it.
+
+    A row can be written more than once: again by the next runner if the
+    first died between writing and marking it, or as failed before
+    `retry_failed` re-ran it. A line still being written is left out.
+    """
+    last = array("q", [-1]) * total
+    with open(path, "rb") as f:
+        position = 0
+        for line in f:
+            match = OUTPUT_ROW.match(line)
+            if match and line.endswith(b"\n") and int(match.group(1)) < total:
+                last[int(match.group(1))] = position
+            position += len(line)
+        f.seek(0)
+        position = 0
+        for line in f:
+            match = OUTPUT_ROW.match(line)
+            if match and int(match.group(1)) < total and last[int(match.group(1))] == position:
+                yield line
+            position += len(line)
+
+
+def mark_row(batch_id: str, row: int, ok: bool):
+    """Count a finished row once, even if it was processed twice (e.g. after a crash and resume)."""
+    bitmap = DONE_KEY if ok else FAILED_KEY
+    key = BATCH_KEY.format(batch_id=batch_id)
+    redis = get_redis()
+    if redis.setbit(bitmap.format(batch_id=batch_id), row, 1):
+        return
+    pipe = redis.pipeline(transaction=False)
+    pipe.hincrby(key, "done" if ok else "failed", 1)
+    pipe.expire(bitmap.format(batch_id=batch_id), Config.BATCH_META_TTL)
+    pipe.expire(key, Config.BATCH_META_TTL)
+    pipe.execute()
+    _finish_if_complete(batch_id)
+
+
+def _finish_if_complete(batch_id: str):
+    meta = get_batch(batch_id)
+    if meta and meta["pending"] == 0 and meta["status"] != "completed":
+        get_redis().hset(BATCH_KEY.format(batch_id=batch_id),
+                         mapping={"status": "completed", "finished_at": time.time()})
+        logger.info(f"Batch {batch_id} completed: {meta['done']} done, {meta['failed']} failed")
@@ -0,0 +1,171 @@
+# server/jobs/job_status.py
+import json
+import logging
+import time
+from celery import states
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.celery_app import BROKER_DB, LANES, celery_app, lane_queue
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+FANOUT_KEY = "job:fanout:{job_id}"
+JOB_INFO_KEY = "job:info:{task_id}"  # attempts, last_error and the model a routed task used
+# kombu's Redis transport keeps messages with priority N > 0 in "<queue>\x06\x16N"
+PRIORITY_SUFFIXES = ("", "\x06\x163", "\x06\x166", "\x06\x169")
+
+
+def fetch_states(task_ids: list) -> dict:
+    """Read many task states from the Celery Redis result backend in one MGET.
+
+    Returns {task_id: {"status": ..., "result": ...}}; unknown ids are PENDING.
+    """
+    backend = celery_app.backend
+    keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+    jobs = {}
+    for task_id, raw in zip(task_ids, backend.client.mget(keys)):
+        if raw is None:
+            jobs[task_id] = {"status": states.PENDING, "result": None}
+            continue
+        meta = backend.decode(raw)
+        status = meta.get("status", states.PENDING)
+        jobs[task_id] = {
+            "status": status,
+            "result": meta.get("result") if status in states.READY_STATES else None
+        }
+    return jobs
+
+
+def wait_for_changes(task_ids: list, known: dict, timeout: float) -> dict:
+    """Block until at least one task's status differs from `known` or `timeout` expires.
+
+    `known` maps task_id -> last status seen by the caller (missing = PENDING).
+    Celery's Redis backend publishes on a task's result key whenever it stores
+    a state, so we subscribe to those keys and re-read only when one fires.
+    Returns only the changed tasks (possibly empty on timeout).
+    """
+    backend = celery_app.backend
+    deadline = time.monotonic() + timeout
+    pubsub = backend.client.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Subscribe before reading so a state stored in between is not missed
+        pubsub.subscribe(*[backend.get_key_for_task(task_id) for task_id in task_ids])
+        while True:
+            jobs = fetch_states(task_ids)
+            changed = {
+                task_id: job for task_id, job in jobs.items()
+                if job["status"] != known.get(task_id, states.PENDING)
+            }
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            pubsub.get_message(timeout=remaining)
+    finally:
+        pubsub.close()
+
+
+def record_attempt(task_id: str, error: Exception):
+    """Count one failed attempt of a task and remember its error for GET /job/<id>."""
+    key = JOB_INFO_KEY.format(task_id=task_id)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(key, "attempts", 1)
+        pipe.hset(key, "last_error", f"{type(error).__name__}: {error}")
+        pipe.expire(key, Config.JOB_ATTEMPTS_TTL)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to record attempt for task {task_id}: {e}")
+
+
+def record_model(task_id: str, model: str):
+    """Remember which model a routed task actually used."""
+    key = JOB_INFO_KEY.format(task_id=task_id)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hset(key, "model", model)
+        pipe.expire(key, Config.JOB_ATTEMPTS_TTL)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to record model for task {task_id}: {e}")
+
+
+def get_job_info(task_ids: list) -> dict:
+    """{task_id: {"attempts": failed attempts so far, "last_error": str or None[, "model"]}} in one round trip."""
+    pipe = get_redis().pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.hgetall(JOB_INFO_KEY.format(task_id=task_id))
+    info = {}
+    for task_id, raw in zip(task_ids, pipe.execute()):
+        last_error = raw.get(b"last_error")
+        info[task_id] = {
+            "attempts": int(raw.get(b"attempts", 0)),
+            "last_error": last_error.decode() if last_error else None
+        }
+        if b"model" in raw:
+            info[task_id]["model"] = raw[b"model"].decode()
+    return info
+
+
+def save_fanout(job_id: str, task_ids: list, models: list, deadline: float):
+    """Remember which child task runs which model so GET /job/<job_id> can aggregate them."""
+    meta = {"task_ids": task_ids, "models": models, "deadline": deadline}
+    get_redis().set(FANOUT_KEY.format(job_id=job_id), json.dumps(meta), ex=Config.FANOUT_META_TTL)
+
+
+def get_fanout_status(job_id: str):
+    """Aggregate view of a fan-out job, or None if `job_id` is not one.
+
+    Per-model partial results are returned as soon as each child finishes; the
+    aggregate status is PROGRESS until every child is ready, then SUCCESS (all
+    succeeded), PARTIAL_FAILURE or FAILURE. Children still unfinished after the
+    fan-out deadline are reported as TIMEOUT.
+    """
+    raw = get_redis().get(FANOUT_KEY.format(job_id=job_id))
+    if raw is None:
+        return None
+    meta = json.loads(raw)
+    jobs = fetch_states(meta["task_ids"])
+    info = get_job_info(meta["task_ids"])
+    expired = time.time() > meta["deadline"]
+
+    tasks = []
+    for task_id, model in zip(meta["task_ids"], meta["models"]):
+        job = jobs[task_id]
+        status = job["status"]
+        if expired and status not in states.READY_STATES:
+            status = "TIMEOUT"
+        tasks.append({"id": task_id, "model": model, "status": status, "result": job["result"], **info[task_id]})
+
+    finished = [t for t in tasks if t["status"] in states.READY_STATES or t["status"] == "TIMEOUT"]
+    succeeded = [t for t in tasks if t["status"] == states.SUCCESS]
+    if len(finished) < len(tasks):
+        status = "PROGRESS"
+    elif len(succeeded) == len(tasks):
+        status = states.SUCCESS
+    elif succeeded:
+        status = "PARTIAL_FAILURE"
+    else:
+        status = states.FAILURE
+
+    return {
+        "id": job_id,
+        "status": status,
+        "completed": len(finished),
+        "total": len(tasks),
+        "tasks": tasks,
+        "result": {t["model"]: t["result"] for t in succeeded} if status != "PROGRESS" else None
+    }
+
+
+def queue_depths() -> dict:
+    """{lane: {"queue", "depth"}}: messages waiting in each lane's broker queue, in one round trip."""
+    pipe = get_redis(BROKER_DB).pipeline(transaction=False)
+    for lane in LANES:
+        for suffix in PRIORITY_SUFFIXES:
+            pipe.llen(lane_queue(lane) + suffix)
+    lengths = iter(pipe.execute())
+    return {
+        lane: {"queue": lane_queue(lane), "depth": sum(next(lengths) for _ in PRIORITY_SUFFIXES)}
+        for lane in LANES
+    }
@@ -1,7 +1,15 @@
-from flask import Blueprint, request, jsonify, current_app
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from celery import group
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from server.config import Config
-from server.infrastructure.celery_app import celery_app
+from server.infrastructure import tracing
+from server.infrastructure.celery_app import LANES, celery_app, lane_queue
 from celery.result import AsyncResult
+from server.jobs.job_status import get_fanout_status, get_job_info, save_fanout
 from server.utils.jwt_decorator import jwt_required
 api_v1 = Blueprint("api_v1", __name__)
 
@@ -33,32 +41,70 @@ def send_prompt():
     model_index = data.get("model_index", 0)
     model_name = data.get("model_name")
     models = data.get("models")  # NEW multi-model support
+    route = data.get("route")  # provider group or tag: let the server pick the best model
+    use_cache = data.get("cache", True)  # False bypasses the response cache for this request
+    priority = data.get("priority")  # lane: interactive (default for one model), default or bulk
 
     if not prompt:
         return jsonify({"error": "Missing 'prompt'"}), 400
-
-    all_models = current_app.client_manager.model_manager.get_models()
-
-    # Determine which models to use
-    if models:
-        invalid = [m for m in models if m not in all_models]
-        if invalid:
-            return jsonify({"error": f"Models not found: {invalid}"}), 404
-        selected_indexes = [all_models.index(m) for m in models]
-    elif model_name:
-        if model_name not in all_models:
-            return jsonify({"error": f"Model '{model_name}' not found"}), 404
-        selected_indexes = [all_models.index(model_name)]
-    else:
-        selected_indexes = [model_index]
-
-    # Enqueue one task per model
-    task_ids = []
-    for idx in selected_indexes:
-        task = process_prompt.apply_async(args=[prompt, idx, stream])
-        task_ids.append(task.id)
-
-    return jsonify({"task_ids": task_ids, "status": "queued"})
+    if priority is not None and priority not in LANES:
+        return jsonify({"error": f"Unknown priority '{priority}', expected one of {list(LANES)}"}), 400
+    options = {"queue": lane_queue(priority)} if priority else {}
+
+    # Root of the job's trace (or a child of the caller's traceparent); the trace id travels to the
+    # workers in the Celery task headers and is stored on each PromptRecord
+    with tracing.span("job.enqueue", parent=tracing.parse_traceparent(request.headers.get("traceparent")),
+                      stream=stream, route=route) as span:
+        model_manager = current_app.client_manager.model_manager
+
+        if route:
+            candidates = model_manager.get_route_members(route)
+            if not candidates:
+                return jsonify({"error": f"No models in group or tag '{route}'"}), 404
+            # Ranking happens in the worker, so retries re-rank with fresh stats
+            task = process_prompt.apply_async(
+                args=[prompt, 0, stream],
+                kwargs={"use_cache": use_cache, "candidates": candidates},
+                **options
+            )
+            return jsonify({"job_id": task.id, "task_ids": [task.id], "route": route, "status": "queued",
+                            "trace_id": span.trace_id})
+
+        # Determine which models to use
+        if models:
+            invalid = [m for m in models if not model_manager.has_model(m)]
+            if invalid:
+                return jsonify({"error": f"Models not found: {invalid}"}), 404
+            selected_indexes = [model_manager.get_model_index(m) for m in models]
+        elif model_name:
+            if not model_manager.has_model(model_name):
+                return jsonify({"error": f"Model '{model_name}' not found"}), 404
+            selected_indexes = [model_manager.get_model_index(model_name)]
+        else:
+            selected_indexes = [model_index]
+
+        if len(selected_indexes) == 1:
+            task = process_prompt.apply_async(
+                args=[prompt, selected_indexes[0], stream], kwargs={"use_cache": use_cache}, **options
+            )
+            return jsonify({"job_id": task.id, "task_ids": [task.id], "status": "queued", "trace_id": span.trace_id})
+
+        # Fan out to several models as one Celery group under a single job id
+        if len(selected_indexes) > Config.FANOUT_MAX_MODELS:
+            return jsonify({"error": f"At most {Config.FANOUT_MAX_MODELS} models per prompt"}), 400
+
+        # Fan-outs default to the default lane so they don't crowd out single interactive prompts
+        queue = lane_queue(priority or "default")
+        deadline = time.time() + Config.FANOUT_TIMEOUT
+        job = group(
+            process_prompt.s(prompt, idx, stream, use_cache=use_cache).set(expires=Config.FANOUT_TIMEOUT, queue=queue)
+            for idx in selected_indexes
+        ).apply_async()
+        task_ids = [child.id for child in job.results]
+        save_fanout(job.id, task_ids, models, deadline)
+
+        # task_ids are kept for clients that track each model separately
+        return jsonify({"job_id": job.id, "task_ids": task_ids, "status": "queued", "trace_id": span.trace_id})
 
 
 @api_v1.route("/job/conversation", methods=["POST"])
@@ -68,13 +114,92 @@ def conversation():
     data = request.get_json()
     message = data.get("prompt")  # keep backend key 'prompt' for consistency
     model_index = data.get("model_index", 0)
+    priority = data.get("priority")  # lane, defaults to "default"
 
     if not message:
         return jsonify({"error": "Missing 'prompt'"}), 400
+    if priority is not None and priority not in LANES:
+        return jsonify({"error": f"Unknown priority '{priority}', expected one of {list(LANES)}"}), 400
 
-    # Enqueue the conversation task
-    task = process_conversation.apply_async(args=[message, model_index])
-    return jsonify({"task_id": task.id, "status": "queued"})
+    # Enqueue the conversation task (traced like /job/prompt)
+    options = {"queue": lane_queue(priority)} if priority else {}
+    with tracing.span("job.enqueue", parent=tracing.parse_traceparent(request.headers.get("traceparent")),
+                      job="conversation") as span:
+        task = process_conversation.apply_async(args=[message, model_index], **options)
+        return jsonify({"task_id": task.id, "status": "queued", "trace_id": span.trace_id})
+
+
+# ---------------------------
+# Batch jobs (JSONL of {"prompt", "model"} rows)
+# ---------------------------
+@api_v1.route("/job/batch", methods=["POST"])
+def submit_batch():
+    """
+    Start a batch from an uploaded JSONL ('file', settings as form fields) or a
+    server-side 'path' under BATCH_INPUT_DIR. Optional: 'model' (default for rows
+    without one), 'chunk_size', 'concurrency' (runner tasks), 'offset' (skip the
+    first rows, e.g. those already in an output file) and 'cache'.
+    {"resume": batch_id} restarts an existing batch, skipping rows already done
+    ('retry_failed' also re-runs the failed ones).
+    """
+    from server.jobs import batch
+
+    upload = request.files.get("file")
+    data = request.form if upload else (request.get_json(silent=True) or {})
+    try:
+        if data.get("resume"):
+            retry_failed = str(data.get("retry_failed", False)).lower() in ("1", "true", "yes")
+            return jsonify(batch.start(data["resume"], retry_failed=retry_failed))
+
+        model = data.get("model")
+        if model and not current_app.client_manager.model_manager.has_model(model):
+            return jsonify({"error": f"Model '{model}' not found"}), 404
+        chunk_size = int(data.get("chunk_size") or 0) or None
+        concurrency = int(data.get("concurrency") or 0) or None
+        offset = int(data.get("offset") or 0)
+        use_cache = str(data.get("cache", True)).lower() not in ("0", "false", "no")
+
+        batch_id = uuid.uuid4().hex
+        if upload:
+            os.makedirs(batch.batch_dir(batch_id), exist_ok=True)
+            input_path = os.path.join(batch.batch_dir(batch_id), "input.jsonl")
+            upload.save(input_path)
+        elif data.get("path"):
+            input_path = batch.resolve_input(data["path"])
+        else:
+            return jsonify({"error": "Missing 'file' upload or 'path'"}), 400
+
+        meta = batch.create_batch(input_path, model, chunk_size, concurrency, offset, use_cache, batch_id)
+        return jsonify(batch.start(meta["id"]))
+    except KeyError:
+        return jsonify({"error": f"Batch '{data.get('resume')}' not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api_v1.route("/job/batch/<batch_id>", methods=["GET"])
+def get_batch(batch_id):
+    """Progress of a batch: total, done, failed, pending rows and its status."""
+    from server.jobs import batch
+
+    meta = batch.get_batch(batch_id)
+    if meta is None:
+        return jsonify({"error": f"Batch '{batch_id}' not found"}), 404
+    return jsonify(meta)
+
+@api_v1.route("/job/batch/<batch_id>/output", methods=["GET"])
+def get_batch_output(batch_id):
+    """The batch's output JSONL so far: one {"row", "model", "result"} or {"row", "error"} line per finished row
+    (the latest, if a row was written more than once)."""
+    from server.jobs import batch
+
+    meta = batch.get_batch(batch_id)
+    if meta is None:
+        return jsonify({"error": f"Batch '{batch_id}' not found"}), 404
+    if not os.path.exists(meta["output"]):
+        return Response("", mimetype="application/x-ndjson")
+    return Response(batch.read_output(meta["output"], meta["total"]), mimetype="application/x-ndjson")
 
 
 # ---------------------------
@@ -83,17 +208,69 @@ def conversation():
 @api_v1.route("/job/<task_id>", methods=["GET"])
 def get_job(task_id):
     try:
+        fanout = get_fanout_status(task_id)
+        if fanout is not None:
+            return jsonify(fanout)
+
         task_result = AsyncResult(task_id, app=celery_app)
         response = {
             "id": task_result.id,
             "status": task_result.status,
-            "result": task_result.result if task_result.ready() else None
+            "result": task_result.result if task_result.ready() else None,
+            **get_job_info([task_id])[task_id]
         }
         return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 404
 
 
+@api_v1.route("/job/wait", methods=["POST"])
+def wait_jobs():
+    """Long-poll many jobs at once.
+
+    Body: {"task_ids": [...], "timeout": seconds, "known": {task_id: last_status}}.
+    Returns as soon as any task's status differs from `known` (or on timeout),
+    with only the changed tasks: {"tasks": {task_id: {"status", "result"}}}.
+    """
+    from server.jobs.job_status import wait_for_changes
+
+    data = request.get_json() or {}
+    task_ids = data.get("task_ids")
+    if not task_ids or not isinstance(task_ids, list):
+        return jsonify({"error": "Missing 'task_ids'"}), 400
+    if len(task_ids) > Config.JOB_WAIT_MAX_IDS:
+        return jsonify({"error": f"At most {Config.JOB_WAIT_MAX_IDS} task ids per request"}), 400
+
+    try:
+        timeout = min(max(float(data.get("timeout", Config.JOB_WAIT_MAX_TIMEOUT)), 0), Config.JOB_WAIT_MAX_TIMEOUT)
+        changed = wait_for_changes(task_ids, data.get("known") or {}, timeout)
+        return jsonify({"tasks": changed})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api_v1.route("/job/<task_id>/stream", methods=["GET"])
+def stream_job(task_id):
+    """Relay a streaming job's chunks as Server-Sent Events; resumes after Last-Event-ID."""
+    from server.jobs.streaming import iter_events
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+
+    def generate():
+        for item in iter_events(task_id, last_event_id):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id, event, data = item
+            yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ---------------------------
 # Model endpoints
 # ---------------------------
@@ -128,6 +305,26 @@ def upload_model_endpoint(user):
     count = current_app.client_manager.model_manager.bulk_add_from_json_data(data)
     return jsonify({"message": f"Uploaded {count} models"})
 
+@api_v1.route("/model/sync", methods=["POST"])
+def sync_models():
+    """Replace the catalog with the JSON models in the body (or a server-side 'path') atomically."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Missing JSON body"}), 400
+
+    try:
+        model_manager = current_app.client_manager.model_manager
+        if "path" in data:
+            diff = model_manager.sync_from_json(data["path"])
+        else:
+            diff = model_manager.sync_from_dict(data)
+        return jsonify({
+            "message": f"Synced models: {diff['added']} added, {diff['removed']} removed",
+            **diff
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @api_v1.route("/model/list", methods=["GET"])
 def list_models():
     models = current_app.client_manager.model_manager.get_models()
@@ -139,6 +336,26 @@ def grouped_models():
     grouped = current_app.client_manager.model_manager.get_grouped_models()
     return jsonify(grouped)
 
+@api_v1.route("/model/route/<route>", methods=["GET"])
+def route_models(route):
+    """Members of a provider group or tag, best first, with their router stats and circuit state."""
+    from server.utils.circuit_breaker import circuit_breaker
+
+    client_manager = current_app.client_manager
+    members = client_manager.model_manager.get_route_members(route)
+    if not members:
+        return jsonify({"error": f"No models in group or tag '{route}'"}), 404
+    try:
+        stats = client_manager.model_router.stats(members)
+        circuits = circuit_breaker.states(members)
+        ranked = client_manager.model_router.rank(members)
+        return jsonify({
+            "route": route,
+            "models": [{"model": m, "stats": stats[m], "circuit": circuits[m]} for m in ranked]
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @api_v1.route("/model/clear", methods=["POST"])
 def clear_models():
     try:
@@ -154,32 +371,127 @@ def clear_model_endpoint(user):
     current_app.client_manager.model_manager.clear_all()
     return jsonify({"message": "All models cleared!"})
 
+# ---------------------------
+# Usage endpoint
+# ---------------------------
+@api_v1.route("/usage/counters", methods=["GET"])
+def usage_counters():
+    """Usage aggregated across all workers; ?day=YYYY-MM-DD selects the daily breakdown."""
+    usage_manager = current_app.client_manager.usage_manager
+    try:
+        return jsonify({
+            "total": usage_manager.get_all_usage(),
+            "daily": usage_manager.get_daily_usage(request.args.get("day", type=str))
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api_v1.route("/usage", methods=["GET"])
+def usage_rollup():
+    """
+    Requests, tokens, errors and latency per model over [since, until) (ISO 8601, UTC;
+    default: the last 7 days), per hour or day (granularity), from the usage rollups.
+    """
+    from server.database.history import parse_time
+    from server.database.usage_rollup import query_usage
+
+    try:
+        until = parse_time(request.args.get("until", type=str)) or datetime.utcnow()
+        since = parse_time(request.args.get("since", type=str)) or until - timedelta(days=7)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid time: {e}"}), 400
+    if since >= until:
+        return jsonify({"error": "'since' must be before 'until'"}), 400
+    if until - since > timedelta(days=Config.USAGE_MAX_RANGE_DAYS):
+        return jsonify({"error": f"Range exceeds {Config.USAGE_MAX_RANGE_DAYS} days"}), 400
+    try:
+        return jsonify(query_usage(
+            since, until,
+            model_name=request.args.get("model_name", type=str),
+            granularity=request.args.get("granularity", "hour", type=str)
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api_v1.route("/queue/depth", methods=["GET"])
+def queue_depth():
+    """Messages waiting per priority lane (not yet picked up by a worker)."""
+    from server.jobs.job_status import queue_depths
+
+    try:
+        return jsonify({"lanes": queue_depths()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api_v1.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    try:
+        return jsonify(current_app.client_manager.response_cache.stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # ---------------------------
 # History endpoint
 # ---------------------------
 @api_v1.route("/history", methods=["GET"])
 def get_history():
-    from server.database.models import PromptRecord
-
-    limit = request.args.get("limit", 50, type=int)
-    model_name = request.args.get("model_name", type=str)
-
-    query = PromptRecord.query
-    if model_name:
-        query = query.filter_by(model_name=model_name)
-
-    records = query.order_by(PromptRecord.id.desc()).limit(limit).all()
-    history = [
-        {
-            "id": r.id,
-            "prompt": r.prompt_text,
-            "response": r.completion_text,
-            "model": r.model_name,
-            "streamed": r.streamed
-        }
-        for r in records
-    ]
-    return jsonify(history)
+    """
+    Newest-first history previews. Filters: model_name, since / until (ISO 8601, UTC).
+    Pass the returned next_before_id as before_id to fetch the next page.
+    """
+    from server.database.history import list_history, parse_time
+
+    try:
+        since = parse_time(request.args.get("since", type=str))
+        until = parse_time(request.args.get("until", type=str))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid time: {e}"}), 400
+
+    return jsonify(list_history(
+        limit=request.args.get("limit", 50, type=int),
+        model_name=request.args.get("model_name", type=str),
+        before_id=request.args.get("before_id", type=int),
+        since=since,
+        until=until
+    ))
+
+@api_v1.route("/history/search", methods=["GET"])
+def search_history():
+    """
+    Full-text search over prompts and responses: ?q=words, most relevant first.
+    Filters: model_name, since / until (ISO 8601, UTC). Pages with limit / offset (next_offset).
+    """
+    from server.database.history import parse_time
+    from server.database.search import search_history as search
+
+    q = request.args.get("q", "", type=str)
+    if not q.strip():
+        return jsonify({"error": "Missing 'q'"}), 400
+    try:
+        return jsonify(search(
+            q,
+            limit=request.args.get("limit", 20, type=int),
+            offset=max(request.args.get("offset", 0, type=int), 0),
+            model_name=request.args.get("model_name", type=str),
+            since=parse_time(request.args.get("since", type=str)),
+            until=parse_time(request.args.get("until", type=str))
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api_v1.route("/history/<int:record_id>", methods=["GET"])
+def get_history_record(record_id):
+    """Full prompt and response of one history entry."""
+    from server.database.history import get_record
+
+    record = get_record(record_id)
+    if record is None:
+        return jsonify({"error": f"History record {record_id} not found"}), 404
+    return jsonify(record)
 
 
 # ---------------------------
@@ -0,0 +1,62 @@
+# server/jobs/streaming.py
+import logging
+import time
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "job:stream:{task_id}"
+
+
+def _append(task_id: str, fields: dict):
+    key = STREAM_KEY.format(task_id=task_id)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.xadd(key, fields)
+        pipe.expire(key, Config.STREAM_TTL)
+        pipe.execute()
+    except RedisError as e:
+        # Streaming is best effort; the task result still carries the full text
+        logger.warning(f"Failed to publish stream event for task {task_id}: {e}")
+
+
+def publish_chunk(task_id: str, text: str):
+    """Append one generated chunk to the task's Redis stream."""
+    _append(task_id, {"event": "chunk", "data": text})
+
+
+def publish_end(task_id: str, error: str = None):
+    """Mark the task's stream as finished (optionally with an error message)."""
+    if error:
+        _append(task_id, {"event": "error", "data": error})
+    _append(task_id, {"event": "end", "data": ""})
+
+
+def iter_events(task_id: str, last_event_id: str = None, block_ms: int = None):
+    """Yield (event_id, event, data) from a task stream, starting after `last_event_id`.
+
+    Blocks on XREAD between events and yields None roughly every `block_ms`
+    (default STREAM_BLOCK_MS) so callers can send keep-alives or check on
+    the producer. Stops after the "end"
+    event or once STREAM_TIMEOUT seconds pass without any event.
+    """
+    key = STREAM_KEY.format(task_id=task_id)
+    last_id = last_event_id or "0-0"
+    idle_since = time.monotonic()
+    redis = get_redis()
+
+    while time.monotonic() - idle_since < Config.STREAM_TIMEOUT:
+        response = redis.xread({key: last_id}, block=block_ms or Config.STREAM_BLOCK_MS, count=100)
+        if not response:
+            yield None
+            continue
+
+        idle_since = time.monotonic()
+        for entry_id, fields in response[0][1]:
+            last_id = entry_id.decode()
+            event = fields[b"event"].decode()
+            yield last_id, event, fields[b"data"].decode()
+            if event == "end":
+                return
@@ -1,40 +1,239 @@
 # server/jobs/tasks.py
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_shutdown
+from server.config import Config
+from server.database.record_writer import record_writer
+from server.database.usage_rollup import usage_rollups
+from server.infrastructure.async_runner import async_runner
+from server.infrastructure import metrics, tracing
 from server.infrastructure.celery_app import celery_app
+from server.infrastructure.redis_client import get_redis
+from server.jobs import batch
+from server.jobs.job_status import record_attempt, record_model
+from server.jobs.streaming import iter_events, publish_chunk, publish_end
+from server.managers.client_manager import ERROR_PREFIX
+from server.managers.response_cache import prompt_fingerprint
+from server.utils.circuit_breaker import CircuitOpenError
+from server.utils.rate_limiter import RateLimitExceeded
+from server.utils.retry_decorator import TRANSIENT_ERRORS, backoff_delay, deferred_retries, retry_after
 from server.app import create_app  # Flask factory
 
+logger = logging.getLogger(__name__)
+
+# Refused before reaching the provider; they say when to come back (retry_after)
+THROTTLE_ERRORS = (CircuitOpenError, RateLimitExceeded)
+
+# How often a follower relaying a leader's stream checks that the flight is still on (ms)
+RELAY_BLOCK_MS = 500
+
+ARCHIVE_LOCK_KEY = "lock:archive_history"
+ARCHIVE_LOCK_TTL = 6 * 3600  # seconds; outlives any sane run, expires if a worker dies mid-run
+
+# task id -> (span, context token) of the task running in this process
+_task_spans = {}
+
 # create a global Flask app instance for Celery
 app = create_app()
 
-@celery_app.task(name="process_prompt")
-def process_prompt(prompt: str, model_index: int = 0, stream: bool = False):
+def _generate(task_id: str, client_manager, model_index: int, prompt: str, stream: bool):
+    """Call the provider; returns (text, ok). Streamed chunks are published as they arrive."""
+    use_async = Config.LLM_EXECUTION_MODE == "async"
+    if not stream:
+        if use_async:
+            return async_runner.run(client_manager.aget_completion(model_index, prompt)), True
+        return client_manager.get_completion(model_index, prompt), True
+
+    if use_async:
+        chunks = async_runner.iterate(client_manager.aget_reply(model_index, prompt))
+    else:
+        chunks = client_manager.get_reply(model_index, prompt)
+
+    # Failures before the first chunk propagate (the task may be retried);
+    # later ones arrive as an ERROR_PREFIX chunk
+    collected = []
+    ok = True
+    for chunk in chunks:
+        ok = ok and not chunk.startswith(ERROR_PREFIX)
+        collected.append(chunk)
+        publish_chunk(task_id, chunk)
+    publish_end(task_id)
+    return "".join(collected), ok
+
+def _retry_countdown(error: Exception, retries: int) -> float:
+    """Seconds before the next attempt: our own throttle's hint, the provider's hint, or jittered backoff."""
+    if isinstance(error, THROTTLE_ERRORS):
+        return error.retry_after
+    hinted = retry_after(error)
+    if hinted is not None:
+        return min(hinted, Config.TASK_RETRY_MAX_DELAY)
+    return backoff_delay(retries, Config.TASK_RETRY_BACKOFF, max_delay=Config.TASK_RETRY_MAX_DELAY)
+
+def _retry_or_give_up(task, error: Exception):
+    """Reschedule `task` through the broker (freeing this worker slot) unless it is out of retries."""
+    record_attempt(task.request.id, error)
+    if task.request.retries < Config.TASK_MAX_RETRIES:
+        metrics.RETRIES.labels(type(error).__name__, "task").inc()
+        tracing.add_event("retry", error=type(error).__name__, attempt=task.request.retries + 1)
+        raise task.retry(
+            exc=error,
+            countdown=_retry_countdown(error, task.request.retries),
+            max_retries=Config.TASK_MAX_RETRIES
+        )
+
+def _replay(task_id: str, text: str, stream: bool) -> str:
+    """Return a result produced elsewhere (cache or another task), streaming it as one chunk."""
+    if stream:
+        publish_chunk(task_id, text)
+        publish_end(task_id)
+    return text
+
+def _relay(task_id: str, leader_id: str, flight, fingerprint: str):
+    """Copy a streaming leader's chunks to this task's stream as they arrive.
+
+    Returns the text once the leader's stream ends, or None if the leader
+    sent no chunk (it does not stream, or failed before its first chunk),
+    noticed within RELAY_BLOCK_MS of the flight ending.
+    """
+    collected, error, ended = [], None, False
+    for event in iter_events(leader_id, block_ms=RELAY_BLOCK_MS):
+        if event is None:
+            if flight.leader(fingerprint) != leader_id:
+                break  # the flight is over without (more) stream events
+            continue
+        _, name, data = event
+        if name == "chunk":
+            collected.append(data)
+            publish_chunk(task_id, data)
+        elif name == "error":
+            error = data
+        elif name == "end":
+            ended = True
+            break
+    if not collected:
+        return None
+    if not ended:
+        error = error or "Shared request stopped streaming"
+    publish_end(task_id, error=error)
+    return "".join(collected)
+
+def _follow(task_id: str, flight, fingerprint: str, stream: bool):
+    """Follower side of a single flight: the leader's text, or None to call the provider ourselves.
+
+    A streaming follower relays the leader's task stream, keeping the leader's
+    time to first token; otherwise the leader's result is replayed once it is done.
+    """
+    if stream:
+        leader_id = flight.leader(fingerprint)
+        relayed = _relay(task_id, leader_id, flight, fingerprint) if leader_id else None
+        if relayed is not None:
+            return relayed
+    shared = flight.wait(fingerprint)
+    return _replay(task_id, shared, stream) if shared is not None else None
+
+def _answer(task, client_manager, model_index: int, prompt: str, stream: bool, use_cache: bool,
+            requeue: bool = False) -> str:
+    """Answer `prompt` with one model: response cache, then an identical in-flight call, then the provider.
+
+    `requeue` says a transient failure re-queues this same task (see
+    _retry_or_give_up): a leader then keeps its flight for the retry.
+    """
+    task_id = task.request.id
+    model_name = client_manager.model_manager.get_model_name(model_index)
+
+    cached = client_manager.response_cache.get(prompt, model_name) if use_cache else None
+    if cached is not None:
+        return _replay(task_id, cached, stream)
+
+    flight = client_manager.single_flight
+    fingerprint = prompt_fingerprint(prompt, model_name)
+    leader = flight.acquire(fingerprint, task_id)
+    if leader:
+        metrics.CACHE_LOOKUPS.labels("single_flight", "leader").inc()
+    else:
+        shared = _follow(task_id, flight, fingerprint, stream)
+        if shared is not None:
+            metrics.CACHE_LOOKUPS.labels("single_flight", "hit").inc()
+            return shared
+        # Leader failed or vanished: call the provider ourselves
+        metrics.CACHE_LOOKUPS.labels("single_flight", "miss").inc()
+
+    result, ok, held = None, False, False
+    started = time.monotonic()
+    try:
+        with deferred_retries():
+            result, ok = _generate(task_id, client_manager, model_index, prompt, stream)
+    except Exception as e:
+        if not isinstance(e, THROTTLE_ERRORS):  # a throttled call never reached the provider
+            client_manager.model_router.record(model_name, time.monotonic() - started, ok=False)
+        if leader and requeue and isinstance(e, TRANSIENT_ERRORS + THROTTLE_ERRORS) \
+                and task.request.retries < Config.TASK_MAX_RETRIES:
+            # Followers wait for our retry instead of each calling the failing provider
+            countdown = _retry_countdown(e, task.request.retries)
+            held = flight.hold(fingerprint, task_id, countdown + flight.lock_ttl)
+        raise
+    finally:
+        if leader and not held:
+            flight.complete(fingerprint, task_id, result if ok else None)
+    client_manager.model_router.record(model_name, time.monotonic() - started, ok)
+
+    if use_cache and ok:
+        client_manager.response_cache.set(prompt, model_name, result)
+    return result
+
+@celery_app.task(name="process_prompt", bind=True)
+def process_prompt(self, prompt: str, model_index: int = 0, stream: bool = False, use_cache: bool = True,
+                   candidates: list = None):
     """
     Process a prompt using the ClientManager inside Flask app context.
+    With stream=True each chunk is also published to the task's Redis stream
+    (relayed by GET /job/<task_id>/stream) as soon as it arrives.
+    Successful results are served from / stored in the response cache unless use_cache=False,
+    and identical prompts already in flight on another worker are waited on instead of re-sent.
+    With `candidates` (full model names) model_index is ignored: the candidates are ranked by
+    recent latency and success, and each failure before any output falls back to the next one.
+    Transient upstream failures re-queue the task with a backoff countdown instead of sleeping.
     """
     with app.app_context():  # <-- use app.app_context(), not current_app
         try:
             client_manager = app.client_manager
+            if not candidates:
+                return _answer(self, client_manager, model_index, prompt, stream, use_cache, requeue=True)
 
-            if stream:
-                collected = []
-                for chunk in client_manager.get_reply(model_index, prompt):
-                    collected.append(chunk)
-                return "".join(collected)
-            else:
-                return client_manager.get_completion(model_index, prompt)
+            model_manager = client_manager.model_manager
+            ranked = client_manager.model_router.rank([m for m in candidates if model_manager.has_model(m)])
+            if not ranked:
+                raise IndexError("No candidate model available")
+            ranked = ranked[:Config.ROUTER_MAX_CANDIDATES]
+            for position, model_name in enumerate(ranked):
+                try:
+                    result = _answer(self, client_manager, model_manager.get_model_index(model_name),
+                                     prompt, stream, use_cache, requeue=position == len(ranked) - 1)
+                except Exception as e:
+                    if position == len(ranked) - 1:
+                        raise
+                    logger.warning(f"Model {model_name} failed ({type(e).__name__}: {e}), falling back")
+                    continue
+                record_model(self.request.id, model_name)
+                return result
 
         except IndexError:
             return "Error: No models available. Load models first."
+        except TRANSIENT_ERRORS + THROTTLE_ERRORS as e:
+            _retry_or_give_up(self, e)
+            if stream:
+                publish_end(self.request.id, error=str(e))
+            return f"Error processing prompt: {e}"
         except Exception as e:
+            if stream:
+                publish_end(self.request.id, error=str(e))
             return f"Error processing prompt: {e}"
-# server/jobs/tasks.py
-from server.infrastructure.celery_app import celery_app
-from server.app import create_app  # Flask factory
-
-# create a global Flask app instance for Celery
-app = create_app()
 
-@celery_app.task(name="process_conversation")
-def process_conversation(prompt: str, model_index: int = 0):
+@celery_app.task(name="process_conversation", bind=True)
+def process_conversation(self, prompt: str, model_index: int = 0):
     """
     Process a conversation using the ClientManager inside Flask app context.
     Streams chunks internally and returns the full response.
@@ -45,12 +244,170 @@ def process_conversation(prompt: str, model_index: int = 0):
 
             # Collect all chunks from get_conversation
             collected = []
-            for chunk in client_manager.get_conversation(model_index, prompt):
-                collected.append(chunk)
+            with deferred_retries():
+                for chunk in client_manager.get_conversation(model_index, prompt):
+                    collected.append(chunk)
 
             return "".join(collected)
 
         except IndexError:
             return "Error: No models available. Load models first."
+        except TRANSIENT_ERRORS + THROTTLE_ERRORS as e:
+            _retry_or_give_up(self, e)
+            return f"Error processing conversation: {e}"
         except Exception as e:
             return f"Error processing conversation: {e}"
+
+def _batch_row(task, client_manager, meta: dict, line: str) -> dict:
+    """Answer one batch row; transient errors propagate so the runner can re-queue its chunk."""
+    row = json.loads(line)
+    prompt = row.get("prompt")
+    model_name = row.get("model") or meta["model"]
+    record = {"id": row["id"]} if "id" in row else {}
+    if not prompt:
+        raise ValueError("Missing 'prompt'")
+    model_manager = client_manager.model_manager
+    if model_name and not model_manager.has_model(model_name):
+        raise ValueError(f"Model '{model_name}' not found")
+    model_index = model_manager.get_model_index(model_name) if model_name else 0
+    record["model"] = model_manager.get_model_name(model_index)
+    record["result"] = _answer(task, client_manager, model_index, prompt, False, meta["cache"])
+    return record
+
+@celery_app.task(name="process_batch_chunk", bind=True)
+def process_batch_chunk(self, batch_id: str, run: int):
+    """
+    One of a batch's `concurrency` runners: claims the next chunk of rows, answers
+    each row not already finished and appends it to the batch output as soon as it
+    is done, then re-queues itself for the next chunk. A transient failure puts the
+    chunk back and re-queues the runner with a backoff countdown; after
+    TASK_MAX_RETRIES attempts the row is written as failed instead. The claim on
+    the chunk is renewed per row; if the runner dies, recover_batches hands the
+    chunk to a new one (rows written twice are deduplicated by batch.read_output).
+    """
+    with app.app_context():
+        meta = batch.get_batch(batch_id)
+        chunk = batch.claim_chunk(batch_id, run) if meta else None
+        if chunk is None:
+            return 0
+
+        client_manager = app.client_manager
+        rows = list(batch.read_rows(meta["input"], chunk))
+        finished = batch.finished_rows(batch_id, [row for row, _ in rows])
+        processed = 0
+        for row, line in rows:
+            if row in finished:
+                continue
+            if not batch.is_current(batch_id, run):
+                return processed  # resumed elsewhere; the new run re-reads this chunk
+            if not batch.touch_chunk(batch_id, chunk):
+                return processed  # claim expired and the chunk went back to the queue
+            try:
+                record = _batch_row(self, client_manager, meta, line)
+                ok = True
+            except TRANSIENT_ERRORS + THROTTLE_ERRORS as e:
+                attempts = chunk.get("attempts", 0)
+                record_attempt(self.request.id, e)
+                if attempts < Config.TASK_MAX_RETRIES:
+                    metrics.RETRIES.labels(type(e).__name__, "task").inc()
+                    batch.requeue_chunk(batch_id, chunk, {**chunk, "attempts": attempts + 1})
+                    process_batch_chunk.apply_async(args=[batch_id, run], countdown=_retry_countdown(e, attempts))
+                    return processed
+                record, ok = {"error": f"{type(e).__name__}: {e}"}, False
+            except Exception as e:
+                record, ok = {"error": f"{type(e).__name__}: {e}"}, False
+            batch.append_output(meta["output"], {"row": row, **record})
+            batch.mark_row(batch_id, row, ok)
+            processed += 1
+
+        batch.release_chunk(batch_id, chunk)
+        process_batch_chunk.apply_async(args=[batch_id, run])
+        return processed
+
+@celery_app.task(name="recover_batches")
+def recover_batches():
+    """Periodic run: give chunks whose runner died (claim older than BATCH_CLAIM_TIMEOUT) to new runners."""
+    return batch.recover_stalled()
+
+@celery_app.task(name="archive_history")
+def archive_history():
+    """
+    Periodic retention run: keep the coming months' partitions ready (if prompt_record
+    is partitioned) and move months older than HISTORY_RETENTION_DAYS to the archive.
+    A Redis lock keeps overlapping runs from archiving the same month twice.
+    """
+    from server.database import retention
+
+    redis = get_redis()
+    if not redis.set(ARCHIVE_LOCK_KEY, 1, nx=True, ex=ARCHIVE_LOCK_TTL):
+        return {}
+    try:
+        with app.app_context():
+            if retention.partitions():
+                retention.ensure_partitions()
+            return retention.archive_expired()
+    finally:
+        redis.delete(ARCHIVE_LOCK_KEY)
+
+
+@celery_app.task(name="compact_usage")
+def compact_usage():
+    """Periodic run: fold hourly usage rollups older than USAGE_ROLLUP_HOURLY_DAYS into daily rows."""
+    from server.database.usage_rollup import compact_rollups
+
+    with app.app_context():
+        return compact_rollups()
+
+
+@task_prerun.connect
+def observe_queue_wait(task=None, **kwargs):
+    """Queue wait of each task, from its publish time (stamped in celery_app) or ETA if later."""
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if not enqueued_at:
+        return
+    if task.request.eta:
+        enqueued_at = max(enqueued_at, datetime.fromisoformat(task.request.eta).timestamp())
+    queue = (task.request.delivery_info or {}).get("routing_key") or "unknown"
+    metrics.TASK_WAIT_SECONDS.labels(queue).observe(max(time.time() - enqueued_at, 0))
+
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    """Continue the publisher's trace: a "celery.queue" span up to now, then a current "celery.task" span."""
+    parent = tracing.parse_traceparent(getattr(task.request, "traceparent", None))
+    queue = (task.request.delivery_info or {}).get("routing_key")
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if parent and enqueued_at:
+        tracing.Span("celery.queue", parent, start_ns=int(enqueued_at * 1e9), queue=queue).end()
+    span = tracing.Span("celery.task", parent, task=task.name, task_id=task_id, queue=queue,
+                        retries=task.request.retries)
+    _task_spans[task_id] = (span, tracing.activate(span))
+
+
+@task_postrun.connect
+def end_task_span(task_id=None, state=None, retval=None, **kwargs):
+    entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    span, token = entry
+    tracing.deactivate(token)
+    span.set_attribute("state", state)
+    span.end(error=retval if isinstance(retval, Exception) else None)
+
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    """In the worker's main process, before the pool forks: fresh sample files, then the exporter."""
+    if Config.METRICS_ENABLED:
+        metrics.reset_samples()
+        metrics.start_exporter()
+
+
+@worker_process_shutdown.connect
+def flush_on_shutdown(**kwargs):
+    """Push buffered usage counters and PromptRecord rows before a worker process exits."""
+    app.client_manager.usage_manager.flush()
+    usage_rollups.flush()
+    record_writer.close()
+    if Config.METRICS_ENABLED:
+        metrics.process_exited(os.getpid())
@@ -1,15 +1,18 @@
 # server/managers/client_manager.py
+import asyncio
 import os
-from pathlib import Path
-from openai import OpenAI, InternalServerError, RateLimitError
+from openai import AsyncOpenAI, OpenAI
 from server.config import Config
+from server.utils.rate_limiter import rate_limiter
 from server.utils.retry_decorator import retry_request
 from server.managers.usage_manager import UsageManager
 from server.managers.llm_model_manager import LLMModelManager
-from server.managers.resource_manager import ResourceManager
-from server.database import db
-from server.database.models import PromptRecord
-from flask import current_app
+from server.managers.model_router import ModelRouter
+from server.managers.response_cache import ResponseCache
+from server.managers.single_flight import SingleFlight
+from server.database.record_writer import record_writer
+from server.database.usage_rollup import usage_rollups
+from server.infrastructure import tracing
 
 
 from server.flagchat4 import (
@@ -20,6 +23,13 @@ from server.flagchat4 import (
     set_backtrace as fc_set_backtrace, # Set how many conversation turns to record (default: 2)
     empty_history as fc_empty_history, # Clear conversation history
 )
+# Prefix of the chunk get_reply yields when the upstream call fails mid-stream
+# (failures before the first chunk are raised instead)
+ERROR_PREFIX = "[ERROR]: "
+
+def _error_chunk(error: Exception) -> str:
+    return f"{ERROR_PREFIX}{error}"
+
 class ClientManager:
     def __init__(self, base_url="https://openrouter.ai/api/v1"):
         # Initialize API key
@@ -27,8 +37,10 @@ class ClientManager:
         if not api_key:
             raise ValueError("Please set OPENAI_API_KEY in your environment")
 
-        # OpenAI client
-        self.client = OpenAI(base_url=base_url)
+        # OpenAI clients (the async one is used by the event-loop execution mode).
+        # The SDK's own retries are off: retry_request is the single retry layer.
+        self.client = OpenAI(base_url=base_url, max_retries=0)
+        self.async_client = AsyncOpenAI(base_url=base_url, max_retries=0)
 
         # Register FlashChat client
         fc_set_client(self.client)
@@ -37,96 +49,163 @@ class ClientManager:
         usage_path = os.path.abspath(Config.PATH_USAGE)
         os.makedirs(os.path.dirname(usage_path), exist_ok=True)
 
-        # Resolve client_logs.json
-        log_path = os.path.abspath(Config.PATH_LOG)
-        os.makedirs(os.path.dirname(log_path), exist_ok=True)
-
         # Managers
         self.model_manager = LLMModelManager()
-        self.usage_manager = UsageManager(file_path=usage_path)
-        self.log_file = Path(log_path)
-
-        # Load existing usage logs if any
-        if self.log_file.exists():
-            self.usage_manager.usage.update(ResourceManager.load_json(self.log_file))
+        self.usage_manager = UsageManager(file_path=usage_path, model_manager=self.model_manager)
+        self.response_cache = ResponseCache()
+        self.single_flight = SingleFlight()
+        self.model_router = ModelRouter()
 
     def _save_to_db(self, prompt: str, completion: str, model_name: str, streamed: bool):
-        """Internal helper to save prompt & completion to the database."""
-        with current_app.app_context():
-            record = PromptRecord(
-                prompt_text=prompt,
-                completion_text=completion,
-                model_name=model_name,
-                streamed=streamed
-            )
-            db.session.add(record)
-            db.session.commit()
-
-    @retry_request(retries=5, backoff_factor=2)
+        """Internal helper to queue prompt & completion for a batched database insert."""
+        record_writer.submit({
+            "prompt_text": prompt,
+            "completion_text": completion,
+            "model_name": model_name,
+            "streamed": streamed,
+            "trace_id": tracing.current_trace_id()
+        })
+
+    def _finish(self, prompt: str, completion: str, model_name: str, streamed: bool, tokens: int):
+        """Log usage and queue the DB record of a finished call (blocking: Redis, possibly an inline insert)."""
+        self.usage_manager.log_usage(model_name, tokens)
+        self._save_to_db(prompt, completion, model_name, streamed=streamed)
+
+    async def _aresolve(self, model_index: int):
+        """(model name, rate limits) resolved off the event loop, as they may hit the database or Redis."""
+        model_name = await asyncio.to_thread(self.model_manager.get_model_name, model_index)
+        return model_name, await asyncio.to_thread(self.model_manager.get_model_limits, model_name)
+
+    def _circuit_key(self, model_index: int, prompt: str) -> str:
+        """Circuit breaker key for a call: the full model name."""
+        return self.model_manager.get_model_name(model_index)
+
+    @retry_request(retries=5, backoff_factor=2, circuit=_circuit_key)
     def get_completion(self, model_index: int, prompt: str) -> str:
         """
         Returns completion from model and records usage + DB entry.
         """
-        model_name = self.model_manager.get_models()[model_index]
-
-        # Call OpenAI completion API
-        response = self.client.chat.completions.create(
-            model=model_name,
-            messages=[{"role": "user", "content": prompt}],
-        )
+        model_name = self.model_manager.get_model_name(model_index)
+
+        # Call OpenAI completion API, within the model's and provider's rate limits
+        with rate_limiter.limit(model_name, **self.model_manager.get_model_limits(model_name)):
+            with usage_rollups.track(model_name) as call:
+                response = self.client.chat.completions.create(
+                    model=model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+                call.usage = response.usage
         content = response.choices[0].message.content
 
-        # Log usage and save locally
+        # Log usage
         self.usage_manager.log_usage(model_name, len(content))
-        ResourceManager.save_json(self.log_file, self.usage_manager.usage)
 
         # Save to DB
         self._save_to_db(prompt, content, model_name, streamed=False)
 
         return content
 
-    @retry_request(retries=5, backoff_factor=2)
+    @retry_request(retries=5, backoff_factor=2, circuit=_circuit_key, stream_error=_error_chunk)
     def get_reply(self, model_index: int, prompt: str):
         """
         Stream response from model while logging usage and saving full response to DB.
+        Errors before the first chunk propagate so retry_request can retry them; later ones
+        count against the circuit and end the stream with an ERROR_PREFIX chunk.
+        """
+        model_name = self.model_manager.get_model_name(model_index)
+        total_tokens = 0
+        collected = []
+        # The concurrency lease is held until the stream is fully read
+        with rate_limiter.limit(model_name, **self.model_manager.get_model_limits(model_name)):
+            with usage_rollups.track(model_name, stream=True) as call:
+                response = self.client.chat.completions.create(
+                    model=model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=True,
+                    stream_options={"include_usage": True}  # token counts arrive in a last, choice-less chunk
+                )
+
+                for chunk in response:
+                    if chunk.usage:
+                        call.usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not collected:
+                            call.first_token()
+                        total_tokens += len(delta)
+                        collected.append(delta)
+                        yield delta
+
+        # Log usage
+        self.usage_manager.log_usage(model_name, total_tokens)
+
+        # Save full streamed response to DB
+        self._save_to_db(prompt, "".join(collected), model_name, streamed=True)
+
+    @retry_request(retries=5, backoff_factor=2, circuit=_circuit_key)
+    async def aget_completion(self, model_index: int, prompt: str) -> str:
+        """
+        Async variant of get_completion, run on the worker's event loop; blocking
+        database and Redis work is handed to threads so it never stalls the loop.
         """
-        model_name = self.model_manager.get_models()[model_index]
-        try:
-            response = self.client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": prompt}],
-                stream=True
-            )
-            total_tokens = 0
-            collected = []
-
-            for chunk in response:
-                delta = chunk.choices[0].delta.get("content")
-                if delta:
-                    total_tokens += len(delta)
-                    collected.append(delta)
-                    yield delta
-
-            # Log usage and save locally
-            self.usage_manager.log_usage(model_name, total_tokens)
-            ResourceManager.save_json(self.log_file, self.usage_manager.usage)
-
-            # Save full streamed response to DB
-            self._save_to_db(prompt, "".join(collected), model_name, streamed=True)
-
-        except (InternalServerError, RateLimitError) as err:
-            yield f"[ERROR]: {err}"
-        except Exception as e:
-            yield f"[ERROR]: {e}"
-
-        
-    @retry_request(retries=5, backoff_factor=2)
+        model_name, limits = await self._aresolve(model_index)
+
+        async with rate_limiter.alimit(model_name, **limits):
+            with usage_rollups.track(model_name) as call:
+                response = await self.async_client.chat.completions.create(
+                    model=model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+                call.usage = response.usage
+        content = response.choices[0].message.content
+
+        # Log usage and save to DB
+        await asyncio.to_thread(self._finish, prompt, content, model_name, False, len(content))
+
+        return content
+
+    @retry_request(retries=5, backoff_factor=2, circuit=_circuit_key, stream_error=_error_chunk)
+    async def aget_reply(self, model_index: int, prompt: str):
+        """
+        Async variant of get_reply: an async generator of streamed chunks.
+        """
+        model_name, limits = await self._aresolve(model_index)
+        total_tokens = 0
+        collected = []
+        async with rate_limiter.alimit(model_name, **limits):
+            with usage_rollups.track(model_name, stream=True) as call:
+                response = await self.async_client.chat.completions.create(
+                    model=model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=True,
+                    stream_options={"include_usage": True}  # token counts arrive in a last, choice-less chunk
+                )
+
+                async for chunk in response:
+                    if chunk.usage:
+                        call.usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not collected:
+                            call.first_token()
+                        total_tokens += len(delta)
+                        collected.append(delta)
+                        yield delta
+
+        # Log usage and save full streamed response to DB
+        await asyncio.to_thread(self._finish, prompt, "".join(collected), model_name, True, total_tokens)
+
+    @retry_request(retries=5, backoff_factor=2, circuit=_circuit_key)
     def get_conversation(self, model_index: int, prompt: str):
         """
         Stream conversation from FlashChat and save full text to DB.
         The 'streamed' flag is always False.
         """
-        model_name = self.model_manager.get_models()[model_index]
+        model_name = self.model_manager.get_model_name(model_index)
         collected = []
 
         # FlashChat streaming loop
@@ -1,34 +1,127 @@
 # server/managers/llm_model_manager.py
 
 import json
+import logging
+from redis.exceptions import RedisError
+from sqlalchemy import delete, insert, select, update
+from server.config import Config
 from server.database import db
 from server.database.models import LLMModel
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalog:
+    """Immutable snapshot of the LLMModel table with O(1) name lookups."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.models = [m.full_model for m in rows]
+        self.index = {name: i for i, name in enumerate(self.models)}
+        self.ids = {m.full_model: m.id for m in rows}
+        self.limits = {
+            m.full_model: {"provider": m.provider, "rpm": m.rpm, "max_concurrency": m.max_concurrency}
+            for m in rows
+        }
+        self.grouped = {}
+        self.routes = {}  # provider or tag -> full model names, in catalog order
+        for m in rows:
+            self.grouped.setdefault(m.provider, []).append({
+                "model_name": m.model_name,
+                "tag": m.tag
+            })
+            for route in {m.provider, m.tag} - {"", None}:
+                self.routes.setdefault(route, []).append(m.full_model)
+
 
 class LLMModelManager:
     def __init__(self):
         # Tables are created once in app.py with db.create_all()
-        pass
+        # Per-process catalog, reloaded only when the shared version in Redis changes
+        self._catalog = None
+
+    # ---------------------------
+    # Catalog cache
+    # ---------------------------
+    def _shared_version(self):
+        """Current catalog version in Redis; None if Redis is unreachable."""
+        try:
+            return get_redis().get(Config.MODEL_CATALOG_VERSION_KEY) or b"0"
+        except RedisError as e:
+            logger.warning(f"Model catalog version unavailable, reading from DB: {e}")
+            return None
+
+    def _bump_version(self):
+        """Invalidate the catalog in this process and in every other worker."""
+        self._catalog = None
+        try:
+            get_redis().incr(Config.MODEL_CATALOG_VERSION_KEY)
+        except RedisError as e:
+            logger.warning(f"Failed to bump model catalog version: {e}")
 
-    def add_model(self, full_model=None, provider=None, model_name=None, tag=None):
+    def get_catalog(self) -> ModelCatalog:
+        version = self._shared_version()
+        catalog = self._catalog
+        if catalog is None or version is None or catalog.version != version:
+            # Version is read before the query, so a concurrent write always triggers another reload
+            catalog = ModelCatalog(version, LLMModel.query.order_by(LLMModel.id).all())
+            if version is not None:
+                self._catalog = catalog
+        return catalog
+
+    def invalidate(self):
+        """Drop the local catalog so the next lookup reloads it from the DB."""
+        self._catalog = None
+
+    @staticmethod
+    def _build_row(full_model=None, provider=None, model_name=None, tag=None,
+                   rpm=None, max_concurrency=None) -> dict:
+        """Normalize model fields into an LLMModel row dict."""
         if not full_model:
             full_model = f"{provider}/{model_name}:{tag}"
 
-        existing = LLMModel.query.filter_by(full_model=full_model).first()
+        return {
+            "full_model": full_model,
+            "provider": provider or full_model.split("/")[0],
+            "model_name": model_name or full_model.split("/")[1].split(":")[0],
+            "tag": tag or (full_model.split(":")[1] if ":" in full_model else ""),
+            "rpm": rpm,
+            "max_concurrency": max_concurrency,
+        }
+
+    def _rows_from_dict(self, data: dict) -> dict:
+        """Flatten {provider: [{"model", "tag", "rpm", "max_concurrency"}]} into {full_model: row}, first entry wins."""
+        rows = {}
+        for provider, models in data.items():
+            for m in models:
+                row = self._build_row(provider=provider, model_name=m["model"], tag=m.get("tag", ""),
+                                      rpm=m.get("rpm"), max_concurrency=m.get("max_concurrency"))
+                rows.setdefault(row["full_model"], row)
+        return rows
+
+    @staticmethod
+    def _insert_ignore():
+        """Multi-row INSERT that skips rows whose full_model already exists."""
+        stmt = insert(LLMModel)
+        dialect = db.session.get_bind().dialect.name
+        if dialect == "mysql":
+            return stmt.prefix_with("IGNORE")
+        if dialect == "sqlite":
+            return stmt.prefix_with("OR IGNORE")
+        return stmt
+
+    def add_model(self, full_model=None, provider=None, model_name=None, tag=None,
+                  rpm=None, max_concurrency=None):
+        row = self._build_row(full_model, provider, model_name, tag, rpm, max_concurrency)
+
+        existing = LLMModel.query.filter_by(full_model=row["full_model"]).first()
         if existing:
             return False
 
-        provider_val = provider or full_model.split("/")[0]
-        model_val = model_name or full_model.split("/")[1].split(":")[0]
-        tag_val = tag or (full_model.split(":")[1] if ":" in full_model else "")
-
-        new_model = LLMModel(
-            full_model=full_model,
-            provider=provider_val,
-            model_name=model_val,
-            tag=tag_val
-        )
-        db.session.add(new_model)
+        db.session.add(LLMModel(**row))
         db.session.commit()
+        self._bump_version()
         return True
 
     # def bulk_add_from_json(self, json_file):
@@ -47,31 +140,105 @@ class LLMModelManager:
         return self.bulk_add_from_dict(data)
 
     def bulk_add_from_dict(self, data: dict):
-        """Load models directly from a Python dict (parsed JSON)."""
-        count = 0
-        for provider, models in data.items():
-            for m in models:
-                if self.add_model(provider=provider, model_name=m["model"], tag=m.get("tag", "")):
-                    count += 1
-        return count
+        """Load models directly from a Python dict (parsed JSON).
+
+        One SELECT of the existing keys and one multi-row insert, committed together.
+        """
+        rows = self._rows_from_dict(data)
+        try:
+            existing = set(db.session.scalars(select(LLMModel.full_model)))
+            new_rows = [row for key, row in rows.items() if key not in existing]
+            if new_rows:
+                db.session.execute(self._insert_ignore(), new_rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if new_rows:
+            self._bump_version()
+        return len(new_rows)
+
+    def sync_from_json(self, json_file: str):
+        """Replace the catalog with the models in a JSON file path."""
+        with open(json_file, "r") as f:
+            data = json.load(f)
+        return self.sync_from_dict(data)
+
+    def sync_from_dict(self, data: dict):
+        """Make the table match `data` exactly, applying adds, removes and limit changes in one transaction.
+
+        Unlike clear_models() followed by a reload, readers never see an empty catalog.
+        """
+        rows = self._rows_from_dict(data)
+        try:
+            existing = {
+                full_model: (rpm, max_concurrency)
+                for full_model, rpm, max_concurrency in db.session.execute(
+                    select(LLMModel.full_model, LLMModel.rpm, LLMModel.max_concurrency)
+                )
+            }
+            to_add = [row for key, row in rows.items() if key not in existing]
+            to_remove = existing.keys() - rows.keys()
+            to_update = [
+                row for key, row in rows.items()
+                if key in existing and existing[key] != (row["rpm"], row["max_concurrency"])
+            ]
+            if to_remove:
+                db.session.execute(delete(LLMModel).where(LLMModel.full_model.in_(to_remove)))
+            if to_add:
+                db.session.execute(self._insert_ignore(), to_add)
+            for row in to_update:
+                db.session.execute(
+                    update(LLMModel)
+                    .where(LLMModel.full_model == row["full_model"])
+                    .values(rpm=row["rpm"], max_concurrency=row["max_concurrency"])
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if to_add or to_remove or to_update:
+            self._bump_version()
+        return {"added": len(to_add), "removed": len(to_remove), "updated": len(to_update)}
 
     def get_models(self):
-        return [m.full_model for m in LLMModel.query.all()]
+        return list(self.get_catalog().models)
+
+    def has_model(self, full_model: str) -> bool:
+        return full_model in self.get_catalog().index
+
+    def get_model_index(self, full_model: str):
+        """Position of `full_model` in get_models(), or None if unknown."""
+        return self.get_catalog().index.get(full_model)
+
+    def get_model_name(self, model_index: int) -> str:
+        """Full model name at `model_index` (raises IndexError like list indexing)."""
+        return self.get_catalog().models[model_index]
+
+    def get_model_id(self, full_model: str):
+        return self.get_catalog().ids.get(full_model)
 
     def get_grouped_models(self):
-        grouped = {}
-        for m in LLMModel.query.all():
-            grouped.setdefault(m.provider, []).append({
-                "model_name": m.model_name,
-                "tag": m.tag
-            })
-        return grouped
+        grouped = self.get_catalog().grouped
+        return {provider: list(models) for provider, models in grouped.items()}
+
+    def get_model_limits(self, full_model: str) -> dict:
+        """{"provider", "rpm", "max_concurrency"} from the catalog (limits may be None)."""
+        return dict(self.get_catalog().limits[full_model])
+
+    def get_route_members(self, route: str) -> list:
+        """Full model names in a provider group or carrying a tag (e.g. "openai" or "free")."""
+        return list(self.get_catalog().routes.get(route, []))
+
     def clear_models(self):
         """Delete all models from the table."""
         try:
             num_deleted = LLMModel.query.delete()
             db.session.commit()
-            return num_deleted
         except Exception:
             db.session.rollback()
-            raise
\ No newline at end of file
+            raise
+        self._bump_version()
+        return num_deleted
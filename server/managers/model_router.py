@@ -0,0 +1,86 @@
+import logging
+import time
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.redis_client import get_redis
+from server.utils.circuit_breaker import circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+# Fold one observation into the model's moving averages atomically
+_RECORD_SCRIPT = """
+local alpha = tonumber(ARGV[1])
+local latency = tonumber(ARGV[2])
+local success = tonumber(ARGV[3])
+local old_latency = tonumber(redis.call('hget', KEYS[1], 'latency'))
+local old_success = tonumber(redis.call('hget', KEYS[1], 'success'))
+if old_latency then
+    latency = alpha * latency + (1 - alpha) * old_latency
+    success = alpha * success + (1 - alpha) * old_success
+end
+redis.call('hset', KEYS[1], 'latency', latency, 'success', success, 'updated_at', ARGV[4])
+redis.call('hincrby', KEYS[1], 'samples', 1)
+redis.call('expire', KEYS[1], ARGV[5])
+return 1
+"""
+
+
+class ModelRouter:
+    """Picks the best model of a group from recent latency and success, tracked in Redis.
+
+    Every provider call feeds an exponentially weighted moving average of its
+    latency and success rate (alpha = weight of the newest call). Candidates
+    are ranked by expected latency per successful call; models never seen yet
+    start from ROUTER_DEFAULT_LATENCY so they still get tried, and models with
+    an open circuit go last.
+    """
+
+    STATS_KEY = "router:stats:{model}"
+
+    def __init__(self, alpha: float = None, default_latency: float = None):
+        self.alpha = alpha or Config.ROUTER_EWMA_ALPHA
+        self.default_latency = default_latency or Config.ROUTER_DEFAULT_LATENCY
+        self._record = None
+
+    def record(self, model: str, latency: float, ok: bool):
+        try:
+            redis = get_redis()
+            if self._record is None:
+                self._record = redis.register_script(_RECORD_SCRIPT)
+            self._record(
+                keys=[self.STATS_KEY.format(model=model)],
+                args=[self.alpha, latency, 1 if ok else 0, time.time(), Config.ROUTER_STATS_TTL]
+            )
+        except RedisError as e:
+            logger.warning(f"Failed to record router stats for {model}: {e}")
+
+    def stats(self, models: list) -> dict:
+        """{model: {"latency", "success", "samples"}} (None for models never seen)."""
+        pipe = get_redis().pipeline(transaction=False)
+        for model in models:
+            pipe.hgetall(self.STATS_KEY.format(model=model))
+        stats = {}
+        for model, raw in zip(models, pipe.execute()):
+            stats[model] = {
+                "latency": float(raw[b"latency"]),
+                "success": float(raw[b"success"]),
+                "samples": int(raw[b"samples"])
+            } if raw else None
+        return stats
+
+    def _score(self, stats) -> float:
+        if stats is None:
+            return self.default_latency
+        return stats["latency"] / max(stats["success"], 0.01)
+
+    def rank(self, models: list) -> list:
+        """`models` ordered best first; falls back to the given order if Redis is unavailable."""
+        try:
+            stats = self.stats(models)
+            circuits = circuit_breaker.states(models) if circuit_breaker.enabled else {}
+            open_circuits = {m for m, state in circuits.items() if state == "open"}
+        except RedisError as e:
+            logger.warning(f"Router stats unavailable, keeping configured order: {e}")
+            return list(models)
+        # sorted() is stable, so equally scored models keep their catalog order
+        return sorted(models, key=lambda m: (m in open_circuits, self._score(stats[m])))
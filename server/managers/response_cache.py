@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import time
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.metrics import CACHE_LOOKUPS
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially different submissions share a key."""
+    return " ".join(prompt.split())
+
+
+def prompt_fingerprint(prompt: str, model: str) -> str:
+    """Stable hash of (normalized prompt, full model name).
+
+    These are all a request can vary today; any option added later that
+    changes the output (temperature, system prompt...) must be part of it.
+    """
+    payload = json.dumps({"prompt": normalize_prompt(prompt), "model": model}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Exact-match completion cache in Redis with TTL, a size cap and LRU eviction.
+
+    Each entry is a plain string key whose TTL restarts on every hit; a sorted
+    set scored by last access time tracks recency so the least recently used
+    entries are dropped once the cache holds more than `max_entries`, and
+    members older than the TTL (their keys expired) are forgotten.
+    """
+
+    KEY = "cache:resp:{fingerprint}"
+    LRU_KEY = "cache:resp:lru"
+    STATS_KEY = "cache:resp:stats"
+
+    def __init__(self, enabled: bool = None, ttl: int = None, max_entries: int = None):
+        self.enabled = Config.RESPONSE_CACHE_ENABLED if enabled is None else enabled
+        self.ttl = ttl or Config.RESPONSE_CACHE_TTL
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_MAX_ENTRIES
+
+    def get(self, prompt: str, model: str):
+        """Cached completion or None; counts a hit or a miss."""
+        if not self.enabled:
+            return None
+        fingerprint = prompt_fingerprint(prompt, model)
+        try:
+            redis = get_redis()
+            key = self.KEY.format(fingerprint=fingerprint)
+            cached = redis.get(key)
+            pipe = redis.pipeline(transaction=False)
+            if cached is not None:
+                # Key TTL and LRU score both restart at the hit, so a member of the
+                # sorted set is never older than its key (see _evict)
+                pipe.expire(key, self.ttl)
+                pipe.zadd(self.LRU_KEY, {fingerprint: time.time()})
+                pipe.hincrby(self.STATS_KEY, "hits", 1)
+            else:
+                pipe.hincrby(self.STATS_KEY, "misses", 1)
+            pipe.execute()
+            CACHE_LOOKUPS.labels("response", "hit" if cached is not None else "miss").inc()
+        except RedisError as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+        return cached.decode() if cached is not None else None
+
+    def set(self, prompt: str, model: str, response: str):
+        if not self.enabled:
+            return
+        fingerprint = prompt_fingerprint(prompt, model)
+        try:
+            redis = get_redis()
+            pipe = redis.pipeline(transaction=False)
+            pipe.set(self.KEY.format(fingerprint=fingerprint), response, ex=self.ttl)
+            pipe.zadd(self.LRU_KEY, {fingerprint: time.time()})
+            pipe.execute()
+            self._evict(redis)
+        except RedisError as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    def _evict(self, redis):
+        # Forget entries whose TTL has already expired, then trim to the size cap
+        redis.zremrangebyscore(self.LRU_KEY, 0, time.time() - self.ttl)
+        excess = redis.zcard(self.LRU_KEY) - self.max_entries
+        if excess > 0:
+            evicted = [fingerprint.decode() for fingerprint, _ in redis.zpopmin(self.LRU_KEY, excess)]
+            redis.delete(*[self.KEY.format(fingerprint=f) for f in evicted])
+
+    def stats(self) -> dict:
+        redis = get_redis()
+        raw = redis.hgetall(self.STATS_KEY)
+        hits = int(raw.get(b"hits", 0))
+        misses = int(raw.get(b"misses", 0))
+        return {
+            "enabled": self.enabled,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": redis.zcard(self.LRU_KEY),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl
+        }
@@ -0,0 +1,146 @@
+import json
+import logging
+import time
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Delete the lock only if we still own it (it may have expired and been re-taken)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Extend the lock only if we still own it
+_HOLD_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesce identical in-flight LLM requests across workers.
+
+    The first task for a (model, prompt) fingerprint takes a short-lived Redis
+    lock and calls the provider; duplicates arriving meanwhile subscribe to the
+    leader's outcome instead. If the leader fails, times out or dies, followers
+    get None and fall back to calling the provider themselves. A leader whose
+    task is re-queued for a retry keeps the lock (hold()) and leads again when
+    it comes back, so followers wait for the retry rather than each calling the
+    failing provider.
+    This only covers requests that overlap in time; see ResponseCache for reuse.
+    """
+
+    LOCK_KEY = "inflight:lock:{fingerprint}"
+    RESULT_KEY = "inflight:result:{fingerprint}"
+    CHANNEL = "inflight:done:{fingerprint}"
+
+    def __init__(self, enabled: bool = None, lock_ttl: int = None, result_ttl: int = None):
+        self.enabled = Config.SINGLE_FLIGHT_ENABLED if enabled is None else enabled
+        self.lock_ttl = lock_ttl or Config.SINGLE_FLIGHT_LOCK_TTL
+        self.result_ttl = result_ttl or Config.SINGLE_FLIGHT_RESULT_TTL
+        self._release = None
+        self._hold = None
+
+    def acquire(self, fingerprint: str, owner: str) -> bool:
+        """True if the caller should call the provider (it is the leader, or coalescing is off)."""
+        if not self.enabled:
+            return True
+        try:
+            redis = get_redis()
+            lock_key = self.LOCK_KEY.format(fingerprint=fingerprint)
+            if redis.set(lock_key, owner, nx=True, ex=self.lock_ttl):
+                # Followers of this flight must not pick up the previous flight's outcome
+                redis.delete(self.RESULT_KEY.format(fingerprint=fingerprint))
+                return True
+            # A retried task finds the lock it held (see hold()) and leads again
+            held = redis.get(lock_key)
+            if held is not None and held.decode() == owner:
+                redis.expire(lock_key, self.lock_ttl)
+                return True
+            return False
+        except RedisError as e:
+            logger.warning(f"Single-flight lock unavailable, calling provider directly: {e}")
+            return True
+
+    def leader(self, fingerprint: str):
+        """Owner (task id) of the flight in progress for `fingerprint`, or None."""
+        if not self.enabled:
+            return None
+        try:
+            owner = get_redis().get(self.LOCK_KEY.format(fingerprint=fingerprint))
+        except RedisError as e:
+            logger.warning(f"Single-flight lookup failed: {e}")
+            return None
+        return owner.decode() if owner is not None else None
+
+    def hold(self, fingerprint: str, owner: str, ttl: float) -> bool:
+        """Keep the flight for `owner` for `ttl` seconds (e.g. across a re-queued retry); False if not its owner."""
+        if not self.enabled:
+            return False
+        try:
+            redis = get_redis()
+            if self._hold is None:
+                self._hold = redis.register_script(_HOLD_SCRIPT)
+            return bool(self._hold(keys=[self.LOCK_KEY.format(fingerprint=fingerprint)],
+                                   args=[owner, max(int(ttl), 1)]))
+        except RedisError as e:
+            logger.warning(f"Single-flight hold failed: {e}")
+            return False
+
+    def complete(self, fingerprint: str, owner: str, result: str = None):
+        """Leader hands its result (None on failure) to followers and releases the lock."""
+        if not self.enabled:
+            return
+        message = json.dumps({"ok": result is not None, "result": result})
+        try:
+            redis = get_redis()
+            if result is not None:
+                redis.set(self.RESULT_KEY.format(fingerprint=fingerprint), message, ex=self.result_ttl)
+            if self._release is None:
+                self._release = redis.register_script(_RELEASE_SCRIPT)
+            self._release(keys=[self.LOCK_KEY.format(fingerprint=fingerprint)], args=[owner])
+            redis.publish(self.CHANNEL.format(fingerprint=fingerprint), message)
+        except RedisError as e:
+            logger.warning(f"Single-flight completion failed: {e}")
+
+    def wait(self, fingerprint: str, timeout: float = None):
+        """Follower side: the leader's result, or None if it failed or never finished.
+
+        Without `timeout`, waits as long as the flight is held (the lock's TTL
+        bounds it, including across a leader's re-queued retries).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        lock_key = self.LOCK_KEY.format(fingerprint=fingerprint)
+        result_key = self.RESULT_KEY.format(fingerprint=fingerprint)
+        try:
+            redis = get_redis()
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                # Subscribe first, then check for a result published before we arrived
+                pubsub.subscribe(self.CHANNEL.format(fingerprint=fingerprint))
+                while deadline is None or time.monotonic() < deadline:
+                    # Lock before result: the leader stores its result before releasing the lock
+                    leader_alive = redis.exists(lock_key)
+                    raw = redis.get(result_key)
+                    if raw is None and not leader_alive:
+                        # No leader any more and nothing stored: it failed or crashed
+                        return None
+                    if raw is None:
+                        wait = 1.0 if deadline is None else min(1.0, max(deadline - time.monotonic(), 0))
+                        message = pubsub.get_message(timeout=wait)
+                        raw = message["data"] if message else None
+                    if raw is not None:
+                        outcome = json.loads(raw)
+                        return outcome["result"] if outcome["ok"] else None
+            finally:
+                pubsub.close()
+        except RedisError as e:
+            logger.warning(f"Single-flight wait failed: {e}")
+        return None
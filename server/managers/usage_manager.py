@@ -1,42 +1,143 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
 from pathlib import Path
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.redis_client import get_redis
 from server.managers.llm_model_manager import LLMModelManager
 from server.managers.resource_manager import ResourceManager
 
+logger = logging.getLogger(__name__)
+
+
 class UsageManager:
-    def __init__(self, file_path="usage.json", model_manager: LLMModelManager = None):
+    """Per-model usage counters shared by every process through Redis.
+
+    log_usage() only bumps an in-memory counter; a background thread pushes
+    pending counts with HINCRBY (totals and per-day hashes) every `flush_interval`
+    seconds, and they are pushed on process exit. Reads merge the Redis totals
+    with this process's pending counts.
+    """
+
+    TOTAL_KEY = "usage:total"
+    DAILY_KEY = "usage:daily:{day}"
+
+    def __init__(self, file_path="usage.json", model_manager: LLMModelManager = None, flush_interval: float = None):
         self.file_path = Path(file_path)
         self.model_manager = model_manager or LLMModelManager()
-        self.usage = {}
+        self.flush_interval = Config.USAGE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._pending = Counter()  # {(day, model): tokens}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
 
+        # Seed counters from a legacy usage.json snapshot (no-op once Redis has totals)
         if self.file_path.exists():
             self.load_from_file()
-        else:
-            self.usage = {model: 0 for model in self.model_manager.get_models()}
-            self.export_to_file()
+
+    @property
+    def usage(self) -> dict:
+        return self.get_all_usage()
+
+    def _ensure_started(self):
+        # Started lazily so each forked Celery/Gunicorn child gets its own thread
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
 
     def log_usage(self, model: str, tokens: int) -> bool:
-        if model not in self.model_manager.get_models():
+        if not self.model_manager.has_model(model):
             raise ValueError(f"Model '{model}' not recognized in LLMModelManager")
-        self.usage[model] = self.usage.get(model, 0) + tokens
-        self.export_to_file()
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        with self._lock:
+            self._pending[(day, model)] += tokens
+        self._ensure_started()
         return True
 
+    def flush(self):
+        """Push pending counts to Redis; on failure they are kept for the next flush."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            ttl = Config.USAGE_DAILY_TTL_DAYS * 86400
+            for (day, model), tokens in pending.items():
+                daily_key = self.DAILY_KEY.format(day=day)
+                pipe.hincrby(self.TOTAL_KEY, model, tokens)
+                pipe.hincrby(daily_key, model, tokens)
+                pipe.expire(daily_key, ttl)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Usage flush failed, keeping {len(pending)} pending counters: {e}")
+            with self._lock:
+                self._pending.update(pending)
+
+    def _pending_totals(self) -> Counter:
+        totals = Counter()
+        with self._lock:
+            for (_, model), tokens in self._pending.items():
+                totals[model] += tokens
+        return totals
+
+    def get_all_usage(self) -> dict:
+        """Aggregated usage across all processes, plus this process's unflushed counts."""
+        totals = Counter({k.decode(): int(v) for k, v in get_redis().hgetall(self.TOTAL_KEY).items()})
+        totals.update(self._pending_totals())
+        return dict(totals)
+
+    def get_daily_usage(self, day: str = None) -> dict:
+        day = day or datetime.utcnow().strftime("%Y-%m-%d")
+        usage = get_redis().hgetall(self.DAILY_KEY.format(day=day))
+        return {k.decode(): int(v) for k, v in usage.items()}
+
     def get_usage(self, model: str) -> int:
-        return self.usage.get(model, 0)
+        return int(get_redis().hget(self.TOTAL_KEY, model) or 0) + self._pending_totals()[model]
 
     def get_total_usage(self) -> int:
-        return sum(self.usage.values())
+        return sum(self.get_all_usage().values())
 
     def reset(self):
-        self.usage = {model: 0 for model in self.model_manager.get_models()}
-        self.export_to_file()
+        with self._lock:
+            self._pending.clear()
+        redis = get_redis()
+        daily_keys = list(redis.scan_iter(match=self.DAILY_KEY.format(day="*")))
+        redis.delete(self.TOTAL_KEY, *daily_keys)
 
     def export_to_file(self, file_path=None):
+        """Write a snapshot of the aggregated totals (not used on the request path)."""
         path = Path(file_path or self.file_path)
-        ResourceManager.save_json(path, self.usage)
+        ResourceManager.save_json(path, self.get_all_usage())
         return path
 
     def load_from_file(self, file_path=None):
+        """Seed Redis totals from a JSON snapshot without overwriting existing counters."""
         path = Path(file_path or self.file_path)
-        self.usage = ResourceManager.load_json(path)
-        return self.usage
+        usage = ResourceManager.load_json(path)
+        try:
+            redis = get_redis()
+            if not redis.exists(self.TOTAL_KEY):
+                for model, tokens in usage.items():
+                    redis.hsetnx(self.TOTAL_KEY, model, int(tokens))
+        except RedisError as e:
+            logger.warning(f"Could not seed usage counters from {path}: {e}")
+        return usage
@@ -0,0 +1,168 @@
+import logging
+import time
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Closed: allow (1). Open: refuse (0) until reset_timeout has passed, then let a few probes through (2).
+_ALLOW_SCRIPT = """
+if redis.call('hget', KEYS[1], 'state') ~= 'open' then
+    return 1
+end
+local opened_at = tonumber(redis.call('hget', KEYS[1], 'opened_at'))
+if tonumber(ARGV[1]) - opened_at < tonumber(ARGV[2]) then
+    return 0
+end
+local probes = tonumber(redis.call('get', KEYS[2]) or '0')
+if probes >= tonumber(ARGV[3]) then
+    return 0
+end
+if redis.call('incr', KEYS[2]) == 1 then
+    redis.call('expire', KEYS[2], ARGV[2])
+end
+return 2
+"""
+
+# A probe that ended without a verdict (neither success nor transient failure) frees its slot
+_RELEASE_PROBE_SCRIPT = """
+if tonumber(redis.call('get', KEYS[2]) or '0') > 0 then
+    return redis.call('decr', KEYS[2])
+end
+return 0
+"""
+
+# A failed probe re-opens the circuit; otherwise count consecutive failures and trip at the threshold
+_FAILURE_SCRIPT = """
+if redis.call('hget', KEYS[1], 'state') == 'open' then
+    redis.call('hset', KEYS[1], 'opened_at', ARGV[1])
+    redis.call('del', KEYS[2])
+    redis.call('expire', KEYS[1], ARGV[4])
+    return 1
+end
+local failures = redis.call('hincrby', KEYS[1], 'failures', 1)
+if failures >= tonumber(ARGV[2]) then
+    redis.call('hset', KEYS[1], 'state', 'open', 'opened_at', ARGV[1])
+    redis.call('del', KEYS[2])
+    redis.call('expire', KEYS[1], ARGV[4])
+    return 1
+end
+redis.call('expire', KEYS[1], ARGV[3])
+return 0
+"""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit is open."""
+
+    def __init__(self, key: str, retry_after: float = None):
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__(f"Circuit open for '{key}', failing fast")
+
+
+class CircuitBreaker:
+    """Per-model circuit breaker whose state is shared by all workers through Redis.
+
+    After `failure_threshold` consecutive transient failures (within
+    `failure_window` seconds of each other) the circuit opens and calls fail
+    fast with CircuitOpenError. Once `reset_timeout` seconds pass, up to
+    `half_open_calls` probe calls are let through: a success closes the
+    circuit, a failure re-opens it for another `reset_timeout`.
+    If Redis is unreachable the breaker stays out of the way.
+    """
+
+    KEY = "circuit:{key}"
+    PROBE_KEY = "circuit:{key}:probe"
+
+    def __init__(self, enabled: bool = None, failure_threshold: int = None, failure_window: int = None,
+                 reset_timeout: int = None, half_open_calls: int = None):
+        self.enabled = Config.CIRCUIT_ENABLED if enabled is None else enabled
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.failure_window = failure_window or Config.CIRCUIT_FAILURE_WINDOW
+        self.reset_timeout = reset_timeout or Config.CIRCUIT_RESET_TIMEOUT
+        self.half_open_calls = half_open_calls or Config.CIRCUIT_HALF_OPEN_CALLS
+        self._scripts = {}
+
+    def _script(self, redis, source: str):
+        if source not in self._scripts:
+            self._scripts[source] = redis.register_script(source)
+        return self._scripts[source]
+
+    def _keys(self, key: str) -> list:
+        return [self.KEY.format(key=key), self.PROBE_KEY.format(key=key)]
+
+    def before_call(self, key: str) -> bool:
+        """Raise CircuitOpenError if `key` must not be called right now; True if the call is a half-open probe.
+
+        A probe must end in record_success(), record_failure() or release_probe().
+        """
+        if not self.enabled:
+            return False
+        try:
+            redis = get_redis()
+            allowed = self._script(redis, _ALLOW_SCRIPT)(
+                keys=self._keys(key), args=[time.time(), self.reset_timeout, self.half_open_calls]
+            )
+        except RedisError as e:
+            logger.warning(f"Circuit breaker unavailable, allowing call: {e}")
+            return False
+        if not allowed:
+            raise CircuitOpenError(key, self.reset_timeout)
+        return allowed == 2
+
+    def release_probe(self, key: str):
+        """Give back a probe slot whose call ended without saying anything about the upstream."""
+        if not self.enabled:
+            return
+        try:
+            redis = get_redis()
+            self._script(redis, _RELEASE_PROBE_SCRIPT)(keys=self._keys(key))
+        except RedisError as e:
+            logger.warning(f"Circuit breaker update failed: {e}")
+
+    def record_success(self, key: str):
+        if not self.enabled:
+            return
+        try:
+            get_redis().delete(*self._keys(key))
+        except RedisError as e:
+            logger.warning(f"Circuit breaker update failed: {e}")
+
+    def record_failure(self, key: str):
+        if not self.enabled:
+            return
+        try:
+            redis = get_redis()
+            opened = self._script(redis, _FAILURE_SCRIPT)(
+                keys=self._keys(key),
+                args=[time.time(), self.failure_threshold, self.failure_window, Config.CIRCUIT_STATE_TTL]
+            )
+            if opened:
+                logger.warning(f"Circuit opened for '{key}'")
+        except RedisError as e:
+            logger.warning(f"Circuit breaker update failed: {e}")
+
+    def state(self, key: str) -> str:
+        """"closed", "open" or "half_open" (open but due for a probe)."""
+        return self.states([key])[key]
+
+    def states(self, keys: list) -> dict:
+        """state() for many keys in one round trip."""
+        pipe = get_redis().pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(self.KEY.format(key=key))
+        now = time.time()
+        states = {}
+        for key, raw in zip(keys, pipe.execute()):
+            if raw.get(b"state") != b"open":
+                states[key] = "closed"
+            elif now - float(raw[b"opened_at"]) < self.reset_timeout:
+                states[key] = "open"
+            else:
+                states[key] = "half_open"
+        return states
+
+
+circuit_breaker = CircuitBreaker()
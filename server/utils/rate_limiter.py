@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from redis.exceptions import RedisError
+from server.config import Config
+from server.infrastructure.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# All-or-nothing acquire across scopes (model, provider). Per scope:
+#   KEYS: bucket hash {tokens, ts}, lease sorted set {lease_id: expiry}
+#   ARGV: rate (tokens/s, 0 = unlimited), capacity, max_concurrency (0 = unlimited)
+# Returns "0" once a token and a lease are taken everywhere, otherwise the seconds to wait.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local lease_id = ARGV[2]
+local lease_expiry = tonumber(ARGV[3])
+local poll = tonumber(ARGV[4])
+local scopes = #KEYS / 2
+local wait = 0
+local tokens = {}
+
+for i = 1, scopes do
+    local rate = tonumber(ARGV[4 + (i - 1) * 3 + 1])
+    local capacity = tonumber(ARGV[4 + (i - 1) * 3 + 2])
+    local max_concurrency = tonumber(ARGV[4 + (i - 1) * 3 + 3])
+    if rate > 0 then
+        local bucket = redis.call('hmget', KEYS[2 * i - 1], 'tokens', 'ts')
+        local level = tonumber(bucket[1]) or capacity
+        local ts = tonumber(bucket[2]) or now
+        level = math.min(capacity, level + math.max(now - ts, 0) * rate)
+        tokens[i] = level
+        if level < 1 then
+            wait = math.max(wait, (1 - level) / rate)
+        end
+    end
+    if max_concurrency > 0 then
+        redis.call('zremrangebyscore', KEYS[2 * i], '-inf', now)
+        if redis.call('zcard', KEYS[2 * i]) >= max_concurrency then
+            wait = math.max(wait, poll)
+        end
+    end
+end
+
+if wait > 0 then
+    return tostring(wait)
+end
+
+for i = 1, scopes do
+    local rate = tonumber(ARGV[4 + (i - 1) * 3 + 1])
+    local capacity = tonumber(ARGV[4 + (i - 1) * 3 + 2])
+    local max_concurrency = tonumber(ARGV[4 + (i - 1) * 3 + 3])
+    if rate > 0 then
+        redis.call('hset', KEYS[2 * i - 1], 'tokens', tokens[i] - 1, 'ts', now)
+        redis.call('expire', KEYS[2 * i - 1], math.ceil(capacity / rate) + 60)
+    end
+    if max_concurrency > 0 then
+        redis.call('zadd', KEYS[2 * i], lease_expiry, lease_id)
+        redis.call('expire', KEYS[2 * i], math.ceil(lease_expiry - now) + 60)
+    end
+end
+return "0"
+"""
+
+
+class RateLimitExceeded(Exception):
+    """No capacity for a model within RATE_LIMIT_MAX_WAIT; retry after `retry_after` seconds."""
+
+    def __init__(self, key: str, retry_after: float):
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit reached for '{key}', retry in {retry_after:.1f}s")
+
+
+class RateLimiter:
+    """Distributed token-bucket rate limiter plus in-flight cap, per model and per provider.
+
+    Limits come from the model catalog (LLMModel.rpm / max_concurrency, else
+    DEFAULT_MODEL_*) and PROVIDER_LIMITS. Buckets refill at RATE_LIMIT_HEADROOM
+    times the declared rpm and hold RATE_LIMIT_BURST_SECONDS worth of tokens,
+    so workers together stay just under the upstream limit. Concurrency
+    leases expire after RATE_LIMIT_LEASE_TTL in case a worker dies holding one.
+    Waits up to RATE_LIMIT_MAX_WAIT, then raises RateLimitExceeded.
+    If Redis is unreachable calls go through unlimited.
+    """
+
+    BUCKET_KEY = "ratelimit:bucket:{scope}"
+    LEASE_KEY = "ratelimit:leases:{scope}"
+    POLL_INTERVAL = 0.1  # seconds between checks while at the concurrency cap
+
+    def __init__(self, enabled: bool = None, max_wait: float = None):
+        self.enabled = Config.RATE_LIMIT_ENABLED if enabled is None else enabled
+        self.max_wait = Config.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        self._acquire = None
+
+    def _scopes(self, model: str, provider: str = None, rpm: int = None, max_concurrency: int = None) -> list:
+        """[(scope, rpm, max_concurrency)] for every scope that has a limit."""
+        scopes = [(f"model:{model}", rpm or Config.DEFAULT_MODEL_RPM,
+                   max_concurrency or Config.DEFAULT_MODEL_CONCURRENCY)]
+        provider_limits = Config.PROVIDER_LIMITS.get(provider) or {}
+        scopes.append((f"provider:{provider}", provider_limits.get("rpm", 0), provider_limits.get("max_concurrency", 0)))
+        return [scope for scope in scopes if scope[1] or scope[2]]
+
+    def _try_acquire(self, scopes: list, lease_id: str) -> float:
+        """0 if acquired, else seconds to wait before trying again."""
+        redis = get_redis()
+        if self._acquire is None:
+            self._acquire = redis.register_script(_ACQUIRE_SCRIPT)
+        now = time.time()
+        keys, args = [], [now, lease_id, now + Config.RATE_LIMIT_LEASE_TTL, self.POLL_INTERVAL]
+        for scope, rpm, max_concurrency in scopes:
+            rate = rpm * Config.RATE_LIMIT_HEADROOM / 60
+            keys += [self.BUCKET_KEY.format(scope=scope), self.LEASE_KEY.format(scope=scope)]
+            args += [rate, max(1.0, rate * Config.RATE_LIMIT_BURST_SECONDS), max_concurrency]
+        return float(self._acquire(keys=keys, args=args))
+
+    def _release(self, scopes: list, lease_id: str):
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for scope, _, max_concurrency in scopes:
+                if max_concurrency:
+                    pipe.zrem(self.LEASE_KEY.format(scope=scope), lease_id)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Failed to release rate limit lease: {e}")
+
+    def _next_wait(self, scopes: list, lease_id: str, deadline: float, model: str):
+        """None once acquired (or limiting is unavailable), else how long to sleep."""
+        try:
+            wait = self._try_acquire(scopes, lease_id)
+        except RedisError as e:
+            logger.warning(f"Rate limiter unavailable, calling {model} unlimited: {e}")
+            return None
+        if not wait:
+            return None
+        if time.monotonic() + wait > deadline:
+            raise RateLimitExceeded(model, wait)
+        return wait
+
+    @contextmanager
+    def limit(self, model: str, provider: str = None, rpm: int = None, max_concurrency: int = None):
+        """Hold a token and a concurrency lease for `model` while the block runs."""
+        scopes = self._scopes(model, provider, rpm, max_concurrency) if self.enabled else []
+        if not scopes:
+            yield
+            return
+        lease_id = uuid.uuid4().hex
+        deadline = time.monotonic() + self.max_wait
+        while (wait := self._next_wait(scopes, lease_id, deadline, model)) is not None:
+            time.sleep(wait)
+        try:
+            yield
+        finally:
+            self._release(scopes, lease_id)
+
+    @asynccontextmanager
+    async def alimit(self, model: str, provider: str = None, rpm: int = None, max_concurrency: int = None):
+        """Async variant of limit(): waits with asyncio.sleep so the event loop keeps running."""
+        scopes = self._scopes(model, provider, rpm, max_concurrency) if self.enabled else []
+        if not scopes:
+            yield
+            return
+        lease_id = uuid.uuid4().hex
+        deadline = time.monotonic() + self.max_wait
+        while (wait := self._next_wait(scopes, lease_id, deadline, model)) is not None:
+            await asyncio.sleep(wait)
+        try:
+            yield
+        finally:
+            self._release(scopes, lease_id)
+
+
+rate_limiter = RateLimiter()
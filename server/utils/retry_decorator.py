@@ -1,34 +1,247 @@
 import time
+import random
+import asyncio
+import inspect
+import logging
 import functools
-from openai import InternalServerError, RateLimitError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 import requests
+from server.config import Config
+from server.infrastructure import tracing
+from server.infrastructure.metrics import RETRIES
+from server.utils.circuit_breaker import CircuitOpenError, circuit_breaker
 
+logger = logging.getLogger(__name__)
 
-def retry_request(retries=5, backoff_factor=2, exceptions=None):
+# Upstream failures worth retrying
+TRANSIENT_ERRORS = (InternalServerError, RateLimitError, APIConnectionError, APITimeoutError,
+                    requests.exceptions.RequestException,
+                    TimeoutError, ConnectionError)
+
+# When set, retry_request re-raises on the first failure instead of sleeping in-process
+_deferred = ContextVar("retry_deferred", default=False)
+
+
+@contextmanager
+def deferred_retries():
+    """Disable in-process retries so the caller (a Celery task) can reschedule itself instead."""
+    token = _deferred.set(True)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms headers), or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(float(headers["retry-after-ms"]) / 1000, 0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, backoff_factor: float, error=None, max_delay: float = None):
+    """Delay before retry number `attempt` (0-based), or None if it should not be retried.
+
+    A Retry-After hint from the server wins; otherwise "full jitter" backoff,
+    uniform in [0, backoff_factor ** attempt], so workers that failed together
+    do not retry together. Hints longer than `max_delay` mean giving up now
+    rather than holding a worker slot.
+    """
+    max_delay = Config.RETRY_MAX_DELAY if max_delay is None else max_delay
+    hinted = retry_after(error)
+    if hinted is not None:
+        return hinted if hinted <= max_delay else None
+    return min(random.uniform(0, backoff_factor ** attempt), max_delay)
+
+
+def retry_request(retries=5, backoff_factor=2, exceptions=None, circuit=None, stream_error=None):
     """
-    Decorator to retry OpenAI API calls on errors with exponential backoff.
+    Decorator to retry OpenAI API calls on errors with jittered exponential backoff.
+
+    Works on plain functions, coroutines, generators and async generators. A
+    generator is retried only until it yields its first item; after that an
+    error is re-raised, since the caller has already consumed partial output.
+    Inside deferred_retries() the first failure is re-raised immediately.
 
     Parameters:
         retries (int): Max attempts
-        backoff_factor (int): Exponential backoff factor (2 => 1s, 2s, 4s...)
+        backoff_factor (int): Exponential backoff factor (2 => up to 1s, 2s, 4s...)
         exceptions (tuple): Exception types to catch (defaults include InternalServerError, RateLimitError, network errors)
+        circuit (callable): Optional fn(*args, **kwargs) -> circuit key (e.g. the model name); calls go
+            through the shared circuit breaker, which fails fast with CircuitOpenError while it is open
+        stream_error (callable): Optional fn(error) -> item for generators: an error after the first item
+            is recorded as the call's failure, then yielded as stream_error(error) instead of raised
     """
     if exceptions is None:
-        exceptions = (InternalServerError, RateLimitError,
-                      requests.exceptions.RequestException,
-                      TimeoutError, ConnectionError)
+        exceptions = TRANSIENT_ERRORS
+
+    def circuit_key(args, kwargs):
+        return circuit(*args, **kwargs) if circuit else None
+
+    def before(key, attempt):
+        """Ask the circuit breaker; returns True if this attempt is a half-open probe."""
+        if key is None:
+            return False
+        try:
+            return circuit_breaker.before_call(key)
+        except CircuitOpenError:
+            if attempt > 0:
+                circuit_breaker.record_failure(key)  # the call gives up here: count its earlier failure
+            raise
+
+    def succeeded(key):
+        if key is not None:
+            circuit_breaker.record_success(key)
+
+    def released(key, probe):
+        # The attempt ended in an error that says nothing about the upstream (or was abandoned)
+        if probe:
+            circuit_breaker.release_probe(key)
+
+    def failed(key, attempt, e, started=False, probe=False):
+        """Return the delay before the next attempt, or None to re-raise.
+
+        The circuit breaker sees one failure per call that gives up, not one
+        per attempt, so a single caller's retries cannot open it for everyone.
+        A half-open probe gets a single attempt: its failure re-opens the circuit.
+        """
+        wait = None
+        if not (started or probe or _deferred.get() or attempt == retries - 1):
+            wait = backoff_delay(attempt, backoff_factor, e)
+        if wait is None:  # last attempt, output already yielded, deferred, or Retry-After too long
+            if key is not None:
+                circuit_breaker.record_failure(key)
+        else:
+            RETRIES.labels(type(e).__name__, "in_process").inc()
+            tracing.add_event("retry", error=type(e).__name__, attempt=attempt + 1, delay=wait)
+            logger.warning(f"{type(e).__name__}: {e}. Retrying in {wait:.1f}s...")
+        return wait
+
+    async def off_loop(fn, key, *args):
+        # Circuit breaker calls are Redis round trips: keep them off the event loop
+        return fn(key, *args) if key is None else await asyncio.to_thread(fn, key, *args)
 
     def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                key = await asyncio.to_thread(circuit_key, args, kwargs) if circuit else None
+                for i in range(retries):
+                    probe = await off_loop(before, key, i)
+                    started = False
+                    try:
+                        async for item in func(*args, **kwargs):
+                            started = True
+                            yield item
+                    except exceptions as e:
+                        wait = await off_loop(failed, key, i, e, started, probe)
+                        if wait is None:
+                            if not (started and stream_error):
+                                raise
+                            yield stream_error(e)
+                            return
+                        await asyncio.sleep(wait)
+                        continue
+                    except Exception as e:
+                        await off_loop(released, key, probe)
+                        if not (started and stream_error):
+                            raise
+                        yield stream_error(e)
+                        return
+                    except BaseException:
+                        await off_loop(released, key, probe)
+                        raise
+                    await off_loop(succeeded, key)
+                    return
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = await asyncio.to_thread(circuit_key, args, kwargs) if circuit else None
+                for i in range(retries):
+                    probe = await off_loop(before, key, i)
+                    try:
+                        result = await func(*args, **kwargs)
+                    except exceptions as e:
+                        wait = await off_loop(failed, key, i, e, False, probe)
+                        if wait is None:
+                            raise
+                        await asyncio.sleep(wait)  # yields the event loop to other requests
+                        continue
+                    except BaseException:
+                        await off_loop(released, key, probe)
+                        raise
+                    await off_loop(succeeded, key)
+                    return result
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                key = circuit_key(args, kwargs)
+                for i in range(retries):
+                    probe = before(key, i)
+                    started = False
+                    try:
+                        for item in func(*args, **kwargs):
+                            started = True
+                            yield item
+                    except exceptions as e:
+                        wait = failed(key, i, e, started, probe)
+                        if wait is None:
+                            if not (started and stream_error):
+                                raise
+                            yield stream_error(e)
+                            return
+                        time.sleep(wait)
+                        continue
+                    except Exception as e:
+                        released(key, probe)
+                        if not (started and stream_error):
+                            raise
+                        yield stream_error(e)
+                        return
+                    except BaseException:
+                        released(key, probe)
+                        raise
+                    succeeded(key)
+                    return
+            return gen_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            key = circuit_key(args, kwargs)
             for i in range(retries):
+                probe = before(key, i)
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 except exceptions as e:
-                    if i == retries - 1:
-                        raise  # re-raise after last attempt
-                    wait = backoff_factor ** i
-                    print(f"⚠️ {type(e).__name__}: {e}. Retrying in {wait}s...")
+                    wait = failed(key, i, e, False, probe)
+                    if wait is None:
+                        raise
                     time.sleep(wait)
+                    continue
+                except BaseException:
+                    released(key, probe)
+                    raise
+                succeeded(key)
+                return result
         return wrapper
     return decorator
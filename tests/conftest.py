@@ -0,0 +1,18 @@
+import pytest
+from flask import Flask
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    """A bare app on a file-backed SQLite database with every table (and the search index) created."""
+    from server.database import db, search
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'history.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        search._indexed = None
+        search.ensure_search_index(db.engine)
+        yield app
+        db.session.remove()
+    search._indexed = None
@@ -0,0 +1,11 @@
+from client.api_client import _parse_sse, _prompt_payload
+
+def test_parse_sse_skips_keepalives():
+    lines = [": keep-alive", "", "id: 1-0", "event: chunk", 'data: "Hel"', "",
+             "id: 1-1", "event: chunk", 'data: "lo"', "", "id: 1-2", "event: end", 'data: ""', ""]
+    assert list(_parse_sse(lines)) == [("1-0", "chunk", "Hel"), ("1-1", "chunk", "lo"), ("1-2", "end", "")]
+
+def test_prompt_payload_prefers_models_list():
+    payload = _prompt_payload("hi", models=("a", "b"), model_name="c")
+    assert payload["models"] == ["a", "b"] and "model_name" not in payload
+    assert _prompt_payload("hi", model_name="c")["model_name"] == "c"
@@ -0,0 +1,17 @@
+import asyncio
+import threading
+from flask import Flask
+from server.config import Config
+from server.infrastructure.async_runner import AsyncRunner
+
+def test_blocking_hops_get_a_thread_per_concurrent_call(monkeypatch):
+    monkeypatch.setattr(Config, "ASYNC_LLM_CONCURRENCY", 64)
+    runner = AsyncRunner(Flask(__name__))
+    # More simultaneous to_thread calls than the stock default executor (at most 32 threads) can run
+    barrier = threading.Barrier(48, timeout=5)
+
+    async def calls():
+        return await asyncio.gather(*(asyncio.to_thread(barrier.wait) for _ in range(48)))
+
+    assert len(runner.run(calls(), timeout=10)) == 48
+    assert runner._executor._max_workers == 64
@@ -0,0 +1,27 @@
+import json
+from server.jobs.batch import append_output, plan_chunks, read_output, read_rows
+
+def test_plan_chunks_skips_blank_lines_and_offset(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"prompt": "a"}\n\n{"prompt": "b"}\n{"prompt": "c"}\n{"prompt": "d"}\n')
+    rows, chunks = plan_chunks(str(path), chunk_size=2, offset=1)
+    assert rows == 4
+    assert [(c["first_row"], c["count"]) for c in chunks] == [(1, 2), (3, 1)]
+
+def test_read_rows_seeks_to_chunk(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"prompt": "a"}\n\n{"prompt": "b"}\n{"prompt": "c"}\n')
+    _, chunks = plan_chunks(str(path), chunk_size=2, offset=1)
+    assert [(row, line.strip()) for row, line in read_rows(str(path), chunks[0])] == \
+        [(1, '{"prompt": "b"}'), (2, '{"prompt": "c"}')]
+
+def test_read_output_keeps_last_line_per_row(tmp_path):
+    path = str(tmp_path / "output.jsonl")
+    append_output(path, {"row": 0, "result": "a"})
+    append_output(path, {"row": 1, "error": "RateLimitError: slow down"})
+    append_output(path, {"row": 0, "result": "a"})  # written again after a crash before mark_row
+    append_output(path, {"row": 1, "result": "b"})  # retry_failed
+    with open(path, "a") as f:
+        f.write('{"row": 2, "res')  # still being written
+    assert [json.loads(line) for line in read_output(path, total=3)] == \
+        [{"row": 0, "result": "a"}, {"row": 1, "result": "b"}]
@@ -0,0 +1,33 @@
+from server.config import Config
+from server.database.content_store import content_hash, decode, encode
+
+def test_small_text_is_stored_uncompressed():
+    assert encode("hi") == ("none", b"hi")
+
+def test_large_text_round_trips_compressed():
+    text = "lorem ipsum " * Config.CONTENT_COMPRESS_MIN_BYTES
+    compression, data = encode(text)
+    assert compression != "none" and len(data) < len(text)
+    assert decode(compression, data) == text
+
+def test_content_hash_is_stable_sha256():
+    assert content_hash("a") == content_hash("a") != content_hash("b")
+    assert len(content_hash("a")) == 64
+
+def test_to_records_round_trips_through_record_texts(sqlite_app):
+    from server.database import db
+    from server.database.content_store import record_texts, to_records
+    from server.database.models import PromptContent, PromptRecord
+
+    long_text = "lorem ipsum " * Config.CONTENT_COMPRESS_MIN_BYTES
+    rows = to_records([{"prompt_text": long_text, "completion_text": "short", "model_name": "openai/a:"},
+                       {"prompt_text": long_text, "completion_text": None, "model_name": "openai/a:"}])
+    assert rows[0]["prompt_hash"] == rows[1]["prompt_hash"] and rows[1]["completion_hash"] is None
+    assert rows[0]["prompt_length"] == len(long_text) and "prompt_text" not in rows[0]
+    db.session.execute(PromptRecord.__table__.insert(), rows)
+    db.session.commit()
+
+    assert PromptContent.query.count() == 2  # the repeated prompt is stored once
+    first, second = PromptRecord.query.order_by(PromptRecord.id).all()
+    assert record_texts(first) == (long_text, "short")
+    assert record_texts(second) == (long_text, None)
@@ -0,0 +1,49 @@
+from datetime import datetime
+from server.database import db, search
+from server.database.content_store import to_records
+from server.database.models import PromptRecord
+from server.database.search import fts5_query, rebuild_search_index, search_history
+
+def test_fts5_query_quotes_words():
+    assert fts5_query('python "sort" OR NEAR(x') == '"python" "sort" "OR" "NEAR" "x"'
+
+def _add(prompt, completion, model="openai/a:", timestamp=datetime(2026, 1, 1)):
+    db.session.execute(PromptRecord.__table__.insert(), to_records([{
+        "prompt_text": prompt, "completion_text": completion, "model_name": model, "timestamp": timestamp}]))
+    db.session.commit()
+
+def _ids(result):
+    return [r["id"] for r in result["results"]]
+
+def test_filters_and_ranking_run_in_one_query(sqlite_app):
+    _add("sort a list in python", "use sorted()", model="openai/b:")  # 1: best match, other model
+    for _ in range(5):
+        _add("python " + "filler " * 50, "ok")                       # 2..6: weaker, newer
+    _add("python sort sort sort", "sorted", timestamp=datetime(2025, 6, 1))  # 7: strong, older
+
+    ranked = search_history("python sort")
+    assert ranked["backend"] == "sqlite"
+    assert _ids(ranked) == [7, 1]  # FTS5 requires every word
+    assert _ids(search_history("python sort", model_name="openai/b:")) == [1]
+    assert _ids(search_history("python sort", since=datetime(2025, 12, 1))) == [1]
+    page = search_history("python", limit=2, offset=2)
+    assert len(page["results"]) == 2 and page["next_offset"] == 4
+
+def test_scan_fallback_matches_beyond_the_preview(sqlite_app, monkeypatch):
+    _add("x" * 1000 + " needle", "answer")
+    _add("nothing here", "needle in the answer", model="openai/b:")
+    monkeypatch.setattr(search, "_indexed", False)
+    result = search_history("NEEDLE")
+    assert result["backend"] == "scan" and _ids(result) == [2, 1]
+    assert _ids(search_history("needle answer", model_name="openai/a:")) == [1]
+
+def test_reindex_covers_texts_in_the_legacy_columns(sqlite_app):
+    db.session.execute(PromptRecord.__table__.insert(), [{"prompt_text": "legacy walrus", "model_name": "openai/a:"}])
+    db.session.commit()
+    _add("new walrus", None)
+    assert _ids(search_history("walrus")) == [2]  # the old record's text is not stored as content yet
+
+    from server.database.retention import migrate_content
+    assert migrate_content() == 1
+    assert rebuild_search_index() == 2  # every stored content, old and new
+    assert sorted(_ids(search_history("walrus"))) == [1, 2]
@@ -0,0 +1,36 @@
+import pytest
+from redis.exceptions import ConnectionError
+from server.managers import llm_model_manager
+from server.managers.llm_model_manager import LLMModelManager
+
+@pytest.fixture
+def manager(sqlite_app, monkeypatch):
+    def unreachable():
+        raise ConnectionError("no redis in tests")
+    # Without Redis the catalog is read from the DB on every lookup
+    monkeypatch.setattr(llm_model_manager, "get_redis", unreachable)
+    return LLMModelManager()
+
+def test_sync_from_dict(manager):
+    manager.add_model("google/gem-old:free")
+    manager.add_model("openai/gpt-keep:free")
+    manager.add_model("openai/gpt-limit:free")
+
+    diff = manager.sync_from_dict({
+        "openai": [{"model": "gpt-keep", "tag": "free"},
+                   {"model": "gpt-limit", "tag": "free", "rpm": 20, "max_concurrency": 2}],
+        "mistral": [{"model": "mis-new", "tag": "free"}]
+    })
+    assert diff == {"added": 1, "removed": 1, "updated": 1}
+
+    models = manager.get_models()
+    assert "google/gem-old:free" not in models
+    assert "openai/gpt-keep:free" in models
+    assert "mistral/mis-new:free" in models
+    assert manager.get_model_limits("openai/gpt-limit:free") == {"provider": "openai", "rpm": 20, "max_concurrency": 2}
+
+    assert manager.sync_from_dict({
+        "openai": [{"model": "gpt-keep", "tag": "free"},
+                   {"model": "gpt-limit", "tag": "free", "rpm": 20, "max_concurrency": 2}],
+        "mistral": [{"model": "mis-new", "tag": "free"}]
+    }) == {"added": 0, "removed": 0, "updated": 0}
@@ -0,0 +1,14 @@
+from server.managers.model_router import ModelRouter
+from server.utils import circuit_breaker
+
+def test_rank_prefers_fast_reliable_models(monkeypatch):
+    router = ModelRouter(alpha=0.2, default_latency=5.0)
+    stats = {
+        "slow": {"latency": 8.0, "success": 1.0, "samples": 10},
+        "flaky": {"latency": 1.0, "success": 0.1, "samples": 10},
+        "fast": {"latency": 1.0, "success": 1.0, "samples": 10},
+        "new": None,
+    }
+    monkeypatch.setattr(router, "stats", lambda models: stats)
+    monkeypatch.setattr(circuit_breaker.circuit_breaker, "enabled", False)
+    assert router.rank(["slow", "flaky", "fast", "new"]) == ["fast", "new", "slow", "flaky"]
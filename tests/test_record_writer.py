@@ -0,0 +1,13 @@
+from server.database.models import PromptRecord
+from server.database.record_writer import PromptRecordWriter
+
+def test_bad_row_does_not_sink_its_batch(sqlite_app):
+    writer = PromptRecordWriter(sqlite_app)
+    writer.retry_backoff = 0
+    rows = [{"prompt_text": f"p{i}", "completion_text": "r", "model_name": "openai/a:"} for i in range(3)]
+    rows.insert(1, {"prompt_text": "bad", "completion_text": "r", "model_name": None})  # NOT NULL violation
+    for row in rows:
+        writer.submit(row)
+    writer.flush()
+    writer.close()
+    assert PromptRecord.query.count() == 3
@@ -0,0 +1,12 @@
+from server.managers.response_cache import normalize_prompt, prompt_fingerprint
+
+def test_normalize_prompt():
+    assert normalize_prompt("  Hello\n  world\t ") == "Hello world"
+
+def test_fingerprint_ignores_whitespace():
+    assert prompt_fingerprint("Hello  world", "openai/gpt:free") == prompt_fingerprint(" Hello world\n", "openai/gpt:free")
+
+def test_fingerprint_depends_on_model():
+    base = prompt_fingerprint("Hello", "openai/gpt:free")
+    assert base != prompt_fingerprint("Hello", "google/gem:free")
+    assert base != prompt_fingerprint("Hello there", "openai/gpt:free")
@@ -0,0 +1,40 @@
+from datetime import datetime
+from server.database import db
+from server.database.content_store import record_texts, to_records
+from server.database.models import PromptRecord
+from server.database.retention import (archive_expired, archive_month, month_start, next_month, partition_name,
+                                       rehydrate)
+
+def test_next_month_rolls_over_year():
+    assert next_month(datetime(2026, 12, 15)) == datetime(2027, 1, 1)
+    assert next_month(datetime(2026, 1, 31)) == datetime(2026, 2, 1)
+
+def test_partition_name_is_month_of_timestamp():
+    assert partition_name(month_start(datetime(2026, 3, 9, 12, 30))) == "p202603"
+
+def _add(prompt, completion, timestamp):
+    db.session.execute(PromptRecord.__table__.insert(), to_records([{
+        "prompt_text": prompt, "completion_text": completion, "model_name": "openai/a:", "timestamp": timestamp}]))
+    db.session.commit()
+
+def test_zero_retention_keeps_everything(sqlite_app, tmp_path):
+    _add("old", "answer", datetime(2020, 1, 5))
+    assert archive_expired(0, archive_dir=str(tmp_path)) == {}
+    assert PromptRecord.query.count() == 1
+
+def test_archive_then_rehydrate_round_trips(sqlite_app, tmp_path):
+    _add("first prompt", "first answer", datetime(2020, 1, 5))
+    _add("second prompt " * 200, None, datetime(2020, 1, 20))
+    _add("recent", "kept", datetime.utcnow())
+
+    assert archive_month(datetime(2020, 1, 1), archive_dir=str(tmp_path)) == 2
+    assert [r.prompt_length for r in PromptRecord.query.all()] == [len("recent")]
+
+    assert rehydrate("2020-01", archive_dir=str(tmp_path)) == 2
+    restored = PromptRecord.query.filter(PromptRecord.timestamp < datetime(2020, 2, 1)).order_by(PromptRecord.id).all()
+    assert [record_texts(r) for r in restored] == [("first prompt", "first answer"), ("second prompt " * 200, None)]
+    assert rehydrate("2020-01", archive_dir=str(tmp_path)) == 0  # rows still present are skipped
+
+    archived = archive_expired(30, archive_dir=str(tmp_path))
+    assert {month: rows for month, rows in archived.items() if rows} == {"2020-01": 2}
+    assert PromptRecord.query.count() == 1
@@ -0,0 +1,93 @@
+import httpx
+import pytest
+from openai import InternalServerError, RateLimitError
+from server.utils import retry_decorator
+from server.utils.retry_decorator import backoff_delay, retry_after, retry_request
+
+def _error(cls, status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "http://llm"))
+    return cls("boom", response=response, body=None)
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(retry_decorator.time, "sleep", sleeps.append)
+    return sleeps
+
+def test_retry_after_header():
+    assert retry_after(_error(RateLimitError, 429, {"retry-after": "3"})) == 3
+    assert retry_after(_error(RateLimitError, 429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(ValueError("no response")) is None
+
+def test_backoff_delay_honors_hint_and_cap():
+    assert backoff_delay(0, 2, _error(RateLimitError, 429, {"retry-after": "4"}), max_delay=30) == 4
+    assert backoff_delay(0, 2, _error(RateLimitError, 429, {"retry-after": "60"}), max_delay=30) is None
+    assert 0 <= backoff_delay(3, 2, max_delay=5) <= 5
+
+def test_generator_retried_only_before_first_item(no_sleep):
+    calls = []
+
+    @retry_request(retries=3, backoff_factor=2)
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise _error(InternalServerError, 500)
+        yield "a"
+        raise _error(InternalServerError, 500)
+
+    gen = flaky()
+    assert next(gen) == "a"
+    with pytest.raises(InternalServerError):
+        next(gen)
+    assert len(calls) == 2 and len(no_sleep) == 1
+
+def test_circuit_counts_one_failure_per_call(monkeypatch, no_sleep):
+    failures = []
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "before_call", lambda key: None)
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "record_failure", failures.append)
+
+    @retry_request(retries=5, backoff_factor=2, circuit=lambda: "openai/a:")
+    def always_down():
+        raise _error(InternalServerError, 500)
+
+    with pytest.raises(InternalServerError):
+        always_down()
+    assert len(no_sleep) == 4 and failures == ["openai/a:"]
+
+def test_probe_without_verdict_is_released(monkeypatch, no_sleep):
+    from server.utils.rate_limiter import RateLimitExceeded
+
+    released, failures = [], []
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "before_call", lambda key: True)  # half-open probe
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "release_probe", released.append)
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "record_failure", failures.append)
+
+    @retry_request(retries=5, backoff_factor=2, circuit=lambda: "openai/a:")
+    def throttled_locally():
+        raise RateLimitExceeded("openai/a:", 2.0)
+
+    @retry_request(retries=5, backoff_factor=2, circuit=lambda: "openai/a:")
+    def down():
+        raise _error(InternalServerError, 500)
+
+    with pytest.raises(RateLimitExceeded):
+        throttled_locally()
+    with pytest.raises(InternalServerError):
+        down()
+    assert released == ["openai/a:"]
+    # A failed probe is not retried: the circuit re-opens at once
+    assert failures == ["openai/a:"] and no_sleep == []
+
+def test_stream_failing_mid_way_counts_as_circuit_failure(monkeypatch, no_sleep):
+    failures, successes = [], []
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "before_call", lambda key: False)
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "record_failure", failures.append)
+    monkeypatch.setattr(retry_decorator.circuit_breaker, "record_success", successes.append)
+
+    @retry_request(retries=3, backoff_factor=2, circuit=lambda: "openai/a:", stream_error=lambda e: f"error: {e}")
+    def dies_mid_stream():
+        yield "a"
+        raise _error(InternalServerError, 500)
+
+    assert list(dies_mid_stream()) == ["a", "error: boom"]
+    assert failures == ["openai/a:"] and successes == []
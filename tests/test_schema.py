@@ -0,0 +1,26 @@
+import sqlalchemy as sa
+from server.database import db
+from server.database.models import LLMModel
+from server.database.schema import _alter, upgrade_schema
+
+def test_upgrade_adds_model_limit_columns(sqlite_app):
+    # llm_model as created before per-model rate limits
+    db.session.remove()
+    with db.engine.begin() as conn:
+        conn.execute(sa.text("DROP TABLE llm_model"))
+        conn.execute(sa.text("CREATE TABLE llm_model (id INTEGER PRIMARY KEY, full_model VARCHAR(255) NOT NULL UNIQUE, "
+                             "provider VARCHAR(100), model_name VARCHAR(100), tag VARCHAR(50))"))
+        conn.execute(sa.text("INSERT INTO llm_model (full_model, provider, model_name, tag) "
+                             "VALUES ('openai/gpt-old:free', 'openai', 'gpt-old', 'free')"))
+
+    upgrade_schema(db.engine)
+    upgrade_schema(db.engine)  # a second process starting finds nothing to do
+
+    columns = {c["name"] for c in sa.inspect(db.engine).get_columns("llm_model")}
+    assert {"rpm", "max_concurrency"} <= columns
+    model = LLMModel.query.filter_by(full_model="openai/gpt-old:free").one()
+    assert (model.rpm, model.max_concurrency) == (None, None)
+
+def test_alter_already_applied_by_another_process(sqlite_app):
+    statement = "ALTER TABLE llm_model ADD COLUMN rpm INTEGER"
+    assert _alter(db.engine, "llm_model", "rpm", statement) is False
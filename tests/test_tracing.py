@@ -0,0 +1,57 @@
+from server.infrastructure import tracing
+
+def test_parse_traceparent_accepts_w3c_header():
+    ctx = tracing.parse_traceparent("00-" + "ab" * 16 + "-" + "cd" * 8 + "-01")
+    assert (ctx.trace_id, ctx.span_id, ctx.sampled) == ("ab" * 16, "cd" * 8, True)
+    assert ctx.traceparent == "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+
+def test_parse_traceparent_rejects_malformed_and_zero_ids():
+    assert tracing.parse_traceparent(None) is None
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-" + "cd" * 8 + "-01") is None
+
+def test_nested_spans_share_trace_and_propagate():
+    parent = tracing.parse_traceparent("00-" + "ab" * 16 + "-" + "cd" * 8 + "-00")
+    with tracing.span("outer", parent=parent) as outer:
+        with tracing.span("inner") as inner:
+            assert tracing.current_span() is inner
+            headers = {}
+            tracing.inject(headers)
+        tracing.add_event("retry", attempt=1)
+    assert tracing.current_span() is None
+    assert inner.trace_id == outer.trace_id == "ab" * 16
+    assert (outer.parent_id, inner.parent_id) == ("cd" * 8, outer.span_id)
+    assert headers["traceparent"] == inner.traceparent
+    assert [e[0] for e in outer.events] == ["retry"]
+    assert outer.end_ns is not None and outer.to_otlp()["status"] == {"code": tracing.STATUS_OK}
+
+def test_span_closed_from_another_context_still_ends():
+    import contextvars
+
+    def stream():
+        with tracing.span("stream") as s:
+            yield s
+            yield s
+
+    gen = stream()
+    s = contextvars.copy_context().run(next, gen)
+    # Finalized in another context than the one it started in: the reset fails there
+    contextvars.copy_context().run(gen.close)
+    assert s.end_ns is not None
+
+def test_llm_call_span_is_not_current_in_stream_consumer():
+    from server.database.usage_rollup import UsageRollupWriter
+
+    writer = UsageRollupWriter()  # no app: nothing is flushed
+    def reply():
+        with writer.track("openai/a:", stream=True) as call:
+            for chunk in ("a", "b"):
+                call.first_token()
+                yield chunk
+
+    with tracing.span("task") as task:
+        gen = reply()
+        next(gen)
+        assert tracing.current_span() is task
+        gen.close()
+    assert tracing.current_span() is None
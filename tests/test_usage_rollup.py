@@ -0,0 +1,55 @@
+import pytest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from server.database.usage_rollup import (HOUR, UsageRollupWriter, _empty, compact_rollups, day_bucket,
+                                          hour_bucket, query_usage, upsert_rollups)
+
+def test_buckets_truncate_to_hour_and_day():
+    t = datetime(2026, 3, 9, 12, 30, 45, 123)
+    assert hour_bucket(t) == datetime(2026, 3, 9, 12)
+    assert day_bucket(t) == datetime(2026, 3, 9)
+
+def test_track_accumulates_tokens_errors_and_latency():
+    writer = UsageRollupWriter()  # no app: nothing is flushed
+    with writer.track("openai/a:") as call:
+        call.usage = SimpleNamespace(prompt_tokens=12, completion_tokens=30)
+    with pytest.raises(RuntimeError):
+        with writer.track("openai/a:"):
+            raise RuntimeError("upstream down")
+
+    (row,) = writer._pending.values()
+    assert (row["requests"], row["errors"]) == (2, 1)
+    assert (row["prompt_tokens"], row["completion_tokens"]) == (12, 30)
+    assert row["latency_max"] <= row["latency_sum"]
+
+def test_idle_process_flushes_in_the_background(sqlite_app):
+    import time
+    from server.database.models import UsageRollup
+
+    writer = UsageRollupWriter(sqlite_app)
+    writer.flush_interval = 0.05
+    writer.record("openai/a:", 0.2, prompt_tokens=5)
+    for _ in range(100):
+        if UsageRollup.query.count():
+            break
+        time.sleep(0.02)
+    row = UsageRollup.query.one()
+    assert (row.model_name, row.requests, row.prompt_tokens) == ("openai/a:", 1, 5)
+
+def test_compacted_day_counts_when_queried_from_mid_day(sqlite_app):
+    from server.database import db
+
+    day = day_bucket(datetime.utcnow() - timedelta(days=10))
+    rows = []
+    for hour in (3, 15):
+        row = _empty(HOUR, day + timedelta(hours=hour), "openai/a:")
+        row.update(requests=2, prompt_tokens=10, latency_sum=0.4, latency_max=0.3)
+        rows.append(row)
+    upsert_rollups(rows)
+    db.session.commit()
+    assert compact_rollups(hourly_days=1) == 1
+
+    usage = query_usage(day + timedelta(hours=12), day + timedelta(days=1), granularity="hour")
+    assert [(b["bucket"], b["granularity"], b["requests"]) for b in usage["buckets"]] == \
+        [(day.isoformat(), "day", 4)]
+    assert usage["totals"]["openai/a:"]["prompt_tokens"] == 20